@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the breaking of long definitions into lines.
+
+Compares the time of the iterative break_string (formatting.py) and of
+the previous recursive implementation for breaking long enumerating unit
+and combined group definitions (the recursive implementation fails, when
+the number of pieces exceeds the recursion limit). The results of the two
+implementations are compared by tests/test_formatting.py.
+
+Usage:
+  python3 benchmarks/break_string.py [--lengths N,N,...]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from egcwebapp.formatting import break_string
+
+def legacy_break_string(string, goal_length, min_length=None,
+                        breaking_chars=" ,"):
+    """
+    The previous, recursive, implementation of break_string.
+    """
+    if len(string) <= goal_length:
+        return [string]
+    if min_length is None:
+      min_length = int(goal_length * 0.9)
+    if string[goal_length] in breaking_chars:
+        return [string[:goal_length+1]] + legacy_break_string(
+                string[goal_length+1:], goal_length, min_length,
+                breaking_chars)
+    last_break = -1
+    for i in range(min_length, goal_length):
+        if i >= 0 and string[i] in breaking_chars:
+            last_break = i
+    first_break = -1
+    for i in range(goal_length+1, len(string)):
+        if string[i] in breaking_chars:
+            first_break = i
+            break
+    if last_break >= 0:
+        return [string[:last_break+1]] + legacy_break_string(
+                string[last_break+1:], goal_length, min_length,
+                breaking_chars)
+    elif first_break > 0:
+        return [string[:first_break+1]] + legacy_break_string(
+                string[first_break+1:], goal_length, min_length,
+                breaking_chars)
+    else:
+        return [string]
+
+def enumerating_definition(length, rng):
+  parts = []
+  while sum(len(part) + 1 for part in parts) < length:
+    parts.append(f"U{rng.randint(0, 100000)}")
+  return ",".join(parts)
+
+def combined_definition(length, rng):
+  parts = []
+  while sum(len(part) + 3 for part in parts) < length:
+    parts.append(f"G{rng.randint(0, 100000)}")
+  return " + ".join(parts)
+
+def seconds(function):
+  start = time.perf_counter()
+  try:
+    function()
+  except RecursionError:
+    return None
+  return time.perf_counter() - start
+
+def benchmark(lengths, seed=42):
+  rng = random.Random(seed)
+  print(f"{'definition':<12} {'length':>8} {'previous (ms)':>14} "+\
+        f"{'current (ms)':>13}")
+  for length in lengths:
+    # parameters as used for the definitions in context.py
+    for name, definition, args in [
+        ("unit", enumerating_definition(length, rng), (15,)),
+        ("group", combined_definition(length, rng), (12, 8))]:
+      previous = seconds(lambda: legacy_break_string(definition, *args))
+      current = seconds(lambda: break_string(definition, *args))
+      previous = "recursion" if previous is None else f"{previous*1000:.2f}"
+      print(f"{name:<12} {len(definition):>8} {previous:>14} "+\
+            f"{current*1000:>13.2f}")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+  parser.add_argument("--lengths", default="1000,10000,50000,200000",
+                      help="lengths of the benchmarked definitions "+\
+                           "(default: 1000,10000,50000,200000)")
+  args = parser.parse_args()
+  benchmark([int(length) for length in args.lengths.split(",")])
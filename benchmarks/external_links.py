@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the linking of external resources.
+
+Compares the dictionary-based link_external_resource with the previous
+chain of string comparisons, on the resource:item references contained
+in the XD/XR tags of an EGC file (or, if no file is given, on a synthetic
+corpus using all known resources).
+
+Usage:
+  python3 benchmarks/external_links.py [<egcfile>] [--repeat N]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import egcwebapp.external_links as el
+from egcwebapp.references import EXTERNAL_RE
+
+def legacy_link_external_resource(resource, item, text=None):
+  if text is None:
+    text = item
+  url = None
+  if resource == "geonames":
+      url = el.GEONAMES_URL + item
+  elif resource in ["ENVO", "UBERON", "RO", "CHEBI", "OMP", "NCIT", "OHMI"]:
+      url = el.OBO_URL + resource + "_" + item
+  elif resource == "MICRO":
+      url = el.MICRO_URL + item
+  elif resource == "GO":
+      url = el.GO_URL + item
+  elif resource == "Wikipedia":
+      url = el.WIKIPEDIA_URL + item
+  elif resource == "Wiktionary":
+      url = el.WIKTIONARY_URL + item
+  elif resource == "taxid":
+      url = el.TAXID_URL + item
+  elif resource == "pmid" or resource == "PMID":
+      url = el.PMID_URL + item
+  elif resource == "sctid":
+      url = el.SNOMED_URL + item
+  elif resource == "bacdive":
+      url = el.BACDIVE_URL + item
+  elif resource == "interridge":
+      url = el.INTERRIDGE_URL + item
+  elif resource == "doi" or resource == "DOI":
+      url = el.DOI_URL + item
+  elif resource == "http":
+      url = el.HTTP_URL + item
+  elif resource == "https":
+      url = el.HTTPS_URL + item
+  elif resource == 'InterPro':
+    url = el.INTERPRO_URL + item
+  elif resource == 'TC':
+    url = el.TC_URL + item
+  elif resource == 'Pfam':
+    url = el.PFAM_URL + item
+  elif resource == 'Pfam_clan':
+    url = el.PFAM_CLAN_URL + item
+  elif resource == 'CDD':
+    url = el.CDD_URL + item
+  elif resource == 'EC':
+    url = el.EC_URL + item
+  elif resource == 'BRENDA_EC':
+    url = el.BRENDA_EC_URL + item
+  elif resource == 'SO':
+    url = el.SO_URL + item
+  elif resource == 'KEGG':
+    url = el.KEGG_URL + item
+  elif resource == 'COG_category':
+    url = el.COG_CAT_URL + item
+  elif resource == 'COG':
+    url = el.COG_URL + item
+  elif resource == 'arCOG':
+    url = el.ARCOG_URL + item
+  elif resource == 'PROSITE':
+    url = el.PROSITE_URL + item
+  elif resource == 'PIRSF':
+    url = el.PIRSF_URL + item
+  elif resource == 'TIGRFAMs':
+    url = el.TIGRFAMS_URL + item
+  elif resource == 'SFLD':
+    url = el.SFLD_URL + item
+  elif resource == 'SMART':
+    url = el.SMART_URL + item
+  elif resource == 'HAMAP':
+    url = el.HAMAP_URL + item
+  if url:
+    return f"<a href='{url}' target='_blank'>{text}</a>"
+  else:
+    return None
+
+def tag_corpus(egcfile):
+  """
+  (resource, item, text) of the references in the XD/XR tags of a file.
+  """
+  corpus = []
+  with open(egcfile) as f:
+    for line in f:
+      for field in line.rstrip("\n").split("\t"):
+        if field.startswith("XD:") or field.startswith("XR:"):
+          for value_part in field.split(":", 2)[-1].split(";"):
+            m = EXTERNAL_RE.match(value_part)
+            if m:
+              corpus.append((m.group(1), m.group(2), value_part))
+  return corpus
+
+def synthetic_corpus(size=10000, n_items=500, seed=42):
+  rng = random.Random(seed)
+  resources = list(el.EXTERNAL_RESOURCES.keys()) + ["unknown"]
+  corpus = []
+  for i in range(size):
+    resource = rng.choice(resources)
+    item = str(rng.randrange(n_items))
+    corpus.append((resource, item, f"{resource}:{item}"))
+  return corpus
+
+def links_per_second(function, corpus, repeat):
+  start = time.perf_counter()
+  for i in range(repeat):
+    for resource, item, text in corpus:
+      function(resource, item, text)
+  return len(corpus) * repeat / (time.perf_counter() - start)
+
+def main(args):
+  if args.egcfile:
+    corpus = tag_corpus(args.egcfile)
+  else:
+    corpus = synthetic_corpus()
+  for resource, item, text in corpus:
+    assert el.link_external_resource(resource, item, text) == \
+        legacy_link_external_resource(resource, item, text)
+  legacy = links_per_second(legacy_link_external_resource, corpus,
+                            args.repeat)
+  el.link_external_resource.cache_clear()
+  cold = links_per_second(el.link_external_resource.__wrapped__, corpus,
+                          args.repeat)
+  cached = links_per_second(el.link_external_resource, corpus, args.repeat)
+  print(f"references in corpus:            {len(corpus)}")
+  print(f"distinct references:             {len(set(corpus))}")
+  print(f"if/elif chain (links/s):         {legacy:.0f}")
+  print(f"dictionary, no cache (links/s):  {cold:.0f}")
+  print(f"dictionary, LRU cache (links/s): {cached:.0f}")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+  parser.add_argument("egcfile", nargs="?", default=None,
+                      help="EGC file from which the tags are taken")
+  parser.add_argument("--repeat", type=int, default=20,
+                      help="number of passes over the corpus (default: 20)")
+  main(parser.parse_args())
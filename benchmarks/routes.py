@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the routes of the application.
+
+Loads a (synthetic) EGC file and sends requests to each read-only route
+created by create_app (the routes changing the records, uploading files or
+fetching data from external services are not benchmarked), using the Flask
+test client, with record IDs sampled from the records of the kind of the
+route. For each route and record kind, the latency percentiles and the
+peak memory allocated while handling a request are reported.
+
+The results can be stored as a baseline (--save-baseline) and compared
+with a previously stored baseline (--baseline); the exit status is 1
+if the median or 90th percentile latency of any route is slower than
+the baseline by more than the given factor (--max-slowdown).
+
+Usage:
+  python3 benchmarks/routes.py [<egcfile>] [--scale N] [--requests N]
+                               [--baseline FILE] [--save-baseline FILE]
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from flask import url_for
+from egcwebapp.app import create_app
+from egcwebapp.record_kinds import record_kind_info
+from synthetic import write_synthetic_records_file
+
+# endpoints which are not benchmarked: changing the records or the
+# loaded file, or depending on external services
+SKIPPED_ENDPOINTS = {"static", "process_egc_data", "save_egc_file",
+                     "document_metadata", "bulk"}
+SKIPPED_PREFIXES = ["update_", "copy_", "delete_"]
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+class RequestPlan:
+  """
+  Requests to send to each route, with sampled arguments.
+  """
+
+  def __init__(self, app, n_requests, seed=42):
+    self.app = app
+    self.n_requests = n_requests
+    self.rng = random.Random(seed)
+    self.ids = {record_kind: sorted(app.egc_data.record_id(record) \
+        for record_type in info["record_types"] \
+          for record in app.egc_data.find_all(record_type)) \
+      for record_kind, info in record_kind_info.items()}
+
+  def sample(self, values):
+    values = list(values)
+    if not values:
+      return []
+    return [self.rng.choice(values) for i in range(self.n_requests)]
+
+  def referred_ids(self, record_kind, ref_from_kind=None):
+    """
+    IDs of the records of a kind which are referred to
+    (by records of ref_from_kind, if given).
+    """
+    graph = self.app.graph
+    result = []
+    for record_id in self.ids[record_kind]:
+      for ref_by_id in graph.in_edges.get(record_id, []):
+        ref_by_kind = graph.kind_of_type.get(graph.record_types.get(ref_by_id))
+        if ref_from_kind is None or ref_by_kind == ref_from_kind:
+          result.append((record_id, ref_by_id))
+          break
+    return result
+
+  def kind_requests(self, endpoint, record_kind):
+    """
+    (method, url, json) of the requests of an endpoint of a record kind,
+    or None if the endpoint is unknown.
+    """
+    ids = self.ids[record_kind]
+    if endpoint in [f"{record_kind}_list", f"{record_kind}_facets",
+                    f"create_{record_kind}"]:
+      return [("GET", url_for(endpoint), None)] * self.n_requests
+    if endpoint == f"{record_kind}_rows":
+      return [("GET", url_for(endpoint, draw=1, start=start, length=25),
+               None) for start in self.sample(range(0, len(ids) + 1, 25))]
+    if endpoint in [f"show_{record_kind}", f"get_{record_kind}",
+                    f"edit_{record_kind}", f"edit_{record_kind}_api"]:
+      return [("GET", url_for(endpoint, record_id=record_id), None) \
+                for record_id in self.sample(ids)]
+    if endpoint == f"get_{record_kind}_batch":
+      return [("POST", url_for(endpoint),
+               {"ids": [self.rng.choice(ids) for i in range(10)]}) \
+                for i in range(self.n_requests)] if ids else []
+    if endpoint == f"get_ref_{record_kind}":
+      return [("GET", url_for(endpoint, ancestor_ids=ref_by_id,
+                              record_id=record_id), None) \
+                for record_id, ref_by_id in \
+                  self.sample(self.referred_ids(record_kind))]
+    for ref_from_kind in record_kind_info[record_kind]["ref_by_kinds"]:
+      if endpoint == f"get_{record_kind}_{ref_from_kind}s":
+        return [("GET", url_for(endpoint, ancestor_ids=record_id), None) \
+                  for record_id, ref_by_id in \
+                    self.sample(self.referred_ids(record_kind, ref_from_kind))]
+    return None
+
+  def global_requests(self, endpoint):
+    all_ids = [record_id for ids in self.ids.values() for record_id in ids]
+    if endpoint == "search":
+      words = ["protein", "kinase membrane", "U1", "taxid", "transport"]
+      return [("GET", url_for(endpoint, q=query), None) \
+                for query in self.sample(words)]
+    if endpoint == "graph":
+      return [("GET", url_for(endpoint, record_id=record_id, depth=2), None) \
+                for record_id in self.sample(all_ids)]
+    if endpoint == "get_egc_data":
+      return [("GET", url_for(endpoint), None)] * min(self.n_requests, 5)
+    return [("GET", url_for(endpoint), None)] * self.n_requests
+
+  def requests(self):
+    """
+    Requests for each route.
+
+    Returns:
+      list of (endpoint, record kind or None, list of (method, url, json))
+    """
+    result = []
+    with self.app.test_request_context():
+      for rule in sorted(self.app.url_map.iter_rules(),
+                         key=lambda rule: rule.endpoint):
+        endpoint = rule.endpoint
+        if endpoint in SKIPPED_ENDPOINTS or \
+            any(endpoint.startswith(prefix) for prefix in SKIPPED_PREFIXES):
+          continue
+        for record_kind in record_kind_info:
+          requests = self.kind_requests(endpoint, record_kind)
+          if requests is not None:
+            result.append((endpoint, record_kind, requests))
+            break
+        else:
+          if not rule.arguments or endpoint in ["graph"]:
+            result.append((endpoint, None, self.global_requests(endpoint)))
+    return result
+
+def send(client, method, url, json_data):
+  if method == "POST":
+    response = client.post(url, json=json_data)
+  else:
+    response = client.get(url)
+  response.get_data()
+  if response.status_code >= 400:
+    raise RuntimeError(f"{method} {url}: {response.status}")
+
+def run_route(client, requests, n_memory):
+  latencies = []
+  for method, url, json_data in requests:
+    start = time.perf_counter()
+    send(client, method, url, json_data)
+    latencies.append(time.perf_counter() - start)
+  # the memory is measured separately, since tracing slows down
+  # the handling of the requests
+  peak = 0
+  for method, url, json_data in requests[:n_memory]:
+    tracemalloc.start()
+    send(client, method, url, json_data)
+    peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+  return {"n": len(latencies),
+          "p50_ms": percentile(latencies, 50) * 1000,
+          "p90_ms": percentile(latencies, 90) * 1000,
+          "p99_ms": percentile(latencies, 99) * 1000,
+          "max_ms": max(latencies) * 1000,
+          "peak_kb": peak / 1024}
+
+def compare(results, baseline, max_slowdown):
+  """
+  Print the ratios to the baseline.
+
+  Returns:
+    number of routes slower than the baseline by more than max_slowdown
+  """
+  n_regressions = 0
+  print()
+  print(f"{'route':<40} {'p50 ratio':>10} {'p90 ratio':>10}")
+  for key, result in results.items():
+    if key not in baseline:
+      print(f"{key:<40} {'new':>10}")
+      continue
+    ratios = [result[p] / baseline[key][p] if baseline[key][p] else 1.0 \
+                for p in ["p50_ms", "p90_ms"]]
+    regression = any(ratio > max_slowdown for ratio in ratios)
+    n_regressions += regression
+    print(f"{key:<40} {ratios[0]:>10.2f} {ratios[1]:>10.2f}"+\
+          ("  SLOWER" if regression else ""))
+  return n_regressions
+
+def main(args):
+  with tempfile.TemporaryDirectory() as tmpdir:
+    egcfile = args.egcfile
+    if egcfile is None:
+      egcfile = os.path.join(tmpdir, "synthetic.egc")
+      write_synthetic_records_file(egcfile, args.scale)
+    start = time.perf_counter()
+    app = create_app(egcfile)
+    startup = time.perf_counter() - start
+    client = app.test_client()
+    plan = RequestPlan(app, args.requests)
+    results = {}
+    print(f"startup (s): {startup:.3f}")
+    print(f"{'route':<40} {'n':>5} {'p50 ms':>8} {'p90 ms':>8} "+\
+          f"{'p99 ms':>8} {'max ms':>8} {'peak KB':>9}")
+    for endpoint, record_kind, requests in plan.requests():
+      if not requests:
+        continue
+      result = run_route(client, requests, args.memory_requests)
+      key = f"{endpoint} ({record_kind})" if record_kind else endpoint
+      results[key] = result
+      print(f"{key:<40} {result['n']:>5} {result['p50_ms']:>8.2f} "+\
+            f"{result['p90_ms']:>8.2f} {result['p99_ms']:>8.2f} "+\
+            f"{result['max_ms']:>8.2f} {result['peak_kb']:>9.1f}")
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"max RSS (KB): {max_rss}")
+    app.journal.compact()
+  if args.save_baseline:
+    with open(args.save_baseline, "w") as f:
+      json.dump(results, f, indent=2)
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    if compare(results, baseline, args.max_slowdown):
+      sys.exit(1)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+  parser.add_argument("egcfile", nargs="?", default=None,
+                      help="EGC file to load (default: a synthetic file)")
+  parser.add_argument("--scale", type=int, default=200,
+                      help="scale of the synthetic file, see synthetic.py "+\
+                           "(default: 200)")
+  parser.add_argument("--requests", type=int, default=50,
+                      help="number of requests for each route (default: 50)")
+  parser.add_argument("--memory-requests", type=int, default=3,
+                      help="number of requests for each route for measuring "+\
+                           "the memory (default: 3)")
+  parser.add_argument("--baseline", default=None,
+                      help="JSON file of baseline results to compare with")
+  parser.add_argument("--save-baseline", default=None,
+                      help="store the results as baseline in a JSON file")
+  parser.add_argument("--max-slowdown", type=float, default=1.25,
+                      help="ratio to the baseline latency above which "+\
+                           "a route is reported as slower (default: 1.25)")
+  main(parser.parse_args())
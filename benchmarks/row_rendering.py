@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the rendering of datatable rows.
+
+Compares the rows/second of the row renderers (renderers.py) with the
+previous rendering path, in which row.html included column.html for each
+cell, which resolved the column template (checking the filesystem)
+and rebuilt the column context processors every time.
+
+Usage:
+  python3 benchmarks/row_rendering.py [--units N] [--rows N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from jinja2 import DictLoader, ChoiceLoader
+from flask import current_app
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from egcwebapp.app import create_app
+from egcwebapp.record_kinds import record_kind_info
+from egcwebapp.context import common_context_processors, \
+                              column_context_processors
+from synthetic import write_synthetic_file
+
+LEGACY_TEMPLATES = {
+  "legacy_rows.html": """
+    {% for record in records %}
+      {% include 'legacy_row.html' %}
+    {% endfor %}""",
+  "legacy_row.html": """
+    {% set record_id = egc_data.record_id(record) %}
+    {% set record_type=record.record_type %}
+    {% set nested_colspan = info.nested_colspan %}
+    <tr>
+      <td> {% include 'actions_column.html' %} </td>
+      {% for col, collbl in info.table_columns + [("tags", "Tags")] %}
+        <td> {% include 'legacy_column.html' %} </td>
+      {% endfor %}
+      {% if (info.ref_by_kinds | length) > 0 %}
+        <td> {% include 'columns/'+record_kind+'_ref_by.html' %} </td>
+      {% endif %}
+    </tr>""",
+  "legacy_column.html": """
+    {% set coltemplate = column_template(record_kind, col) %}
+    {% set col_cp = column_context_processor(record_kind, col) %}
+    {% if coltemplate %}
+      {% include coltemplate %}
+    {%- elif col_cp -%}
+      {{ col_cp(record) | safe }}
+    {%- else -%}
+      {{ record[col] }}
+    {%- endif -%}""",
+  "rows.html": """
+    {% for record in records %}
+      {% include 'row.html' %}
+    {% endfor %}""",
+}
+
+def legacy_column_template(record_kind, column):
+  record_kind_specific = "columns/" + record_kind + "_" + column + ".html"
+  generic = "columns/record_" + column + ".html"
+  templatesdir = Path(current_app.root_path) / 'templates'
+  if (templatesdir / record_kind_specific).exists():
+    return record_kind_specific
+  elif (templatesdir / generic).exists():
+    return generic
+  else:
+    return None
+
+def legacy_column_context_processor(record_kind, column):
+  procs = column_context_processors()
+  names = [p.__name__ for p in procs.values()]
+  if f"{record_kind}_{column}" in names:
+    return procs[f"{record_kind}_{column}"]
+  elif f"record_{column}" in names:
+    return procs[f"record_{column}"]
+  else:
+    return None
+
+def rows_per_second(template, context, n_rows):
+  start = time.perf_counter()
+  template.render(context)
+  return n_rows / (time.perf_counter() - start)
+
+def main(args):
+  with tempfile.TemporaryDirectory() as tmpdir:
+    egc_file = os.path.join(tmpdir, "synthetic.egc")
+    write_synthetic_file(egc_file, args.units)
+    # the file is loaded as in production, building all indices used
+    # for rendering the rows (references, integrity, ...); it is not
+    # shared with a server using the same instance directory
+    os.environ["EGCWEBAPP_CURRENT_FILE_POINTER"] = ""
+    app = create_app(egc_file)
+    env = app.jinja_env.overlay(loader=ChoiceLoader(\
+        [DictLoader(LEGACY_TEMPLATES), app.jinja_env.loader]))
+    records = app.egc_data.find_all("U")
+    if args.rows:
+      records = records[:args.rows]
+    context = {"records": records, "egc_data": app.egc_data,
+               "record_kind": "unit", "info": record_kind_info["unit"],
+               "main": True, "prev": "unit_list", "ancestor_ids": [],
+               "in_tooltip": False, "mode": app.config["MODE"]}
+    context.update(common_context_processors())
+    context.update(column_context_processors())
+    legacy_context = dict(context,
+        column_template=legacy_column_template,
+        column_context_processor=legacy_column_context_processor)
+    with app.test_request_context():
+      before = rows_per_second(env.get_template("legacy_rows.html"),
+                               legacy_context, len(records))
+      after = rows_per_second(env.get_template("rows.html"),
+                              context, len(records))
+    print(f"units in file:   {args.units}")
+    print(f"rendered rows:   {len(records)}")
+    print(f"before (rows/s): {before:.0f}")
+    print(f"after (rows/s):  {after:.0f}")
+    print(f"speedup:         {after/before:.2f}x")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+  parser.add_argument("--units", type=int, default=50000,
+                      help="number of units in the synthetic file "+\
+                           "(default: 50000)")
+  parser.add_argument("--rows", type=int, default=None,
+                      help="number of rows to render (default: all)")
+  main(parser.parse_args())
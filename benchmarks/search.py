@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the full-text search index.
+
+Measures the time for building the search index of a (synthetic) EGC file
+and the latency of queries of one and two words.
+
+Usage:
+  python3 benchmarks/search.py [<egcfile>] [--units N] [--queries N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from egctools.egcdata import EGCData
+from egcwebapp.record_kinds import record_kind_info
+from egcwebapp.search import SearchIndex
+from synthetic import write_synthetic_file
+
+def main(args):
+  with tempfile.TemporaryDirectory() as tmpdir:
+    egcfile = args.egcfile
+    if egcfile is None:
+      egcfile = os.path.join(tmpdir, "synthetic.egc")
+      write_synthetic_file(egcfile, args.units)
+    egc_data = EGCData.from_file(egcfile)
+  index = SearchIndex(record_kind_info)
+  start = time.perf_counter()
+  index.build(egc_data)
+  build = time.perf_counter() - start
+  rng = random.Random(42)
+  tokens = list(index.postings.keys())
+  queries = [rng.choice(tokens) for i in range(args.queries)] + \
+            [rng.choice(tokens) + " " + rng.choice(tokens) \
+               for i in range(args.queries)]
+  latencies = []
+  for query in queries:
+    start = time.perf_counter()
+    index.search(query)
+    latencies.append(time.perf_counter() - start)
+  latencies.sort()
+  print(f"distinct tokens:        {len(tokens)}")
+  print(f"index build (s):        {build:.3f}")
+  print(f"query median (ms):      {latencies[len(latencies)//2]*1000:.3f}")
+  print(f"query p99 (ms):         "+\
+        f"{latencies[int(len(latencies)*0.99)]*1000:.3f}")
+  print(f"query max (ms):         {latencies[-1]*1000:.3f}")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+  parser.add_argument("egcfile", nargs="?", default=None,
+                      help="EGC file to index (default: a synthetic file)")
+  parser.add_argument("--units", type=int, default=100000,
+                      help="number of unit records in the synthetic file "+\
+                           "(default: 100000)")
+  parser.add_argument("--queries", type=int, default=1000,
+                      help="number of queries of each length (default: 1000)")
+  main(parser.parse_args())
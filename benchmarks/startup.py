@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the loading of an EGC file at startup.
+
+Compares parsing the file (EGCData.from_file) with loading it from
+a snapshot of the parsed records (snapshots.py), including the time for
+computing the key of the file and for writing the snapshot the first time.
+
+Usage:
+  python3 benchmarks/startup.py [<egcfile>] [--units N] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from egctools.egcdata import EGCData
+from egcwebapp.snapshots import load_egc_data, snapshot_path, file_key, \
+                                 snapshot_secret
+from synthetic import write_synthetic_file
+
+def seconds(function, repeat):
+  """
+  Minimum time of repeat calls of function.
+  """
+  times = []
+  for i in range(repeat):
+    start = time.perf_counter()
+    function()
+    times.append(time.perf_counter() - start)
+  return min(times)
+
+def main(args):
+  with tempfile.TemporaryDirectory() as tmpdir:
+    egcfile = args.egcfile
+    if egcfile is None:
+      egcfile = os.path.join(tmpdir, "synthetic.egc")
+      write_synthetic_file(egcfile, args.units)
+    snapshot = snapshot_path(tmpdir, egcfile)
+    secret = snapshot_secret(os.path.join(tmpdir, "snapshot_secret"))
+    parse = seconds(lambda: EGCData.from_file(egcfile), args.repeat)
+    key = seconds(lambda: file_key(egcfile), args.repeat)
+    start = time.perf_counter()
+    load_egc_data(egcfile, tmpdir, secret)
+    first = time.perf_counter() - start
+    snapshot_size = os.path.getsize(snapshot)
+    cached = seconds(lambda: load_egc_data(egcfile, tmpdir, secret), args.repeat)
+    print(f"file size (bytes):                {os.path.getsize(egcfile)}")
+    print(f"snapshot size (bytes):            {snapshot_size}")
+    print(f"parsing (s):                      {parse:.3f}")
+    print(f"file key computation (s):         {key:.3f}")
+    print(f"parsing and writing snapshot (s): {first:.3f}")
+    print(f"loading from snapshot (s):        {cached:.3f}")
+    print(f"speedup:                          {parse / cached:.1f}x")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+  parser.add_argument("egcfile", nargs="?", default=None,
+                      help="EGC file to load (default: a synthetic file)")
+  parser.add_argument("--units", type=int, default=50000,
+                      help="number of unit records in the synthetic file "+\
+                           "(default: 50000)")
+  parser.add_argument("--repeat", type=int, default=3,
+                      help="number of repetitions (default: 3)")
+  main(parser.parse_args())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic EGC files for benchmarking.
+
+By default, a file of simple unit records is generated. Using --scale,
+a file containing all record types is generated instead: documents,
+extracts, units (simple, enumerating sets, homologs, derived), groups
+(taxonomic and combined), models, attributes and V/C rules; the number of
+records of each type is proportional to the scale (see SCALE_FACTORS).
+
+Usage:
+  python3 benchmarks/synthetic.py <outfile> [--units N]
+  python3 benchmarks/synthetic.py <outfile> --scale N [--seed N]
+"""
+
+import argparse
+import random
+
+SYMBOL_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+WORDS = ["membrane", "transport", "kinase", "binding", "protein", "domain",
+         "regulator", "synthase", "reductase", "oxidase", "transferase",
+         "subunit", "putative", "hypothetical", "ribosomal", "flagellar",
+         "secretion", "system", "component", "biosynthesis", "metabolism",
+         "genome", "bacteria", "archaea", "expected", "content", "copy"]
+
+# number of records of each kind for each unit of scale
+SCALE_FACTORS = {"documents": 1, "extracts": 2, "simple_units": 10,
+                 "set_units": 2, "homolog_units": 2, "derived_units": 1,
+                 "groups": 3, "combined_groups": 1, "models": 2,
+                 "attributes": 10, "vrules": 5, "crules": 2}
+
+def synthetic_symbol(rng):
+  return "".join(rng.choice(SYMBOL_LETTERS) for i in range(3)) + \
+         rng.choice(SYMBOL_LETTERS).upper()
+
+def synthetic_units(n_units, seed=42):
+  """
+  Lines of n_units simple specific_gene unit records.
+  """
+  rng = random.Random(seed)
+  for i in range(n_units):
+    symbol = synthetic_symbol(rng)
+    yield "\t".join(["U", f"U{i}", "specific_gene", ".", symbol,
+                     f"synthetic protein {symbol} {i}"])
+
+def write_synthetic_file(path, n_units, seed=42):
+  with open(path, "w") as f:
+    for line in synthetic_units(n_units, seed):
+      f.write(line + "\n")
+
+def _text(rng, n_words):
+  return " ".join(rng.choice(WORDS) for i in range(n_words))
+
+def _unit_type(kind, base_type, enumerating=False, multi=False):
+  return {"kind": kind, "base_type": base_type,
+          "enumerating": enumerating, "multi": multi}
+
+def _document_id(pmid):
+  return {"resource_prefix": "PMID", "item": str(pmid)}
+
+def synthetic_records(scale, seed=42):
+  """
+  Records (dicts, as in the EGCData) of all record types, in an order
+  where the referenced records come before the records referring to them.
+  """
+  rng = random.Random(seed)
+  n = {kind: max(factor * scale, 1) for kind, factor in SCALE_FACTORS.items()}
+  pmids = [10000000 + i for i in range(n["documents"])]
+  for pmid in pmids:
+    yield {"record_type": "D", "document_id": _document_id(pmid),
+           "link": f"https://doi.org/10.1000/synthetic.{pmid}"}
+  extract_ids = []
+  for i in range(n["extracts"]):
+    record = {"record_type": "S" if i % 4 else "T", "id": f"E{i}",
+              "document_id": _document_id(rng.choice(pmids))}
+    if record["record_type"] == "S":
+      record["text"] = _text(rng, 20)
+    else:
+      record["table_ref"] = f"Table {rng.randint(1, 5)}"
+    extract_ids.append(record["id"])
+    yield record
+  simple_ids = []
+  for i in range(n["simple_units"]):
+    symbol = synthetic_symbol(rng)
+    record = {"record_type": "U", "id": f"U{i}",
+              "type": _unit_type("simple", "specific_gene"),
+              "definition": ".", "symbol": symbol,
+              "description": f"{_text(rng, 3)} {symbol}"}
+    if rng.random() < 0.3:
+      record["tags"] = {"XD": {"type": "Z",
+          "value": f"Pfam:PF{rng.randint(1, 20000):05d}"}}
+    simple_ids.append(record["id"])
+    yield record
+  unit_ids = list(simple_ids)
+  for i in range(n["set_units"]):
+    members = rng.sample(simple_ids, min(rng.randint(2, 6), len(simple_ids)))
+    yield {"record_type": "U", "id": f"US{i}",
+           "type": _unit_type("set", "specific_gene", enumerating=True),
+           "definition": ",".join(members), "symbol": ".",
+           "description": f"set of {_text(rng, 2)} genes"}
+    unit_ids.append(f"US{i}")
+  for i in range(n["homolog_units"]):
+    yield {"record_type": "U", "id": f"UH{i}",
+           "type": _unit_type("simple", "gene_homologs"),
+           "definition": f"homolog:{rng.choice(simple_ids)}", "symbol": ".",
+           "description": f"homologs of {_text(rng, 2)}"}
+    unit_ids.append(f"UH{i}")
+  for i in range(n["derived_units"]):
+    yield {"record_type": "U", "id": f"UD{i}",
+           "type": _unit_type("simple", "specific_gene"),
+           "definition": f"derived:{rng.choice(simple_ids)}:truncated",
+           "symbol": ".", "description": f"derived {_text(rng, 2)}"}
+    unit_ids.append(f"UD{i}")
+  group_ids = []
+  for i in range(n["groups"]):
+    yield {"record_type": "G", "id": f"G{i}", "type": "taxonomic",
+           "name": f"{_text(rng, 2)} {i}",
+           "definition": f"taxid:{rng.randint(1, 2000000)}"}
+    group_ids.append(f"G{i}")
+  for i in range(n["combined_groups"]):
+    operands = rng.sample(group_ids, min(2, len(group_ids)))
+    yield {"record_type": "G", "id": f"GC{i}", "type": "combined",
+           "name": f"combined {i}", "definition": " + ".join(operands)}
+    group_ids.append(f"GC{i}")
+  for i in range(n["models"]):
+    yield {"record_type": "M", "unit_id": rng.choice(simple_ids),
+           "resource_id": "Pfam", "model_id": f"PF{i:05d}",
+           "model_name": _text(rng, 2)}
+  attribute_ids = []
+  for i in range(n["attributes"]):
+    record = {"record_type": "A", "id": f"A{i}",
+              "unit_id": rng.choice(unit_ids), "mode": "count"}
+    if rng.random() < 0.2:
+      record["mode"] = {"mode": "relative",
+                        "reference": rng.choice(unit_ids)}
+    attribute_ids.append(record["id"])
+    yield record
+  for i in range(n["vrules"]):
+    yield {"record_type": "V", "id": f"V{i}",
+           "source": rng.choice(extract_ids),
+           "attribute": rng.choice(attribute_ids),
+           "group": {"id": rng.choice(group_ids), "portion": "all"},
+           "operator": rng.choice([">", "=", "<"]),
+           "reference": str(rng.randint(0, 5))}
+  for i in range(n["crules"]):
+    record = {"record_type": "C", "id": f"C{i}",
+              "source": rng.sample(extract_ids, min(2, len(extract_ids))),
+              "attribute": rng.choice(attribute_ids),
+              "group1": {"id": rng.choice(group_ids)},
+              "group2": {"id": rng.choice(group_ids), "portion": "most"},
+              "operator": rng.choice([">", "<"])}
+    if rng.random() < 0.3:
+      record["attribute"] = {"id1": rng.choice(attribute_ids),
+                             "id2": rng.choice(attribute_ids)}
+    yield record
+
+def write_synthetic_records_file(path, scale, seed=42):
+  """
+  Write a file of synthetic records of all types; the records are written
+  by EGCData, so that the lines are in the format expected by the parser.
+  """
+  from egctools.egcdata import EGCData
+  open(path, "w").close()
+  egc_data = EGCData.from_file(path)
+  for record in synthetic_records(scale, seed):
+    egc_data.create(record)
+  egc_data.save()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+  parser.add_argument("outfile", help="output EGC file")
+  parser.add_argument("--units", type=int, default=50000,
+                      help="number of unit records (default: 50000)")
+  parser.add_argument("--scale", type=int, default=None,
+                      help="generate all record types, with scale "+\
+                           "documents (and proportional numbers of "+\
+                           "the other records)")
+  parser.add_argument("--seed", type=int, default=42,
+                      help="random seed (default: 42)")
+  args = parser.parse_args()
+  if args.scale is None:
+    write_synthetic_file(args.outfile, args.units, args.seed)
+  else:
+    write_synthetic_records_file(args.outfile, args.scale, args.seed)
@@ -1,30 +1,275 @@
 from flask import Flask, render_template, request, redirect, jsonify, \
-                  url_for, abort, send_from_directory, flash
+                  url_for, abort, send_from_directory, flash, Response, \
+                  stream_with_context, make_response
+from werkzeug.utils import secure_filename
 import egcwebapp.forms
-from egctools.egcdata import EGCData
 from pathlib import Path
 import os
 import functools
+import hashlib
+import zlib
+from datetime import datetime, timezone
 from egcwebapp.nav import configure_nav
 from egcwebapp.record_kinds import record_kind_info
 from egcwebapp.context import common_context_processors, \
-                              column_context_processors
-
-def create_app():
+                              column_context_processors, DefinitionCache
+from egcwebapp.datatables import parse_request_args, server_side_page
+from egcwebapp.renderers import row_renderers
+from egcwebapp.references import RefByIndex, record_references
+from egcwebapp.fragment_cache import FragmentCache
+from egcwebapp.facets import FacetIndex
+from egcwebapp.column_store import ColumnStore
+from egcwebapp.search import SearchIndex
+from egcwebapp.graph import ReferenceGraph, DIRECTIONS
+from egcwebapp.integrity import IntegrityChecker
+from egcwebapp.instrumentation import Instrumentation
+from egcwebapp.record_lines import RecordLines
+from egcwebapp.bulk import BulkChanges, BulkInputError, apply_changes, \
+                           parse_egc_lines, parse_json_changes
+from egcwebapp.journal import Journal
+from egcwebapp.snapshots import load_egc_data, snapshot_secret
+from egcwebapp.code_version import code_version
+from egcwebapp.transfer import receive_file, file_chunks, FileTooLargeError
+from egcwebapp.external_links import load_external_resources
+from egcwebapp.document_metadata import DocumentMetadata, MetadataCache, \
+                                        HttpFetcher, IDCONV_URL, DOI_URL, \
+                                        document_pmid_and_url
+
+def create_app(egc_file=None):
+  """
+  Create the web application.
+
+  Args:
+    egc_file:  path of an EGC file to load at startup (optional, otherwise
+               the file is loaded from the web interface)
+  """
   app = Flask(__name__)
   configure_nav(app)
   app.egc_data = None
+  app.ref_by_index = RefByIndex()
+  app.definition_cache = DefinitionCache()
+  app.facets = FacetIndex(record_kind_info)
+  app.column_store = ColumnStore(record_kind_info)
+  app.search_index = SearchIndex(record_kind_info)
+  app.graph = ReferenceGraph(record_kind_info)
+  app.integrity = IntegrityChecker(app.graph)
+  app.record_lines = RecordLines()
+  # hash of the application files, part of the ETags and export keys,
+  # so that the cached pages are not used after an upgrade
+  app.code_version = code_version()
+  app.config['FRAGMENT_CACHE_SIZE'] = \
+      int(os.environ.get('EGCWEBAPP_FRAGMENT_CACHE_SIZE') or 64) * 1024 * 1024
+  app.fragment_cache = FragmentCache(app.config['FRAGMENT_CACHE_SIZE'])
+  app.config['INSTRUMENTATION'] = \
+      os.environ.get('EGCWEBAPP_INSTRUMENTATION', '') not in ['', '0']
+  app.instrumentation = None
+  if app.config['INSTRUMENTATION']:
+    # see instrumentation.py
+    app.instrumentation = Instrumentation()
+
+    def cache_gauges():
+      stats = app.fragment_cache.stats()
+      return {f'egcwebapp_fragment_cache_{key}': \
+                (f'Fragment cache {key.replace("_", " ")}', stats[key]) \
+              for key in ['entries', 'bytes', 'hits', 'misses',
+                          'evictions', 'invalidations']}
+
+    app.instrumentation.init_app(app, cache_gauges)
   app.secret_key = 'secret_key'
   app.config['UPLOAD_FOLDER'] = str(Path(app.instance_path) / 'uploads')
+  # maximum size of the uploaded files (also after decompression)
+  # and of the request bodies
+  app.config['MAX_UPLOAD_SIZE'] = \
+      int(os.environ.get('EGCWEBAPP_MAX_UPLOAD_SIZE') or 1024) * 1024 * 1024
+  app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_UPLOAD_SIZE']
+  # the snapshots are unpickled, thus they must not be stored where
+  # clients can write (see snapshots.py)
+  app.config['SNAPSHOT_FOLDER'] = str(Path(app.instance_path) / 'snapshots')
+  app.config['SNAPSHOT_SECRET_FILE'] = \
+      str(Path(app.instance_path) / 'snapshot_secret')
+  app.config['COMPACT_DELAY'] = \
+      float(os.environ.get('EGCWEBAPP_COMPACT_DELAY') or 30)
+  record_types = [record_type for info in record_kind_info.values() \
+                    for record_type in info["record_types"]]
+
+  def load_egc_file_data(file_path):
+    # parsed files are cached as snapshots, see snapshots.py
+    os.makedirs(app.instance_path, exist_ok=True)
+    return load_egc_data(file_path, app.config['SNAPSHOT_FOLDER'],
+                         snapshot_secret(app.config['SNAPSHOT_SECRET_FILE']))
+
+  def set_egc_data(egc_data, replay_journal=False, compact_journal=True,
+                   publish=False):
+    app.journal.open(egc_data, replay=replay_journal,
+                     compact=compact_journal, publish=publish)
+    app.egc_data = egc_data
+    app.ref_by_index.build(egc_data, record_types)
+    app.facets.build(egc_data)
+    app.column_store.build(egc_data)
+    app.search_index.build(egc_data)
+    app.graph.build(egc_data)
+    app.integrity.build(egc_data)
+    app.definition_cache.clear()
+    app.fragment_cache.clear()
+    app.record_lines.reset(egc_data)
+    if app.instrumentation:
+      app.instrumentation.instrument_egc_data(egc_data)
+
+  def reload_egc_data():
+    set_egc_data(load_egc_file_data(app.egc_data.file_path),
+                 replay_journal=True, compact_journal=False)
+
+  def load_shared_egc_file(file_path):
+    # file loaded by another process, see journal.py
+    set_egc_data(load_egc_file_data(file_path),
+                 replay_journal=True, compact_journal=False)
+
+  #
+  # Changes to the records, keeping the indices up to date;
+  # the changes are written to the journal, which is compacted
+  # into the EGC file in the background; the apply_* functions
+  # are also used for the changes written to the journal
+  # by other processes serving the same file
+  #
+
+  def invalidate_fragments(*records):
+    # the cached fragments depend on the rendered records and on the
+    # records they refer to (see fragment_dependencies), thus a change
+    # of a record affects the fragments depending on it or on the
+    # records it refers (or referred) to, whose referenced-by counts change
+    record_ids = set()
+    for record in records:
+      record_ids.add(app.egc_data.record_id(record))
+      record_ids.update(record_references(record, app.egc_data))
+    app.fragment_cache.invalidate(record_ids)
+
+  def apply_create(new_record):
+    app.egc_data.create(new_record)
+    app.ref_by_index.add(new_record)
+    app.facets.add(new_record)
+    app.column_store.add(new_record)
+    app.search_index.add(new_record)
+    app.graph.add(new_record)
+    app.integrity.add(new_record)
+    app.definition_cache.invalidate(app.egc_data.record_id(new_record))
+    app.record_lines.invalidate(app.egc_data.record_id(new_record))
+    invalidate_fragments(new_record)
+
+  def apply_update(record_id, updated_data):
+    old_record = app.egc_data.find(record_id)
+    app.ref_by_index.remove(old_record)
+    app.facets.remove(old_record)
+    app.search_index.remove(old_record)
+    app.graph.remove(old_record)
+    app.integrity.remove(old_record)
+    invalidate_fragments(old_record)
+    app.egc_data.update(record_id, updated_data)
+    app.ref_by_index.add(updated_data)
+    app.facets.add(updated_data)
+    app.column_store.update(record_id, old_record, updated_data)
+    app.search_index.add(updated_data)
+    app.graph.add(updated_data)
+    app.integrity.add(updated_data)
+    app.definition_cache.invalidate(record_id)
+    app.definition_cache.invalidate(app.egc_data.record_id(updated_data))
+    app.record_lines.invalidate(record_id)
+    app.record_lines.invalidate(app.egc_data.record_id(updated_data))
+    invalidate_fragments(updated_data)
+
+  def apply_delete(record_id):
+    old_record = app.egc_data.find(record_id)
+    app.ref_by_index.remove(old_record)
+    app.facets.remove(old_record)
+    app.column_store.remove(old_record)
+    app.search_index.remove(old_record)
+    app.graph.remove(old_record)
+    app.integrity.remove(old_record)
+    app.definition_cache.invalidate(record_id)
+    app.record_lines.invalidate(record_id)
+    invalidate_fragments(old_record)
+    app.egc_data.delete(record_id)
+
+  def apply_change(change):
+    if change["op"] == "create":
+      apply_create(change["record"])
+    elif change["op"] == "update":
+      apply_update(change["id"], change["record"])
+    elif change["op"] == "delete":
+      apply_delete(change["id"])
+
+  def create_record(new_record):
+    with app.journal.changing():
+      apply_create(new_record)
+      app.journal.log_create(new_record)
+
+  def update_record(record_id, updated_data):
+    with app.journal.changing():
+      apply_update(record_id, updated_data)
+      app.journal.log_update(record_id, updated_data)
+
+  def delete_record(record_id):
+    with app.journal.changing():
+      apply_delete(record_id)
+      app.journal.log_delete(record_id)
+
+  def apply_bulk_changes(changes):
+    # all changes are applied and written to the journal at once;
+    # if applying one fails, the records are loaded again from the
+    # file and journal, i.e. as they were before the changes
+    with app.journal.changing():
+      # the cycles are searched once, after all changes
+      with app.integrity.cycles_deferred():
+        apply_changes(changes, apply_change, reload_egc_data)
+      app.journal.log_changes(changes)
+
+  app.config['MODE'] = os.environ.get('EGCWEBAPP_MODE') or 'rw'
+  # file containing the path of the file served by all processes
+  # (see journal.py); an empty value disables sharing it
+  app.config['CURRENT_FILE_POINTER'] = os.environ.get(
+      'EGCWEBAPP_CURRENT_FILE_POINTER',
+      str(Path(app.instance_path) / 'current_egc_file'))
+  app.journal = Journal(app.config['COMPACT_DELAY'],
+                        apply_change=apply_change, reload=reload_egc_data,
+                        load=load_shared_egc_file,
+                        pointer_path=app.config['CURRENT_FILE_POINTER'],
+                        read_only=app.config['MODE'] != 'rw')
+
   if os.environ.get('EGCWEBAPP') == 'development':
     app.debug = True
     this_dir = Path(__file__).parent
-    app.egc_data = EGCData.from_file(str(this_dir.parent / "development.egc"))
-  app.config['MODE'] = os.environ.get('EGCWEBAPP_MODE') or 'rw'
+    egc_file = egc_file or str(this_dir.parent / "development.egc")
+  # the indices classify the references using the external resources,
+  # thus these must be loaded first
+  if os.environ.get('EGCWEBAPP_EXTERNAL_RESOURCES'):
+    load_external_resources(os.environ['EGCWEBAPP_EXTERNAL_RESOURCES'])
+  if egc_file:
+    set_egc_data(load_egc_file_data(egc_file), replay_journal=True,
+                 compact_journal=app.config['MODE'] == 'rw', publish=True)
+  # pages rendered for a static export of the site, see export.py
+  app.config['STATIC_EXPORT'] = \
+      os.environ.get('EGCWEBAPP_STATIC_EXPORT', '') not in ['', '0']
+  app.config['SERVER_SIDE_THRESHOLD'] = \
+      int(os.environ.get('EGCWEBAPP_SERVER_SIDE_THRESHOLD') or 5000)
+  app.config['GRAPH_MAX_DEPTH'] = 10
+  # maximal limit parameter of the search and facets api routes
+  app.config['MAX_LIMIT'] = 10000
+  app.config['GRAPH_MAX_NODES'] = \
+      int(os.environ.get('EGCWEBAPP_GRAPH_MAX_NODES') or 1000)
+  app.config['DOCUMENT_METADATA_DB'] = \
+      str(Path(app.instance_path) / 'document_metadata.sqlite')
+  app.config['DOCUMENT_METADATA_TTL'] = \
+      float(os.environ.get('EGCWEBAPP_DOCUMENT_METADATA_TTL') or 30*24*3600)
+  os.makedirs(app.instance_path, exist_ok=True)
+  app.document_metadata = DocumentMetadata(
+      MetadataCache(app.config['DOCUMENT_METADATA_DB']),
+      HttpFetcher(os.environ.get('EGCWEBAPP_IDCONV_URL') or IDCONV_URL,
+                  os.environ.get('EGCWEBAPP_DOI_URL') or DOI_URL),
+      ttl=app.config['DOCUMENT_METADATA_TTL'])
 
   @app.context_processor
   def inject_mode():
-      return dict(mode=app.config["MODE"])
+      return dict(mode=app.config["MODE"],
+                  static_export=app.config["STATIC_EXPORT"])
 
   @app.template_filter()
   def basename(path):
@@ -33,17 +278,15 @@ def create_app():
   app.context_processor(common_context_processors)
   app.context_processor(column_context_processors)
 
-  def column_context_processor(record_kind, column):
-    procs = column_context_processors()
-    names = [p.__name__ for p in procs.values()]
-    if f"{record_kind}_{column}" in names:
-      return procs[f"{record_kind}_{column}"]
-    elif f"record_{column}" in names:
-      return procs[f"record_{column}"]
-    else:
-      return None
-  app.jinja_env.globals.update(\
-      column_context_processor=column_context_processor)
+  app.jinja_env.globals.update(ref_by_index=app.ref_by_index)
+  app.jinja_env.globals.update(integrity=app.integrity)
+  app.row_renderers = row_renderers(app)
+  app.jinja_env.globals.update(row_renderers=app.row_renderers)
+
+  @app.before_request
+  def sync_journal():
+    # apply the changes done by other processes serving the same file
+    app.journal.sync()
 
   @app.route('/')
   def index():
@@ -53,9 +296,12 @@ def create_app():
   def load_egc_file():
       if request.method == 'POST':
           file = request.files['file']
-          file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
+          filename = secure_filename(file.filename or '')
+          if not filename:
+              abort(400)
+          file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
           file.save(file_path)
-          app.egc_data = EGCData.from_file(file_path)
+          set_egc_data(load_egc_file_data(file_path), publish=True)
           return redirect(url_for('document_list'))
       return render_template('load_egc_file.html')
 
@@ -68,10 +314,51 @@ def create_app():
               return func(*args, **kwargs)
       return wrapper
 
+  def conditional_get(func):
+      """
+      Answer conditional requests (If-None-Match, If-Modified-Since)
+      with 304 without rendering, if the records were not changed.
+
+      The ETag is derived from the route, its arguments, the version
+      of the application code and the version of the records (which is
+      the same in all processes).
+      """
+      @functools.wraps(func)
+      def wrapper(*args, **kwargs):
+          key = (request.endpoint, sorted(request.view_args.items()),
+                 request.query_string, app.config['MODE'],
+                 app.code_version, app.journal.version())
+          etag = hashlib.sha1(repr(key).encode()).hexdigest()
+          last_modified = app.journal.last_modified()
+          if last_modified is not None:
+              last_modified = datetime.fromtimestamp(int(last_modified),
+                                                     timezone.utc)
+          if request.if_none_match:
+              not_modified = request.if_none_match.contains(etag)
+          else:
+              # the Last-Modified time is truncated to seconds, thus
+              # records changed again in the same second would not be
+              # detected, unless the time is strictly older
+              not_modified = last_modified is not None and \
+                  request.if_modified_since is not None and \
+                  last_modified < request.if_modified_since
+          if not_modified:
+              response = app.response_class(status=304)
+          else:
+              response = make_response(func(*args, **kwargs))
+          response.set_etag(etag)
+          if last_modified is not None:
+              response.last_modified = last_modified
+          # the responses can be stored, but must be revalidated
+          response.cache_control.no_cache = True
+          return response
+      return wrapper
+
   if app.config["MODE"] == "rw":
     @app.route('/save_egc_file')
     @require_egc_data
     def save_egc_file():
+        app.journal.compact()
         return send_from_directory(
             app.config['UPLOAD_FOLDER'],
             os.path.basename(app.egc_data.file_path),
@@ -79,19 +366,38 @@ def create_app():
 
   @app.route('/process_egc_data', methods=['POST'])
   def process_egc_data():
-      data = request.get_json()
-      file_path = os.path.join(app.config['UPLOAD_FOLDER'], data['filename'])
-      with open(file_path, 'w') as f:
-          f.write(data['contents'])
-      app.egc_data = EGCData.from_file(file_path)
+      # the file contents are the (optionally gzip-compressed) request body,
+      # which is streamed to the disk
+      filename = secure_filename(request.args.get('filename', ''))
+      if not filename:
+          abort(400)
+      file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+      gzipped = request.headers.get('Content-Encoding') == 'gzip'
+      try:
+          receive_file(request.stream, file_path, gzipped=gzipped,
+                       max_size=app.config['MAX_UPLOAD_SIZE'])
+      except FileTooLargeError:
+          abort(413)
+      except (ValueError, zlib.error):
+          abort(400)
+      set_egc_data(load_egc_file_data(file_path), publish=True)
       return 'OK', 200
 
   @app.route('/get_egc_data/')
+  @require_egc_data
   def get_egc_data():
-      with open(app.egc_data.file_path) as f:
-          contents = f.read()
-      filename = os.path.basename(app.egc_data.file_path)
-      return jsonify({'contents': contents, 'filename': filename})
+      if app.config['MODE'] == 'rw':
+          app.journal.compact()
+      gzipped = 'gzip' in request.accept_encodings
+      response = Response(stream_with_context(\
+          file_chunks(app.egc_data.file_path, gzipped=gzipped)),
+          mimetype='application/egc')
+      if gzipped:
+          response.headers['Content-Encoding'] = 'gzip'
+      response.headers['Content-Disposition'] = \
+          'attachment; filename="' + \
+          secure_filename(os.path.basename(app.egc_data.file_path)) + '"'
+      return response
 
   record_kinds = list(record_kind_info.keys())
 
@@ -107,18 +413,60 @@ def create_app():
   # Additionally api routes are defined for each type of record
   #
 
+  def find_all_of_kind(record_kind):
+    records = []
+    for record_type in record_kind_info[record_kind]["record_types"]:
+      records.extend(app.egc_data.find_all(record_type))
+    return records
+
   def list_route(record_kind):
     def route_function():
-      records = []
-      for record_type in record_kind_info[record_kind]["record_types"]:
-        records.extend(app.egc_data.find_all(record_type))
+      records = find_all_of_kind(record_kind)
+      # large tables are loaded page by page from the rows api route
+      server_side = len(records) > app.config['SERVER_SIDE_THRESHOLD']
       return render_template('list.html',
-              **{"records": records, 'egc_data': app.egc_data,
+              **{"records": [] if server_side else records,
+                 'egc_data': app.egc_data,
                  'record_kind': record_kind,
+                 'server_side': server_side,
                  'info': record_kind_info[record_kind]})
 
     route_function.__name__ = f"{record_kind}_list"
     route_function = app.route(f"/{record_kind}s",
+        methods=["GET"])(require_egc_data(conditional_get(route_function)))
+    return route_function
+
+  def rows_api_route(record_kind):
+    def route_function():
+      # the store replaces a table when compacting it, thus the
+      # same table is used for the whole request
+      table = app.column_store.tables[record_kind]
+      params = parse_request_args(request.args)
+      page_ids, n_filtered = server_side_page(table, params)
+      page_records = [app.egc_data.find(record_id) for record_id in page_ids]
+      return jsonify({'draw': params['draw'],
+                      'recordsTotal': len(table),
+                      'recordsFiltered': n_filtered,
+                      'data': [app.row_renderers[record_kind].render_cells(
+                                   record, app.egc_data, main=True,
+                                   prev=f'{record_kind}_list',
+                                   ancestor_ids=[]) \
+                                 for record in page_records]})
+
+    route_function.__name__ = f"{record_kind}_rows"
+    route_function = app.route(f"/api/{record_kind}s/rows",
+        methods=["GET"])(require_egc_data(route_function))
+    return route_function
+
+  def facets_api_route(record_kind):
+    def route_function():
+      limit = request.args.get('limit', 100, type=int)
+      if limit < 0 or limit > app.config['MAX_LIMIT']:
+          abort(400)
+      return jsonify({'columns': app.facets.facets(record_kind, limit)})
+
+    route_function.__name__ = f"{record_kind}_facets"
+    route_function = app.route(f"/api/{record_kind}s/facets",
         methods=["GET"])(require_egc_data(route_function))
     return route_function
 
@@ -132,8 +480,7 @@ def create_app():
           form.auto_generate_id()
         if request.method == "POST" and form.validate():
             new_record = form.to_record()
-            app.egc_data.create(new_record)
-            app.egc_data.save()
+            create_record(new_record)
             return redirect(url_for(prev))
         title_label = record_kind_info[record_kind]["title"]
         return render_template("record_form.html", form=form,
@@ -158,8 +505,7 @@ def create_app():
                           egc_data=app.egc_data, old_id=record_id)
         if request.method == 'POST' and form.validate():
             updated_data = form.to_record()
-            app.egc_data.update(record_id, updated_data)
-            app.egc_data.save()
+            update_record(record_id, updated_data)
             return redirect(url_for(prev))
         title_label = record_kind_info[record_kind]["title"]
         return render_template('record_form.html', form=form,
@@ -202,14 +548,11 @@ def create_app():
           form.auto_generate_id()
         if form.validate():
             updated_data = form.to_record()
-            app.egc_data.update(record_id, updated_data)
-            app.egc_data.save()
+            update_record(record_id, updated_data)
             updated_row_html = render_template("row.html",
                     record=updated_data, record_kind=record_kind,
                     info=record_kind_info[record_kind],
                     egc_data=app.egc_data)
-            updated_row_html += render_template("jslinks.html",
-                    record_kind=record_kind, info=record_kind_info[record_kind])
             return jsonify({'success': True, 'html': updated_row_html})
         else:
             form_html = render_template('nested_record_form.html', form=form,
@@ -232,14 +575,11 @@ def create_app():
           form.auto_generate_id()
         if form.validate():
             new_record = form.to_record()
-            app.egc_data.create(new_record)
-            app.egc_data.save()
+            create_record(new_record)
             new_row_html = render_template("row.html",
                     record=new_record, record_kind=record_kind,
                     info=record_kind_info[record_kind],
                     egc_data=app.egc_data)
-            new_row_html += render_template("jslinks.html",
-                    record_kind=record_kind, info=record_kind_info[record_kind])
             return jsonify({'success': True, 'html': new_row_html})
         else:
             record = app.egc_data.find(record_id) or abort(404)
@@ -260,12 +600,13 @@ def create_app():
   def delete_record_route(record_kind):
     def route_function(record_id):
       previous_page = request.args.get('previous_page') or record_kind + '_list'
+      # the index is used for displaying the rows; the deletion is
+      # checked by egctools itself
       if app.egc_data.is_ref_by(record_id):
         flash(f"Cannot delete {record_id} "+\
                "because it is referenced by other records")
         return redirect(url_for(previous_page))
-      app.egc_data.delete(record_id)
-      app.egc_data.save()
+      delete_record(record_id)
       return redirect(url_for(previous_page))
 
     route_function.__name__ = f'delete_{record_kind}'
@@ -284,36 +625,76 @@ def create_app():
 
     route_function.__name__ = f'show_{record_kind}'
     route_function = app.route(f'/{record_kind}s/<record_id>', \
-        methods=['GET'])(require_egc_data(route_function))
+        methods=['GET'])(require_egc_data(conditional_get(route_function)))
     return route_function
 
+  def record_table(record_kind, record_id, record):
+    # table of a record, shown in its tooltips
+    def render():
+      html = render_template('table.html',
+          **{'record': record, 'egc_data': app.egc_data,
+             'record_kind': record_kind, 'record_id': record_id,
+             'info': record_kind_info[record_kind],
+            })
+      return html, fragment_dependencies([record])
+
+    return app.fragment_cache.get_or_render(
+        ('table', record_kind, record_id), render)
+
   def get_record_route(record_kind):
     def route_function(record_id):
         record = app.egc_data.find(record_id) or abort(404)
-        return render_template('table.html',
-            **{'record': record, 'egc_data': app.egc_data,
-               'record_kind': record_kind, 'record_id': record_id,
-               'info': record_kind_info[record_kind],
-              })
+        return record_table(record_kind, record_id, record)
 
     route_function.__name__ = f'get_{record_kind}'
     route_function = app.route(f'/api/{record_kind}s/<record_id>', \
-        methods=['GET'])(require_egc_data(route_function))
+        methods=['GET'])(require_egc_data(conditional_get(route_function)))
     return route_function
 
+  def get_records_batch_route(record_kind):
+    def route_function():
+        record_ids = (request.get_json(silent=True) or {}).get('ids', [])
+        tables = {}
+        for record_id in record_ids:
+          record = app.egc_data.find(record_id)
+          if record is None:
+            continue
+          tables[record_id] = record_table(record_kind, record_id, record)
+        return jsonify(tables)
+
+    route_function.__name__ = f'get_{record_kind}_batch'
+    route_function = app.route(f'/api/{record_kind}s/batch', \
+        methods=['POST'])(require_egc_data(route_function))
+    return route_function
+
+  def fragment_dependencies(records):
+    # IDs of the records on which the rendering of the rows
+    # of the given records depends
+    record_ids = set()
+    for record in records:
+      record_ids.add(app.egc_data.record_id(record))
+      record_ids.update(record_references(record, app.egc_data))
+    return record_ids
+
   def get_ref_route(record_kind):
       def route_function(ancestor_ids, record_id):
           record = app.egc_data.find(record_id) or abort(404)
-          return render_template('datatable.html',
-              **{"records": [record], 'egc_data': app.egc_data,
-                 'record_kind': record_kind,
-                 'info': record_kind_info[record_kind],
-                 'ancestor_ids': ancestor_ids.split(',')})
+
+          def render():
+            html = render_template('datatable.html',
+                **{"records": [record], 'egc_data': app.egc_data,
+                   'record_kind': record_kind,
+                   'info': record_kind_info[record_kind],
+                   'ancestor_ids': ancestor_ids.split(',')})
+            return html, fragment_dependencies([record])
+
+          return app.fragment_cache.get_or_render(
+              ('ref', record_kind, record_id, ancestor_ids), render)
 
       route_function.__name__ = f'get_ref_{record_kind}'
       route_function = app.route(\
           f'/api/ref/<ancestor_ids>/{record_kind}s/<record_id>',
-          methods=['GET'])(require_egc_data(route_function))
+          methods=['GET'])(require_egc_data(conditional_get(route_function)))
       return route_function
 
   def get_refby_route(ref_by_kind, ref_from_kind):
@@ -321,26 +702,73 @@ def create_app():
       ref_by_id = ancestor_ids.split(',')[-1]
       ref_by_record = app.egc_data.find(ref_by_id) or abort(404)
       ref_by_rt = ref_by_record['record_type']
-      ref_from_records = []
-      for ref_from_rt in record_kind_info[ref_from_kind]["record_types"]:
-        ref_from_records.extend(\
-            app.egc_data.ref_by(ref_by_rt, ref_by_id, ref_from_rt))
-      return render_template('datatable.html',
-          **{"records": ref_from_records, 'egc_data': app.egc_data,
-             'record_kind': ref_from_kind,
-             'info': record_kind_info[ref_from_kind],
-             'ancestor_ids': ancestor_ids.split(',')})
+
+      def render():
+        ref_from_records = []
+        for ref_from_rt in record_kind_info[ref_from_kind]["record_types"]:
+          ref_from_records.extend(\
+              app.egc_data.ref_by(ref_by_rt, ref_by_id, ref_from_rt))
+        html = render_template('datatable.html',
+            **{"records": ref_from_records, 'egc_data': app.egc_data,
+               'record_kind': ref_from_kind,
+               'info': record_kind_info[ref_from_kind],
+               'ancestor_ids': ancestor_ids.split(',')})
+        # the list changes when a record referring to ref_by_id changes,
+        # which invalidates the entries depending on ref_by_id
+        return html, fragment_dependencies(ref_from_records) | {ref_by_id}
+
+      return app.fragment_cache.get_or_render(
+          ('refby', ref_by_kind, ref_from_kind, ancestor_ids), render)
 
     route_function.__name__ = f'get_{ref_by_kind}_{ref_from_kind}s'
     route_function = \
       app.route(f'/api/{ref_by_kind}s/<ancestor_ids>/{ref_from_kind}s', \
-        methods=['GET'])(require_egc_data(route_function))
+        methods=['GET'])(require_egc_data(conditional_get(route_function)))
     return route_function
 
+  if app.config["MODE"] == "rw":
+    @app.route('/api/bulk', methods=['POST'])
+    @require_egc_data
+    def bulk():
+        # the body is read from the stream, not loaded in memory at once;
+        # with one JSON per line, each change is parsed when validated
+        try:
+          if request.mimetype == 'application/json':
+            changes = parse_json_changes(request.stream)
+          elif request.mimetype == 'application/x-ndjson':
+            changes = parse_json_changes(request.stream, lines=True)
+          else:
+            changes = parse_egc_lines(request.stream)
+        except BulkInputError as err:
+          return jsonify({'success': False, 'error': str(err)}), 400
+        with app.journal.changing():
+          try:
+            validated, errors = \
+                BulkChanges(app.egc_data).validate_all(changes)
+          except BulkInputError as err:
+            return jsonify({'success': False, 'error': str(err)}), 400
+          if errors:
+            return jsonify({'success': False, 'errors': errors}), 422
+          apply_bulk_changes(validated)
+        counts = {op: 0 for op in ['create', 'update', 'delete']}
+        for change in validated:
+          counts[change['op']] += 1
+        return jsonify({'success': True, 'n_changes': len(validated),
+                        'n_created': counts['create'],
+                        'n_updated': counts['update'],
+                        'n_deleted': counts['delete']})
+
+  @app.route('/api/cache_stats', methods=['GET'])
+  def cache_stats():
+      return jsonify({'fragments': app.fragment_cache.stats()})
+
   for record_kind in record_kinds:
       list_route(record_kind)
+      rows_api_route(record_kind)
+      facets_api_route(record_kind)
       show_record_route(record_kind)
       get_record_route(record_kind)
+      get_records_batch_route(record_kind)
       get_ref_route(record_kind)
       if app.config["MODE"] == "rw":
         create_route(record_kind)
@@ -352,6 +780,66 @@ def create_app():
       for ref_from_kind in record_kind_info[record_kind]["ref_by_kinds"]:
           get_refby_route(record_kind, ref_from_kind)
 
+  def record_line(record_id):
+      line = app.record_lines.get(record_id)
+      if line is None:
+          abort(404)
+      return jsonify({'id': record_id, 'line': line})
+
+  app.route('/api/records/<record_id>/line', methods=['GET'])(
+      require_egc_data(conditional_get(record_line)))
+
+  @app.route('/api/search', methods=['GET'])
+  @require_egc_data
+  def search():
+      query = request.args.get('q', '')
+      limit = request.args.get('limit', 20, type=int)
+      if limit < 1 or limit > app.config['MAX_LIMIT']:
+          abort(400)
+      results = []
+      for record_kind, n_results, record_ids in \
+          app.search_index.search(query, limit):
+        results.append({'record_kind': record_kind,
+            'title': record_kind_info[record_kind]['title'],
+            'n_results': n_results,
+            'records': [{'id': record_id,
+                         'url': url_for('show_'+record_kind,
+                                        record_id=record_id)} \
+                          for record_id in record_ids]})
+      return jsonify({'query': query, 'results': results})
+
+  @app.route('/api/graph/<record_id>', methods=['GET'])
+  @require_egc_data
+  def graph(record_id):
+      if record_id not in app.graph:
+          abort(404)
+      depth = request.args.get('depth', 1, type=int)
+      direction = request.args.get('direction', 'both')
+      if depth < 0 or depth > app.config['GRAPH_MAX_DEPTH'] or \
+          direction not in DIRECTIONS:
+          abort(400)
+      nodes, edges, truncated = app.graph.neighbourhood(record_id, depth,
+          direction, app.config['GRAPH_MAX_NODES'])
+      return jsonify({'id': record_id, 'depth': depth,
+                      'direction': direction, 'nodes': nodes,
+                      'edges': edges, 'truncated': truncated})
+
+  @app.route('/api/integrity', methods=['GET'])
+  @require_egc_data
+  def integrity():
+      return jsonify(app.integrity.report())
+
+  @app.route('/api/documents/<record_id>/metadata', methods=['GET'])
+  @require_egc_data
+  def document_metadata(record_id):
+      record = app.egc_data.find(record_id)
+      if record is None or record['record_type'] != 'D':
+          abort(404)
+      data, error = app.document_metadata.get(*document_pmid_and_url(record))
+      if data is None:
+          return jsonify({'error': error}), 502
+      return jsonify(data)
+
   return app
 
 if __name__ == '__main__':
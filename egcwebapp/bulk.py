@@ -0,0 +1,293 @@
+#
+# Bulk changes of the records (import of many records, bulk edit).
+#
+# The changes are given either as EGC lines (each line is a record to be
+# created) or as JSON: a list (or an object with a "changes" list, or one
+# object per line) of changes in the same form as in the journal, i.e.
+# dicts with keys op (create, update or delete), id (for update and delete)
+# and record (for create and update); a record alone is a create change.
+#
+# All changes are validated with the forms used for editing single records,
+# against the records as they will be after the previous changes; they are
+# applied only if all of them are valid. The input is read from the request
+# stream, so that large imports are not kept in memory as a whole.
+#
+
+import os
+import json
+import shutil
+import tempfile
+import egcwebapp.forms
+from wtforms import validators
+from egctools.egcdata import EGCData
+from egcwebapp.record_kinds import record_kind_info
+from egcwebapp.references import record_references
+
+OPS = ["create", "update", "delete"]
+
+kind_of_type = {record_type: record_kind \
+    for record_kind, info in record_kind_info.items() \
+      for record_type in info["record_types"]}
+
+class BulkInputError(Exception):
+  pass
+
+def _parse_egc_file(path):
+  egc_data = EGCData.from_file(path)
+  return [record for record_type in kind_of_type \
+            for record in egc_data.find_all(record_type)]
+
+def _parse_egc_line(line):
+  with tempfile.NamedTemporaryFile("wb", suffix=".egc", delete=False) as f:
+    f.write(line)
+  try:
+    _parse_egc_file(f.name)
+  finally:
+    os.remove(f.name)
+
+def parse_egc_lines(stream):
+  """
+  Records of the EGC lines read from a binary stream, as create changes.
+
+  The lines are copied to a temporary file, without keeping them in memory,
+  and parsed all at once; if this fails, they are parsed one by one, for
+  reporting the invalid lines.
+  """
+  with tempfile.NamedTemporaryFile("wb", suffix=".egc", delete=False) as f:
+    shutil.copyfileobj(stream, f)
+  try:
+    try:
+      records = _parse_egc_file(f.name)
+    except Exception:
+      errors = []
+      with open(f.name, "rb") as lines:
+        for line_number, line in enumerate(lines, 1):
+          if not line.strip() or line.startswith(b"#"):
+            continue
+          try:
+            _parse_egc_line(line.rstrip(b"\r\n") + b"\n")
+          except Exception as err:
+            errors.append(f"line {line_number}: {err}")
+      raise BulkInputError("; ".join(errors) or "Invalid EGC lines")
+  finally:
+    os.remove(f.name)
+  return [{"op": "create", "record": record} for record in records]
+
+def _as_change(change):
+  # a record alone is a create change
+  if isinstance(change, dict) and "record_type" in change:
+    return {"op": "create", "record": change}
+  return change
+
+def _json_line_changes(stream):
+  for line_number, line in enumerate(stream, 1):
+    if not line.strip():
+      continue
+    try:
+      yield _as_change(json.loads(line))
+    except (json.JSONDecodeError, UnicodeDecodeError) as err:
+      raise BulkInputError(f"Invalid JSON at line {line_number}: {err}") \
+          from err
+
+def parse_json_changes(stream, lines=False):
+  """
+  Changes read from a binary stream, given as a JSON list, as a JSON object
+  with a list of changes under the key "changes", or (if lines is True) as
+  one JSON per line.
+
+  With one JSON per line, the changes are returned as an iterator, which
+  reads and parses each line when it is reached (and raises BulkInputError
+  if it is invalid), so that the input is never kept in memory as a whole.
+  """
+  if lines:
+    return _json_line_changes(stream)
+  try:
+    changes = json.load(stream)
+  except (json.JSONDecodeError, UnicodeDecodeError) as err:
+    raise BulkInputError(f"Invalid JSON: {err}") from err
+  if isinstance(changes, dict):
+    changes = changes.get("changes")
+  if not isinstance(changes, list):
+    raise BulkInputError("A list of changes is expected")
+  return [_as_change(change) for change in changes]
+
+class PendingEGCData:
+  """
+  The records of an EGCData, as they will be after the changes validated
+  so far; the other methods are delegated to the EGCData.
+  """
+
+  def __init__(self, egc_data):
+    self.egc_data = egc_data
+    self.created = {}
+    self.deleted = set()
+
+  def __getattr__(self, name):
+    return getattr(self.egc_data, name)
+
+  def id_exists(self, record_id):
+    if record_id in self.created:
+      return True
+    return record_id not in self.deleted and \
+        self.egc_data.id_exists(record_id)
+
+  def find(self, record_id):
+    if record_id in self.created:
+      return self.created[record_id]
+    if record_id in self.deleted:
+      return None
+    return self.egc_data.find(record_id)
+
+  def create(self, record):
+    record_id = self.egc_data.record_id(record)
+    self.created[record_id] = record
+    self.deleted.discard(record_id)
+
+  def delete(self, record_id):
+    self.created.pop(record_id, None)
+    self.deleted.add(record_id)
+
+  def update(self, record_id, record):
+    self.delete(record_id)
+    self.create(record)
+
+def apply_changes(changes, apply_change, rollback):
+  """
+  Apply all changes, calling apply_change(change) for each of them;
+  if one fails, rollback() is called, for restoring the records as they
+  were before the changes, and the exception is raised again.
+  """
+  try:
+    for change in changes:
+      apply_change(change)
+  except Exception:
+    rollback()
+    raise
+
+class BulkChanges:
+  """
+  Validation of a list of changes to the records.
+
+  Args:
+    egc_data:   the EGCData
+  """
+
+  def __init__(self, egc_data):
+    self.egc_data = egc_data
+    self.pending = PendingEGCData(egc_data)
+    # references of the records created or updated by the changes
+    self.new_references = {}
+
+  def _form(self, record, old_id=None):
+    record_kind = kind_of_type.get(record.get("record_type"))
+    if record_kind is None:
+      raise validators.ValidationError("Unknown record type")
+    form_class = getattr(egcwebapp.forms, f"{record_kind.capitalize()}Form")
+    form = form_class.from_record(None, record, egc_data=self.pending,
+                                  old_id=old_id)
+    if hasattr(form, 'auto_generate_id'):
+      form.auto_generate_id()
+    return form
+
+  def _validated_record(self, record, old_id=None):
+    if not isinstance(record, dict):
+      raise validators.ValidationError("A record must be a JSON object")
+    try:
+      form = self._form(record, old_id)
+    except (KeyError, TypeError, ValueError) as err:
+      raise validators.ValidationError(f"Invalid record: {err}") from err
+    if not form.validate():
+      return None, form.errors
+    new_record = form.to_record()
+    new_id = self.egc_data.record_id(new_record)
+    if new_id != old_id and self.pending.id_exists(new_id):
+      raise validators.ValidationError("Record ID already exists")
+    return new_record, None
+
+  def _existing_referrers(self, record_id):
+    # IDs of the records of the file referring to a record,
+    # as resolved by egctools
+    record = self.egc_data.find(record_id)
+    if record is None or not self.egc_data.is_ref_by(record_id):
+      return []
+    record_kind = kind_of_type[record["record_type"]]
+    return [self.egc_data.record_id(ref_by_record) \
+              for ref_by_kind in record_kind_info[record_kind]["ref_by_kinds"]
+                for ref_by_rt in record_kind_info[ref_by_kind]["record_types"]
+                  for ref_by_record in self.egc_data.ref_by(
+                      record["record_type"], record_id, ref_by_rt)]
+
+  def _is_referenced(self, record_id):
+    for ref_by_id in self._existing_referrers(record_id):
+      # the records deleted by the previous changes do not refer to it
+      # anymore; the references of the changed records are in
+      # new_references
+      if ref_by_id not in self.pending.deleted and \
+          ref_by_id not in self.new_references:
+        return True
+    return any(record_id in references \
+                 for references in self.new_references.values())
+
+  def _track(self, record_id, record):
+    self.new_references.pop(record_id, None)
+    if record is not None:
+      new_id = self.egc_data.record_id(record)
+      self.new_references[new_id] = \
+          set(record_references(record, self.egc_data))
+
+  def validate(self, change):
+    """
+    Validate a change and record its effect on the pending records.
+
+    Returns:
+      (change with the validated record, errors dict or None)
+    """
+    if not isinstance(change, dict) or change.get("op") not in OPS:
+      return None, {"op": [f"Must be one of: {', '.join(OPS)}"]}
+    op = change["op"]
+    record_id = change.get("id")
+    if op != "create" and not self.pending.id_exists(record_id):
+      return None, {"id": ["Record does not exist"]}
+    try:
+      if op == "delete":
+        if self._is_referenced(record_id):
+          return None, {"id": ["Record is referenced by other records"]}
+        self.pending.delete(record_id)
+        self._track(record_id, None)
+        return {"op": op, "id": record_id}, None
+      record, errors = self._validated_record(change.get("record"),
+          record_id if op == "update" else None)
+    except validators.ValidationError as err:
+      return None, {"record": [str(err)]}
+    if errors:
+      return None, errors
+    if op == "create":
+      self.pending.create(record)
+      self._track(None, record)
+      return {"op": op, "record": record}, None
+    self.pending.update(record_id, record)
+    self._track(record_id, record)
+    return {"op": op, "id": record_id, "record": record}, None
+
+  def validate_all(self, changes):
+    """
+    Validate a list (or iterator) of changes.
+
+    Returns:
+      (validated changes, list of dicts (index, id, errors) for each
+       invalid change)
+    """
+    validated = []
+    errors = []
+    for i, change in enumerate(changes):
+      validated_change, change_errors = self.validate(change)
+      if change_errors:
+        record = change.get("record") if isinstance(change, dict) else None
+        record_id = change.get("id") if isinstance(change, dict) else None
+        if record_id is None and isinstance(record, dict):
+          record_id = record.get("id")
+        errors.append({"index": i, "id": record_id,
+                       "errors": change_errors})
+      else:
+        validated.append(validated_change)
+    return validated, errors
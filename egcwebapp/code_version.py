@@ -0,0 +1,26 @@
+#
+# Version of the application code, used in the keys of cached pages
+# (ETags, static export), so that they are not reused after an upgrade.
+#
+
+import hashlib
+import functools
+from pathlib import Path
+
+# files on which the rendering depends (not e.g. the images)
+CODE_SUFFIXES = [".py", ".html", ".js", ".mjs", ".css"]
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+  """
+  Hash of the code, templates and static code files of the application,
+  computed once per process.
+  """
+  sha1 = hashlib.sha1()
+  package_dir = Path(__file__).parent
+  for path in sorted(package_dir.rglob("*")):
+    if path.suffix in CODE_SUFFIXES and path.is_file() and \
+        "__pycache__" not in path.parts:
+      sha1.update(str(path.relative_to(package_dir)).encode())
+      sha1.update(path.read_bytes())
+  return sha1.hexdigest()
@@ -0,0 +1,284 @@
+#
+# Columnar projection of the records, used for the server-side
+# processing of the datatables (see datatables.py).
+#
+# For each record kind, the plain-text values of the table columns (see
+# column_values.py) are stored in a flat list per column, so that filtering
+# and sorting do not walk the nested record dicts on each request. The
+# values of the columns of low cardinality (see CODED_COLUMNS) are stored
+# as integer codes of a table of the distinct values of the column.
+#
+# The store is built in a single pass over all records, when a file is
+# loaded, and updated when records are changed. Only the IDs of the records
+# are stored, not the records. The rows of the removed records are dropped
+# from the (sorted) array of the live rows, which is used by the requests
+# without scanning the table; the columns of a record kind are compacted
+# when most of their rows are removed.
+#
+
+from array import array
+from bisect import bisect_left
+from egcwebapp.column_values import column_values
+from egcwebapp.datatables import table_columns
+
+# columns with few distinct values, stored as codes
+CODED_COLUMNS = {"record_type", "kind", "base_type", "resource",
+                 "enumerating", "multi", "mode", "location_type", "type",
+                 "resource_id", "portion", "group_portion",
+                 "group1_portion", "group2_portion", "operator"}
+
+# a table is compacted when the removed rows are more than this
+# fraction of its rows
+COMPACT_FRACTION = 0.5
+
+class TextColumn:
+  """
+  Column of plain-text values.
+  """
+
+  def __init__(self):
+    self.values = []
+
+  def append(self, value):
+    self.values.append(value)
+
+  def __getitem__(self, row):
+    return self.values[row]
+
+  def __setitem__(self, row, value):
+    self.values[row] = value
+
+  def matching(self, rows, matches):
+    values = self.values
+    return [row for row in rows if matches(values[row])]
+
+  def sort_key(self):
+    values = self.values
+    return lambda row: values[row].lower()
+
+class CodedColumn:
+  """
+  Column of values of low cardinality, stored as codes of the distinct
+  values; the matching and sorting are computed once for each distinct
+  value.
+  """
+
+  def __init__(self):
+    self.distinct = []
+    self.code_of = {}
+    self.codes = array("I")
+
+  def code(self, value):
+    code = self.code_of.get(value)
+    if code is None:
+      code = len(self.distinct)
+      self.distinct.append(value)
+      self.code_of[value] = code
+    return code
+
+  def append(self, value):
+    self.codes.append(self.code(value))
+
+  def __getitem__(self, row):
+    return self.distinct[self.codes[row]]
+
+  def __setitem__(self, row, value):
+    self.codes[row] = self.code(value)
+
+  def matching(self, rows, matches):
+    matching_codes = {code for code, value in enumerate(self.distinct) \
+                        if matches(value)}
+    codes = self.codes
+    return [row for row in rows if codes[row] in matching_codes]
+
+  def sort_key(self):
+    # values differing only by case have the same rank
+    lowered = sorted({value.lower() for value in self.distinct})
+    rank_of = {value: rank for rank, value in enumerate(lowered)}
+    ranks = [rank_of[value.lower()] for value in self.distinct]
+    codes = self.codes
+    return lambda row: ranks[codes[row]]
+
+class KindTable:
+  """
+  Columns of the records of a record kind.
+
+  The records themselves are not stored, only their IDs, by which they
+  are retrieved from the EGCData for rendering the rows of a page.
+
+  Args:
+    columns:  keys of the datatable columns (see table_columns);
+              None for those which are not stored
+  """
+
+  def __init__(self, columns):
+    self.columns = columns
+    self.keys = [column for column in columns if column is not None]
+    # datatable column index -> stored column (or None)
+    self.by_index = []
+    self.stored = []
+    for column in columns:
+      if column is None:
+        self.by_index.append(None)
+      else:
+        stored = CodedColumn() if column in CODED_COLUMNS else TextColumn()
+        self.stored.append(stored)
+        self.by_index.append(stored)
+    # row -> record ID, record ID -> row; the further rows of IDs defined
+    # by multiple records (see integrity.py) are kept apart, as they are rare
+    self.ids = []
+    self.row_of = {}
+    self.extra_rows = {}
+    # rows of the records which were not removed, in increasing order
+    self.live = array("I")
+
+  def __len__(self):
+    return len(self.live)
+
+  def live_rows(self):
+    """
+    Copy of the live rows, which is not affected by later changes.
+    """
+    return self.live[:]
+
+  def column(self, index):
+    """
+    Stored column of a datatable column index, or None.
+    """
+    if 0 <= index < len(self.by_index):
+      return self.by_index[index]
+    return None
+
+  def row_text(self, row):
+    return " ".join(stored[row] for stored in self.stored)
+
+  def append(self, record_id, values):
+    row = len(self.ids)
+    self.ids.append(record_id)
+    for stored, value in zip(self.stored, values):
+      stored.append(value)
+    self._link(record_id, row)
+    self.live.append(row)
+
+  def find_row(self, record_id):
+    """
+    Row of the record with the given ID (the first one, if there are
+    multiple records with the ID), or None.
+    """
+    return self.row_of.get(record_id)
+
+  def set(self, row, record_id, values):
+    if self.ids[row] != record_id:
+      self._unlink(self.ids[row], row)
+      self._link(record_id, row)
+      self.ids[row] = record_id
+    for stored, value in zip(self.stored, values):
+      stored[row] = value
+
+  def remove(self, row):
+    self._unlink(self.ids[row], row)
+    del self.live[bisect_left(self.live, row)]
+
+  def _link(self, record_id, row):
+    if record_id in self.row_of:
+      self.extra_rows.setdefault(record_id, []).append(row)
+    else:
+      self.row_of[record_id] = row
+
+  def _unlink(self, record_id, row):
+    if self.row_of.get(record_id) == row:
+      extra = self.extra_rows.get(record_id)
+      if extra:
+        self.row_of[record_id] = extra.pop(0)
+        if not extra:
+          del self.extra_rows[record_id]
+      else:
+        del self.row_of[record_id]
+    else:
+      extra = self.extra_rows[record_id]
+      extra.remove(row)
+      if not extra:
+        del self.extra_rows[record_id]
+
+  def needs_compaction(self):
+    return len(self.ids) - len(self.live) > len(self.ids) * COMPACT_FRACTION
+
+class ColumnStore:
+  """
+  Columnar projection of the records of each record kind.
+
+  Args:
+    record_kind_info:   the record_kind_info dictionary
+  """
+
+  def __init__(self, record_kind_info):
+    self.kind_of_type = {record_type: record_kind \
+        for record_kind, info in record_kind_info.items() \
+          for record_type in info["record_types"]}
+    self.columns = {record_kind: table_columns(info) \
+        for record_kind, info in record_kind_info.items()}
+    self.egc_data = None
+    self.tables = {}
+    self.clear()
+
+  def clear(self):
+    self.tables = {record_kind: KindTable(columns) \
+                     for record_kind, columns in self.columns.items()}
+
+  def build(self, egc_data):
+    self.egc_data = egc_data
+    self.clear()
+    for record_type in self.kind_of_type:
+      for record in egc_data.find_all(record_type):
+        self.add(record)
+
+  def _values(self, record_kind, record):
+    return column_values(record, record_kind, self.tables[record_kind].keys,
+                         self.egc_data)
+
+  def add(self, record):
+    record_kind = self.kind_of_type[record["record_type"]]
+    self.tables[record_kind].append(self.egc_data.record_id(record),
+        self._values(record_kind, record))
+
+  def update(self, record_id, old_record, record):
+    """
+    Replace the values of a record, keeping its position in the table.
+    """
+    old_kind = self.kind_of_type[old_record["record_type"]]
+    record_kind = self.kind_of_type[record["record_type"]]
+    table = self.tables[old_kind]
+    row = table.find_row(record_id)
+    if row is None or old_kind != record_kind:
+      if row is not None:
+        self._remove_row(old_kind, row)
+      self.add(record)
+      return
+    table.set(row, self.egc_data.record_id(record),
+              self._values(record_kind, record))
+
+  def remove(self, record):
+    record_kind = self.kind_of_type[record["record_type"]]
+    record_id = self.egc_data.record_id(record)
+    row = self.tables[record_kind].find_row(record_id)
+    if row is not None:
+      self._remove_row(record_kind, row)
+
+  def _remove_row(self, record_kind, row):
+    table = self.tables[record_kind]
+    table.remove(row)
+    if table.needs_compaction():
+      self.compact(record_kind)
+
+  def compact(self, record_kind):
+    """
+    Rebuild the table of a record kind without the removed rows; the new
+    table replaces the old one at once, so that a request using the old
+    table is not affected.
+    """
+    table = KindTable(self.columns[record_kind])
+    old_table = self.tables[record_kind]
+    for row in old_table.live_rows():
+      table.append(old_table.ids[row],
+                   [stored[row] for stored in old_table.stored])
+    self.tables[record_kind] = table
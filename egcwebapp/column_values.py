@@ -0,0 +1,102 @@
+#
+# Plain-text values of the table columns of each record kind.
+#
+# These are used where the rendered HTML of a column cannot be used,
+# i.e. for searching and sorting the records on the server side.
+#
+
+def _sources(source):
+  if isinstance(source, str):
+    return source
+  return " ".join(source)
+
+def _attributes(attribute):
+  if isinstance(attribute, str):
+    return attribute
+  return attribute["id1"] + " vs. " + attribute["id2"]
+
+def _mode_part(record, key):
+  mode = record["mode"]
+  if isinstance(mode, dict) and mode.get("mode"):
+    return mode.get(key) or ""
+  return ""
+
+def _attribute_mode(record):
+  mode = record["mode"]
+  if isinstance(mode, dict):
+    return mode.get("mode") or ""
+  return mode
+
+def _portion(group):
+  return group.get("portion") or ""
+
+def _extract_document(record):
+  return "PMID:" + record["document_id"]["item"]
+
+def _extract_content(record):
+  if record["record_type"] == "S":
+    return record["text"]
+  else:
+    return record["table_ref"]
+
+column_value_functions = {
+  "document_pmid": lambda r: r["document_id"]["item"],
+  "extract_document": _extract_document,
+  "extract_content": _extract_content,
+  "unit_kind": lambda r: r["type"]["kind"],
+  "unit_base_type": lambda r: r["type"]["base_type"],
+  "unit_resource": lambda r: r["type"].get("resource") or "",
+  "unit_enumerating": lambda r: r["type"]["enumerating"],
+  "unit_multi": lambda r: r["type"]["multi"],
+  "attribute_unit": lambda r: r["unit_id"],
+  "attribute_mode": _attribute_mode,
+  "attribute_reference": lambda r: _mode_part(r, "reference"),
+  "attribute_location_type": lambda r: _mode_part(r, "location_type"),
+  "attribute_location_label": lambda r: _mode_part(r, "location_label"),
+  "model_unit": lambda r: r["unit_id"],
+  "vrule_source": lambda r: _sources(r["source"]),
+  "vrule_attribute": lambda r: r["attribute"],
+  "vrule_group": lambda r: r["group"]["id"],
+  "vrule_group_portion": lambda r: _portion(r["group"]),
+  "crule_source": lambda r: _sources(r["source"]),
+  "crule_attribute": lambda r: _attributes(r["attribute"]),
+  "crule_group1": lambda r: r["group1"]["id"],
+  "crule_group1_portion": lambda r: _portion(r["group1"]),
+  "crule_group2": lambda r: r["group2"]["id"],
+  "crule_group2_portion": lambda r: _portion(r["group2"]),
+}
+
+def tags_value(record):
+  """
+  Text of the tags and comment of a record, as shown in the Tags column.
+  """
+  parts = []
+  for tag_name, tag_type_value in (record.get("tags") or {}).items():
+    parts.append(f"{tag_name}:{tag_type_value['type']}:"+\
+                 f"{tag_type_value['value']}")
+  if record.get("comment"):
+    parts.append("# " + record["comment"])
+  return " ".join(parts)
+
+def column_value(record, record_kind, column, egc_data):
+  """
+  Plain-text value of a column of a record, as a string.
+  """
+  if column == "id":
+    value = egc_data.record_id(record)
+  elif column == "tags":
+    value = tags_value(record)
+  elif f"{record_kind}_{column}" in column_value_functions:
+    value = column_value_functions[f"{record_kind}_{column}"](record)
+  else:
+    value = record.get(column, "")
+  if value is None:
+    return ""
+  return str(value)
+
+def column_values(record, record_kind, columns, egc_data):
+  """
+  Plain-text values of the given columns of a record, as a list of strings.
+  """
+  return [column_value(record, record_kind, column, egc_data) \
+            for column in columns]
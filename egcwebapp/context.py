@@ -1,25 +1,19 @@
 import urllib.parse
 import re
+import threading
 from pathlib import Path
+from collections import OrderedDict, defaultdict, Counter
 from flask import render_template, current_app
-from egcwebapp.formatting import break_string
+from egcwebapp.formatting import iter_break_string
 from egcwebapp.external_links import link_external_resource, \
                                      link_uniprotkb_query
+from egcwebapp.references import IDENTIFIER_RE, FULL_IDENTIFIER_RE, \
+                                 DERIVED_RE, HOMOLOG_RE, EXTERNAL_RE, \
+                                 CATEGORY_BASE_TYPES, CATEGORY_RESOURCES
 
 
 def common_context_processors():
 
-    def column_template(record_kind, column):
-      record_kind_specific = "columns/" + record_kind + "_" + column + ".html"
-      generic = "columns/record_" + column + ".html"
-      templatesdir = Path(current_app.root_path) / 'templates'
-      if (templatesdir / record_kind_specific).exists():
-        return record_kind_specific
-      elif (templatesdir / generic).exists():
-        return generic
-      else:
-        return None
-
     def tooltip_js(record_kind):
       record_kind_specific = f"js/{record_kind}_tooltips.mjs"
       staticdir = Path(current_app.root_path) / "static"
@@ -29,17 +23,239 @@ def common_context_processors():
         return None
 
     return {
-            'column_template': column_template,
             'tooltip_js': tooltip_js
            }
 
+REF_UNIT_RE = re.compile(r"^ref:(.+):(.*)$")
+
+class DefinitionCache:
+  """
+  Least recently used cache of the rendered group and unit definitions.
+
+  The entries are keyed by (record id, type, definition, in_tooltip,
+  ancestor ids). For each entry, the IDs of the records linked in the
+  definition are remembered, so that the entries can be invalidated
+  when the record itself or any of the linked records changes.
+
+  The cache is shared by the threads serving the requests, thus
+  it is accessed under a lock.
+  """
+
+  def __init__(self, maxsize=100000):
+    self.maxsize = maxsize
+    # key -> (html, IDs of the linked records)
+    self.entries = OrderedDict()
+    self.keys_by_record = defaultdict(set)
+    # linked record ID -> record ID -> number of entries linking it;
+    # updated when entries are evicted or invalidated
+    self.records_by_ref = defaultdict(Counter)
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      self.entries.move_to_end(key)
+      return entry[0]
+
+  def put(self, key, references, html):
+    record_id = key[0]
+    references = set(references)
+    with self.lock:
+      if key in self.entries:
+        self._remove_entry(key)
+      self.entries[key] = (html, references)
+      self.keys_by_record[record_id].add(key)
+      for ref_id in references:
+        self.records_by_ref[ref_id][record_id] += 1
+      while len(self.entries) > self.maxsize:
+        self._remove_entry(next(iter(self.entries)))
+
+  def _remove_entry(self, key):
+    record_id = key[0]
+    html, references = self.entries.pop(key)
+    keys = self.keys_by_record.get(record_id)
+    if keys is not None:
+      keys.discard(key)
+      if not keys:
+        del self.keys_by_record[record_id]
+    for ref_id in references:
+      linking = self.records_by_ref.get(ref_id)
+      if linking is None:
+        continue
+      linking[record_id] -= 1
+      if linking[record_id] <= 0:
+        del linking[record_id]
+      if not linking:
+        del self.records_by_ref[ref_id]
+
+  def _forget_record(self, record_id):
+    for key in list(self.keys_by_record.get(record_id, ())):
+      self._remove_entry(key)
+
+  def invalidate(self, record_id):
+    """
+    Remove the entries of a record and of the records linking to it.
+    """
+    with self.lock:
+      self._forget_record(record_id)
+      for linking_id in list(self.records_by_ref.get(record_id, ())):
+        self._forget_record(linking_id)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.keys_by_record.clear()
+      self.records_by_ref.clear()
+
+def cached_definition(render_function, record, type_key,
+                      in_tooltip, ancestor_ids):
+  cache = current_app.definition_cache
+  key = (record['id'], type_key, record['definition'], bool(in_tooltip),
+         tuple(ancestor_ids) if ancestor_ids else ())
+  html = cache.get(key)
+  if html is None:
+    html, references = render_function(record, in_tooltip, ancestor_ids)
+    cache.put(key, references, html)
+  return html
+
+def link_related_ids(definition, related_ids, render_link, links):
+  """
+  Replace the related ids in a definition with links, in a single pass.
+
+  The links are rendered using render_link(related_id), unless already
+  contained in the dictionary links (related_id -> link).
+  """
+  if not related_ids:
+    return definition
+  for related_id in related_ids:
+    if related_id not in links:
+      links[related_id] = render_link(related_id)
+  pattern = re.compile(r'\b(' + "|".join(re.escape(related_id) \
+                                  for related_id in related_ids) + r')\b')
+  return pattern.sub(lambda m: links[m.group(1)], definition)
+
+def render_group_definition(record, in_tooltip, ancestor_ids):
+    """
+    Render a group definition, linking the related groups.
+
+    Returns:
+      (html, related_ids)
+    """
+    group_id = record['id']
+    group_type = record['type']
+    definition = record['definition']
+    m = EXTERNAL_RE.match(definition)
+    if m:
+      link = link_external_resource(m.group(1), m.group(2), definition)
+      if link:
+        return link, []
+
+    def render_link(rel_group):
+      return render_template('refs_link.html',
+          in_tooltip=in_tooltip,
+          record_kind='group', record_id=group_id,
+          related_kind='group', related_id=rel_group,
+          ancestor_ids=ancestor_ids, prev='list_group',
+          egc_data=current_app.egc_data)
+
+    links = {}
+    output = []
+    for definition in iter_break_string(definition, 12, 8):
+      rel_groups = []
+      if group_type == 'combined' or group_type == 'inverted':
+          rel_groups = IDENTIFIER_RE.findall(definition)
+      else:
+          m = DERIVED_RE.match(definition)
+          if m:
+              rel_groups = [m.group(1)]
+      definition = link_related_ids(definition, list(dict.fromkeys(rel_groups)),
+                                    render_link, links)
+      output.append('<span class="related_link">' + definition + '</span>')
+
+    return "<br/>".join(output), list(links.keys())
+
+def render_unit_definition(record, in_tooltip, ancestor_ids):
+    """
+    Render a unit definition, linking the related units.
+
+    Returns:
+      (html, related_ids)
+    """
+    unit_id = record['id']
+    base_type = record['type']['base_type']
+    kind = record['type']['kind']
+    resource = record['type'].get('resource', None)
+    enumerating = record['type']['enumerating']
+    multi = record['type']['multi']
+    definition = record['definition']
+    if definition == ".":
+      return definition, []
+    if kind == "category":
+      if base_type in CATEGORY_BASE_TYPES and resource in CATEGORY_RESOURCES:
+        return link_external_resource(resource, definition), []
+    elif not enumerating:
+      if base_type in ['feature_type', 'amino_acid'] \
+          and definition.startswith('SO:'):
+        return link_external_resource('SO', definition[3:], definition), []
+      elif base_type == 'metabolic_pathway' \
+          and definition.startswith('KEGG:'):
+        return link_external_resource('KEGG', definition[5:], definition), []
+    m = REF_UNIT_RE.match(definition)
+    if m:
+      return "ref:" + link_external_resource(m.group(1), m.group(2),
+          definition[4:]), []
+    if not enumerating and multi:
+      output_parts = []
+      related_ids = []
+      for part in definition.split(","):
+        part_html, part_related_ids = render_unit_definition({'id': unit_id,
+            'type': {"base_type": base_type, "multi": False,
+                     "kind": "simple", "enumerating": False},
+            "definition": part}, in_tooltip, ancestor_ids)
+        output_parts.append(part_html)
+        related_ids.extend(part_related_ids)
+      return ",".join(output_parts), list(dict.fromkeys(related_ids))
+
+    def render_link(rel_unit):
+      return render_template('refs_link.html',
+          in_tooltip=in_tooltip,
+          record_kind='unit', record_id=unit_id,
+          related_kind='unit', related_id=rel_unit, prev='list_unit',
+          noclass=True, ancestor_ids=ancestor_ids,
+          egc_data=current_app.egc_data)
+
+    links = {}
+    output = []
+    for definition in iter_break_string(definition, 15):
+      rel_units = []
+      if base_type.endswith('_homologs'):
+          m = HOMOLOG_RE.match(definition)
+          if m:
+              rel_units = [m.group(1)]
+      elif base_type == 'arrangement' and enumerating:
+          rel_units = [part for part in definition.split(',') \
+                         if FULL_IDENTIFIER_RE.match(part)]
+      elif enumerating:
+        rel_units = IDENTIFIER_RE.findall(definition)
+      elif definition.startswith('derived:'):
+          m = DERIVED_RE.match(definition)
+          if m:
+            rel_units = [m.group(1)]
+      definition = link_related_ids(definition, list(dict.fromkeys(rel_units)),
+                                    render_link, links)
+      output.append('<span class="related_link">' + definition + '</span>')
+
+    return "<br/>".join(output), list(links.keys())
+
 def column_context_processors():
 
     def linked_tag_value(tag_type, tag_value):
       if tag_type in ["XD", "XR"]:
         linked = []
         for value_part in tag_value.split(";"):
-          m = re.match(r"^(.+):([^!#]+)([!#].*)?$", value_part)
+          m = EXTERNAL_RE.match(value_part)
           link = None
           if m:
             resource = m.group(1)
@@ -85,116 +301,13 @@ def column_context_processors():
         return description
 
     def group_definition(record, in_tooltip, ancestor_ids):
-        group_id = record['id']
-        group_type = record['type']
-        definition = record['definition']
-        m = re.match(r"^(.+):([^!#]+)([!#].*)?$", definition)
-        if m:
-          definition_prefix = m.group(1)
-          definition_id = m.group(2)
-          link = link_external_resource(definition_prefix,
-                                        definition_id,
-                                        definition)
-          if link:
-            return link
-        rel_groups = []
-        definition_pieces = break_string(definition, 12, 8)
-        output = []
-        for definition in definition_pieces:
-          if group_type == 'combined' or group_type == 'inverted':
-              rel_groups = re.findall(r"[a-zA-Z0-9_]+", definition)
-          else:
-              m = re.match(r'^derived:([a-zA-Z0-9_]+):.*', definition)
-              if m:
-                  rel_groups = [m.group(1)]
-
-          for rel_group in rel_groups:
-              rendered_template = render_template('refs_link.html',
-                  in_tooltip=in_tooltip,
-                  record_kind='group', record_id=group_id,
-                  related_kind='group', related_id=rel_group,
-                  ancestor_ids=ancestor_ids, prev='list_group',
-                  egc_data=current_app.egc_data)
-              definition = re.sub(r'\b' + re.escape(rel_group) + r'\b',
-                  rendered_template, definition)
-          definition = '<span class="related_link">' +\
-                            definition + '</span>'
-          output.append(definition)
-
-        return "<br/>".join(output)
+        return cached_definition(render_group_definition, record,
+                                 record['type'], in_tooltip, ancestor_ids)
 
     def unit_definition(record, in_tooltip, ancestor_ids):
-        unit_id = record['id']
-        base_type = record['type']['base_type']
-        kind = record['type']['kind']
-        resource = record['type'].get('resource', None)
-        enumerating = record['type']['enumerating']
-        multi = record['type']['multi']
-        definition = record['definition']
-        if definition == ".":
-          return definition
-        if kind == "category":
-          if base_type in ['family_or_domain', 'function', 'ortholog_group',
-                           'ortholog_group_category']:
-            if resource in ['InterPro', 'Pfam', 'TC', 'Pfam_clan', 'CDD',
-                            'EC', 'BRENDA_EC', 'GO', 'COG', 'COG_category',
-                            'arCOG']:
-              return link_external_resource(resource, definition)
-        elif not enumerating:
-          if base_type in ['feature_type', 'amino_acid'] \
-              and definition.startswith('SO:'):
-            return link_external_resource('SO', definition[3:], definition)
-          elif base_type == 'metabolic_pathway' \
-              and definition.startswith('KEGG:'):
-            return link_external_resource('KEGG', definition[5:], definition)
-        m = re.match(r"^ref:(.+):(.*)$", definition)
-        if m:
-          return "ref:" + link_external_resource(m.group(1), m.group(2),
-              definition[4:])
-        if not enumerating and multi:
-          definition_parts = definition.split(",")
-          output_parts = [unit_definition({'id': unit_id,
-              'type': {"base_type": base_type, "multi": False,
-                       "kind": "simple", "enumerating": False},
-              "definition": part}, in_tooltip, ancestor_ids) \
-                  for part in definition_parts]
-          return ",".join(output_parts)
-        definition_pieces = break_string(definition, 15)
-        output = []
-        for definition in definition_pieces:
-          rel_units = []
-          if base_type.endswith('_homologs'):
-              m = re.match(r'^homolog:([a-zA-Z0-9_]+)', definition)
-              if m:
-                  rel_units = [m.group(1)]
-          elif base_type == 'arrangement' and enumerating:
-              parts = definition.split(',')
-              rel_units = []
-              for part in parts:
-                  m = re.match(r'^([a-zA-Z0-9_]+)$', part)
-                  if m:
-                      rel_units.append(m.group(1))
-          elif enumerating:
-            rel_units = re.findall(r"[a-zA-Z0-9_]+", definition)
-          elif definition.startswith('derived:'):
-              m = re.match(r'^derived:([a-zA-Z0-9_]+):.*', definition)
-              if m:
-                rel_units = [m.group(1)]
-
-          for rel_unit in rel_units:
-              rendered_template = render_template('refs_link.html',
-                  in_tooltip=in_tooltip,
-                  record_kind='unit', record_id=unit_id,
-                  related_kind='unit', related_id=rel_unit, prev='list_unit',
-                  noclass=True, ancestor_ids=ancestor_ids,
-                  egc_data=current_app.egc_data)
-              definition = re.sub(r'\b' + re.escape(rel_unit) + r'\b',
-                  rendered_template, definition)
-          definition = '<span class="related_link">' +\
-                            definition + '</span>'
-          output.append(definition)
-
-        return "<br/>".join(output)
+        unit_type = tuple(sorted(record['type'].items()))
+        return cached_definition(render_unit_definition, record,
+                                 unit_type, in_tooltip, ancestor_ids)
 
     return {
             'linked_tag_value': linked_tag_value,
@@ -0,0 +1,129 @@
+#
+# Server-side processing of DataTables requests
+# (see https://datatables.net/manual/server-side)
+#
+# The records are filtered, sorted and paginated on the server, based
+# on the plain-text values of their columns (see column_values.py), which
+# are kept in a columnar store (see column_store.py), so that only the
+# visible page of rows must be rendered.
+#
+
+import re
+
+def table_columns(info):
+  """
+  Keys of the columns of a datatable, in the order in which they are
+  displayed; the actions and referenced-by columns, which cannot be
+  searched or sorted, are represented by None.
+  """
+  columns = [None]
+  columns.extend(col for col, collbl in info["table_columns"])
+  columns.append("tags")
+  if len(info["ref_by_kinds"]) > 0:
+    columns.append(None)
+  return columns
+
+def _to_int(value, default):
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return default
+
+def parse_request_args(args):
+  """
+  Parse the parameters of a DataTables server-side request.
+  """
+  params = {
+      "draw": _to_int(args.get("draw"), 0),
+      "start": max(_to_int(args.get("start"), 0), 0),
+      "length": _to_int(args.get("length"), 10),
+      "search": args.get("search[value]", ""),
+      "search_regex": args.get("search[regex]") == "true",
+      "order": [],
+      "column_search": {},
+  }
+  i = 0
+  while f"order[{i}][column]" in args:
+    column = _to_int(args.get(f"order[{i}][column]"), None)
+    if column is not None:
+      descending = args.get(f"order[{i}][dir]") == "desc"
+      params["order"].append((column, descending))
+    i += 1
+  i = 0
+  while f"columns[{i}][data]" in args:
+    value = args.get(f"columns[{i}][search][value]", "")
+    if value:
+      regex = args.get(f"columns[{i}][search][regex]") == "true"
+      params["column_search"][i] = (value, regex)
+    i += 1
+  return params
+
+def _matcher(value, regex):
+  """
+  Function returning True if a (plain text) cell matches the search value.
+
+  Non-regex searches use the same "smart" matching as DataTables,
+  i.e. all words of the search value must be contained in the cell,
+  in any order and case-insensitively.
+  """
+  if regex:
+    try:
+      pattern = re.compile(value, re.IGNORECASE)
+      return lambda text: pattern.search(text) is not None
+    except re.error:
+      pass
+  words = value.lower().split()
+  return lambda text: all(word in text.lower() for word in words)
+
+def filter_rows(table, rows, params):
+  """
+  Select the rows matching the global and the column searches.
+
+  The rows are row indices of a KindTable (see column_store.py),
+  which contains the plain-text values of the table columns.
+  """
+  if params["search"]:
+    matches = _matcher(params["search"], params["search_regex"])
+    rows = [row for row in rows if matches(table.row_text(row))]
+  for column, (value, regex) in params["column_search"].items():
+    stored = table.column(column)
+    if stored is None:
+      return []
+    rows = stored.matching(rows, _matcher(value, regex))
+  return rows
+
+def sort_rows(table, rows, params):
+  """
+  Sort the rows by the requested columns; columns which cannot
+  be sorted (not stored in the table) are ignored.
+  """
+  for column, descending in reversed(params["order"]):
+    stored = table.column(column)
+    if stored is None:
+      continue
+    rows = sorted(rows, key=stored.sort_key(), reverse=descending)
+  return rows
+
+def paginate_rows(rows, params):
+  """
+  Select the rows of the requested page.
+  """
+  if params["length"] < 0:
+    return rows[params["start"]:]
+  return rows[params["start"]:params["start"]+params["length"]]
+
+def server_side_page(table, params):
+  """
+  Filter, sort and paginate the records of a KindTable (see column_store.py)
+  according to the parameters of a DataTables request.
+
+  Returns:
+    (page_ids, records_filtered): the IDs of the records of the requested
+                                  page, and the number of records matching
+                                  the searches
+  """
+  rows = table.live_rows()
+  rows = filter_rows(table, rows, params)
+  rows = sort_rows(table, rows, params)
+  page = paginate_rows(rows, params)
+  return [table.ids[row] for row in page], len(rows)
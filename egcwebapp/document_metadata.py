@@ -0,0 +1,262 @@
+#
+# Metadata of the documents (title, authors, journal, ...), for the tooltips
+# of the documents table.
+#
+# The metadata are obtained from the DOI of the document (taken from the
+# document link or, if not available, converted from the PMID using the
+# NCBI ID converter), which is resolved to CSL-JSON using doi.org.
+# The results are stored in a SQLite database, with a time-to-live,
+# so that each document is looked up only once, by the server,
+# instead of by each browser at each table draw.
+#
+# Usage of the prefetch command:
+#   python3 -m egcwebapp.document_metadata <egcfile> <database>
+#
+
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+IDCONV_URL = "https://www.ncbi.nlm.nih.gov/pmc/utils/idconv/v1.0/"
+DOI_URL = "https://doi.org/"
+
+# fields of the CSL-JSON which are stored and returned
+CSL_FIELDS = ["DOI", "title", "author", "container-title",
+              "volume", "issue", "page"]
+
+DOI_PATH_RE = re.compile(r"/doi/(.*?)(\?|$)")
+DOI_PARAM_RE = re.compile(r"(/|=)(10\..*?)(\?|$)")
+
+def doi_from_url(url):
+  """
+  Extract the DOI from a document URL, if it contains it.
+  """
+  if not url:
+    return None
+  m = DOI_PATH_RE.search(url)
+  if m and m.group(1):
+    return m.group(1)
+  m = DOI_PARAM_RE.search(url)
+  if m and m.group(2):
+    return m.group(2)
+  return None
+
+class MetadataFetchError(Exception):
+  pass
+
+class HttpFetcher:
+  """
+  Fetcher of the document metadata from the NCBI ID converter and doi.org.
+
+  The URLs of the services can be changed, e.g. for using a local server.
+  """
+
+  def __init__(self, idconv_url=IDCONV_URL, doi_url=DOI_URL, timeout=10):
+    self.idconv_url = idconv_url
+    self.doi_url = doi_url
+    self.timeout = timeout
+
+  def _get(self, url, accept):
+    request = urllib.request.Request(url, headers={"Accept": accept})
+    try:
+      with urllib.request.urlopen(request, timeout=self.timeout) as response:
+        return json.loads(response.read())
+    except (OSError, ValueError) as err:
+      raise MetadataFetchError(f"Failed fetching {url}: {err}") from err
+
+  def doi_from_pmid(self, pmid):
+    query = urllib.parse.urlencode({"ids": pmid, "format": "json"})
+    data = self._get(f"{self.idconv_url}?{query}", "application/json")
+    for record in data.get("records", []):
+      if record.get("doi"):
+        return record["doi"]
+    raise MetadataFetchError(f"No DOI found for PMID {pmid}")
+
+  def fetch(self, pmid, url):
+    """
+    CSL-JSON metadata of a document (dict).
+    """
+    doi = doi_from_url(url) or self.doi_from_pmid(pmid)
+    return self._get(self.doi_url + urllib.parse.quote(doi, safe="/"),
+                     "application/vnd.citationstyles.csl+json")
+
+class MetadataCache:
+  """
+  Persistent cache of the document metadata, in a SQLite database.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.local = threading.local()
+    # the connection used for creating the table is closed, so that no
+    # connection is inherited by processes forked later (e.g. by gunicorn
+    # --preload or by the static export)
+    db = sqlite3.connect(self.path, timeout=30)
+    try:
+      with db:
+        db.execute("CREATE TABLE IF NOT EXISTS metadata "+\
+                   "(key TEXT PRIMARY KEY, data TEXT, error TEXT, "+\
+                   "fetched REAL)")
+    finally:
+      db.close()
+
+  def _connection(self):
+    # sqlite3 connections can only be used by the thread creating them,
+    # and must not be used across a fork, thus they are opened lazily
+    # by each thread of each process
+    if getattr(self.local, "pid", None) != os.getpid():
+      if getattr(self.local, "db", None) is not None:
+        # not closed, since closing a connection of the parent process
+        # in the child is unsafe as well
+        self.local.inherited = self.local.db
+      self.local.db = sqlite3.connect(self.path, timeout=30)
+      self.local.pid = os.getpid()
+    return self.local.db
+
+  def get(self, key):
+    """
+    Cached (data, error, fetch time) of a key, or None.
+    """
+    row = self._connection().execute(
+        "SELECT data, error, fetched FROM metadata WHERE key = ?",
+        (key,)).fetchone()
+    if row is None:
+      return None
+    data, error, fetched = row
+    return (json.loads(data) if data else None, error, fetched)
+
+  def put(self, key, data, error=None):
+    with self._connection() as db:
+      db.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)",
+                 (key, json.dumps(data) if data else None, error,
+                  time.time()))
+
+class DocumentMetadata:
+  """
+  Metadata of the documents, fetched by the given fetcher and cached.
+
+  Concurrent requests of the metadata of the same document wait
+  for a single fetch.
+
+  Args:
+    cache:      MetadataCache
+    fetcher:    object with a method fetch(pmid, url) returning the
+                CSL-JSON dict of the document (e.g. HttpFetcher)
+    ttl:        seconds after which cached metadata are fetched again
+    error_ttl:  seconds after which a failed fetch is retried
+  """
+
+  def __init__(self, cache, fetcher, ttl=30*24*3600, error_ttl=3600):
+    self.cache = cache
+    self.fetcher = fetcher
+    self.ttl = ttl
+    self.error_ttl = error_ttl
+    self.lock = threading.Lock()
+    self.in_flight = {}
+
+  @staticmethod
+  def key(pmid, url):
+    return f"{pmid}\t{url or ''}"
+
+  def _cached(self, key):
+    cached = self.cache.get(key)
+    if cached is None:
+      return None
+    data, error, fetched = cached
+    if time.time() - fetched > (self.error_ttl if error else self.ttl):
+      return None
+    return data, error
+
+  def _fetch(self, pmid, url):
+    try:
+      csl = self.fetcher.fetch(pmid, url)
+      return {field: csl[field] for field in CSL_FIELDS if field in csl}, None
+    except MetadataFetchError as err:
+      logger.warning(str(err))
+      return None, str(err)
+
+  def get(self, pmid, url):
+    """
+    Metadata of a document.
+
+    Returns:
+      (data, error): data is a dict of the CSL_FIELDS
+                     or None, if the metadata could not be fetched
+    """
+    key = self.key(pmid, url)
+    cached = self._cached(key)
+    if cached is not None:
+      return cached
+    with self.lock:
+      future = self.in_flight.get(key)
+      owner = future is None
+      if owner:
+        # the metadata could have been fetched by another thread meanwhile
+        cached = self._cached(key)
+        if cached is not None:
+          return cached
+        future = Future()
+        self.in_flight[key] = future
+    if not owner:
+      return future.result()
+    try:
+      result = self._fetch(pmid, url)
+      self.cache.put(key, *result)
+      future.set_result(result)
+      return result
+    except Exception as err:
+      future.set_exception(err)
+      raise
+    finally:
+      with self.lock:
+        del self.in_flight[key]
+
+  def prefetch(self, documents, n_threads=2):
+    """
+    Fetch the metadata of the given (pmid, url) documents which are not
+    cached yet (or outdated).
+
+    Returns:
+      number of documents whose metadata could not be fetched
+    """
+    with ThreadPoolExecutor(n_threads) as executor:
+      results = executor.map(lambda document: self.get(*document), documents)
+      return sum(1 for data, error in results if error)
+
+def document_pmid_and_url(document):
+  return document["document_id"]["item"], document.get("link")
+
+def main():
+  parser = argparse.ArgumentParser(description=\
+      "Prefetch the metadata of the documents of an EGC file")
+  parser.add_argument("egc_file", help="EGC file")
+  parser.add_argument("database", help="SQLite database of the metadata, "+\
+      "e.g. instance/document_metadata.sqlite")
+  parser.add_argument("--threads", type=int, default=2,
+      help="number of concurrent requests (default: 2)")
+  parser.add_argument("--idconv-url", default=IDCONV_URL,
+      help=f"URL of the PMID to DOI converter (default: {IDCONV_URL})")
+  parser.add_argument("--doi-url", default=DOI_URL,
+      help=f"URL of the DOI resolver (default: {DOI_URL})")
+  args = parser.parse_args()
+  from egctools.egcdata import EGCData
+  egc_data = EGCData.from_file(args.egc_file)
+  documents = [document_pmid_and_url(document) \
+                 for document in egc_data.find_all("D")]
+  metadata = DocumentMetadata(MetadataCache(args.database),
+      HttpFetcher(args.idconv_url, args.doi_url))
+  n_failed = metadata.prefetch(documents, args.threads)
+  print(f"Documents: {len(documents)}, failed: {n_failed}")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,287 @@
+#
+# Export of the EGC browser as a static site, which can be published
+# on any web server, without running the application.
+#
+# The pages (tables of each record kind, page of each record) and the
+# fragments loaded by them (record tooltips, EGC lines, document metadata,
+# nested tables of the first level) are rendered by the application in
+# read-only mode and written to <output_dir>/<URL path>/index.html (the
+# nested tables inside the nested tables are not exported, thus they are
+# not expandable in the exported pages, see refs_link.html). The
+# site must be served at the root of the domain, since the links are
+# absolute. In the exported pages, the tooltips fetch the exported files
+# with GET requests; the global search and the loading of files, which
+# require the server, are not available.
+#
+# The document metadata are fetched from external services (see
+# document_metadata.py); if this fails, the metadata of the document are
+# not exported, and fetched again at the next export.
+#
+# The rendering is done in parallel by a pool of processes. Each page
+# has a key, i.e. a hash of the records on which it depends (and of the
+# application code); the keys are stored in a manifest in the output
+# directory, so that, when exporting again, only the pages whose key
+# changed are rendered, and only the files whose content changed are
+# written.
+#
+# Usage:
+#   python3 -m egcwebapp.export <egcfile> <output_dir> [--processes N]
+#
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+import multiprocessing
+from pathlib import Path
+from urllib.parse import unquote
+from flask import url_for
+from egcwebapp.record_kinds import record_kind_info
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = ".egcwebapp-export.json"
+
+# number of pages rendered by a task of the process pool
+CHUNK_SIZE = 500
+
+def _hash(*parts):
+  sha1 = hashlib.sha1()
+  for part in parts:
+    sha1.update(json.dumps(part, sort_keys=True, default=str).encode())
+  return sha1.hexdigest()
+
+def output_path(output_dir, url):
+  return Path(output_dir, unquote(url).strip("/"), "index.html")
+
+class SitePlan:
+  """
+  URLs of the pages of the static site and their keys.
+
+  Args:
+    app:    the application (in read-only mode)
+  """
+
+  def __init__(self, app):
+    self.app = app
+    self.egc_data = app.egc_data
+    self.graph = app.graph
+    self.version = app.code_version
+    self.record_keys = {}
+
+  def record_key(self, record_id):
+    """
+    Hash of what the rendering of a record depends on: its data,
+    which of its references are dangling and which records refer to it.
+    """
+    key = self.record_keys.get(record_id)
+    if key is None:
+      references = self.graph.out_edges.get(record_id, [])
+      key = _hash(self.egc_data.find(record_id),
+          [self.app.integrity.is_dangling(ref_id) for ref_id in references],
+          sorted(self.graph.in_edges.get(record_id, [])))
+      self.record_keys[record_id] = key
+    return key
+
+  def record_ids(self, record_kind):
+    return [self.egc_data.record_id(record) \
+              for record_type in record_kind_info[record_kind]["record_types"]
+                for record in self.egc_data.find_all(record_type)]
+
+  def kind_pages(self, record_kind):
+    """
+    URLs and keys of the pages of a record kind.
+    """
+    pages = []
+    record_ids = self.record_ids(record_kind)
+    kind_key = _hash(self.version,
+        [self.record_key(record_id) for record_id in record_ids])
+    pages.append((url_for(f"{record_kind}_list"), kind_key))
+    pages.append((url_for(f"{record_kind}_facets"), kind_key))
+    ref_by_kinds = record_kind_info[record_kind]["ref_by_kinds"]
+    for record_id in record_ids:
+      record_key = _hash(self.version, self.record_key(record_id))
+      pages.append((url_for(f"show_{record_kind}", record_id=record_id),
+                    record_key))
+      pages.append((url_for(f"get_{record_kind}", record_id=record_id),
+                    record_key))
+      pages.append((url_for("record_line", record_id=record_id), record_key))
+      if record_kind == "document":
+        pages.append((url_for("document_metadata", record_id=record_id),
+                      record_key))
+      referrers = sorted(self.graph.in_edges.get(record_id, []))
+      # nested table of the record, opened from the records referring to it
+      for ref_by_id in referrers:
+        pages.append((url_for(f"get_ref_{record_kind}",
+                              ancestor_ids=ref_by_id, record_id=record_id),
+                      record_key))
+      # nested tables of the records referring to the record
+      referrer_kinds = {}
+      for ref_by_id in referrers:
+        ref_by_kind = self.graph.kind_of_type.get(
+            self.graph.record_types.get(ref_by_id))
+        if ref_by_kind in ref_by_kinds:
+          referrer_kinds.setdefault(ref_by_kind, []).append(ref_by_id)
+      for ref_from_kind, ref_from_ids in referrer_kinds.items():
+        pages.append((url_for(f"get_{record_kind}_{ref_from_kind}s",
+                              ancestor_ids=record_id),
+                      _hash(record_key, [self.record_key(ref_from_id) \
+                                           for ref_from_id in ref_from_ids])))
+    return pages
+
+  def pages(self):
+    with self.app.test_request_context():
+      pages = []
+      for record_kind in record_kind_info:
+        pages.extend(self.kind_pages(record_kind))
+      return pages
+
+# the application used by the worker processes, inherited from the parent
+_app = None
+
+def render_pages(output_dir, pages):
+  """
+  Render the given (url, key, previous content hash) pages and write
+  those whose content changed.
+
+  Returns:
+    list of (url, key, content hash, written); the content hash is None
+    for the document metadata which could not be fetched
+  """
+  client = _app.test_client()
+  results = []
+  for url, key, previous_hash in pages:
+    response = client.get(url)
+    if response.status_code == 502 and url.endswith("/metadata"):
+      logger.warning(f"Document metadata not exported: {url}")
+      results.append((url, key, None, False))
+      continue
+    if response.status_code != 200:
+      raise RuntimeError(f"Failed rendering {url}: {response.status}")
+    content = response.get_data()
+    content_hash = hashlib.sha1(content).hexdigest()
+    path = output_path(output_dir, url)
+    written = content_hash != previous_hash or not path.exists()
+    if written:
+      path.parent.mkdir(parents=True, exist_ok=True)
+      tmp_path = path.with_suffix(".part")
+      tmp_path.write_bytes(content)
+      os.replace(tmp_path, path)
+    results.append((url, key, content_hash, written))
+  return results
+
+def _render_chunk(args):
+  return render_pages(*args)
+
+def _write_index(output_dir):
+  target = url_for("document_list")
+  path = Path(output_dir, "index.html")
+  path.write_text(f'<!DOCTYPE html><html><head><meta http-equiv="refresh" '+\
+                  f'content="0; url={target}"></head></html>\n')
+
+def _copy_static(app, output_dir):
+  source = Path(app.static_folder)
+  for path in source.rglob("*"):
+    if not path.is_file():
+      continue
+    target = Path(output_dir, app.static_url_path.strip("/"),
+                  path.relative_to(source))
+    if target.exists() and target.read_bytes() == path.read_bytes():
+      continue
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(path, target)
+
+def _load_manifest(output_dir):
+  try:
+    with open(Path(output_dir, MANIFEST)) as f:
+      return json.load(f)
+  except (FileNotFoundError, json.JSONDecodeError):
+    return {}
+
+def _remove_page(output_dir, url):
+  path = output_path(output_dir, url)
+  if path.exists():
+    path.unlink()
+  # remove the directories left empty
+  directory = path.parent
+  while directory != Path(output_dir) and not any(directory.iterdir()):
+    directory.rmdir()
+    directory = directory.parent
+
+def export_site(app, output_dir, n_processes=None):
+  """
+  Export the site to output_dir, rendering only the changed pages.
+
+  Returns:
+    (number of pages, number of rendered pages, number of written files)
+  """
+  global _app
+  _app = app
+  os.makedirs(output_dir, exist_ok=True)
+  manifest = _load_manifest(output_dir)
+  previous = manifest.get("pages", {})
+  pages = SitePlan(app).pages()
+  to_render = [(url, key, previous.get(url, [None, None])[1]) \
+                 for url, key in pages \
+                   if previous.get(url, [None])[0] != key or \
+                      not output_path(output_dir, url).exists()]
+  chunks = [(output_dir, to_render[i:i+CHUNK_SIZE]) \
+              for i in range(0, len(to_render), CHUNK_SIZE)]
+  if n_processes == 1 or len(chunks) <= 1 or \
+      "fork" not in multiprocessing.get_all_start_methods():
+    results = map(_render_chunk, chunks)
+    pool = None
+  else:
+    # the worker processes share the loaded records of the parent
+    pool = multiprocessing.get_context("fork").Pool(n_processes)
+    results = pool.imap_unordered(_render_chunk, chunks)
+  current = {url: previous[url] for url, key in pages if url in previous}
+  n_written = 0
+  try:
+    for chunk_results in results:
+      for url, key, content_hash, written in chunk_results:
+        if content_hash is None:
+          # the previously exported file (if any) is kept
+          continue
+        current[url] = [key, content_hash]
+        n_written += written
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+  for url in previous.keys() - current.keys():
+    _remove_page(output_dir, url)
+  with app.test_request_context():
+    _write_index(output_dir)
+  _copy_static(app, output_dir)
+  with open(Path(output_dir, MANIFEST), "w") as f:
+    json.dump({"pages": current}, f)
+  return len(pages), len(to_render), n_written
+
+def main():
+  parser = argparse.ArgumentParser(description=\
+      "Export the EGC browser of a file as a static site")
+  parser.add_argument("egc_file", help="EGC file")
+  parser.add_argument("output_dir", help="output directory; if it contains "+\
+      "a previous export, only the changed pages are rendered again")
+  parser.add_argument("--processes", "-p", type=int, default=None,
+      help="number of rendering processes (default: number of CPUs)")
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.INFO)
+  # read-only pages; the tables are loaded completely by the browser,
+  # since there is no server for filtering and paginating them
+  os.environ["EGCWEBAPP_MODE"] = "r"
+  os.environ["EGCWEBAPP_STATIC_EXPORT"] = "1"
+  # the exported file is not shared with a server using the same instance
+  os.environ["EGCWEBAPP_CURRENT_FILE_POINTER"] = ""
+  os.environ["EGCWEBAPP_SERVER_SIDE_THRESHOLD"] = str(2**62)
+  from egcwebapp.app import create_app
+  app = create_app(args.egc_file)
+  n_pages, n_rendered, n_written = \
+      export_site(app, args.output_dir, args.processes)
+  print(f"Pages: {n_pages}, rendered: {n_rendered}, written: {n_written}")
+
+if __name__ == "__main__":
+  main()
@@ -1,3 +1,5 @@
+import json
+import functools
 from flask import url_for
 
 DOI_URL = "https://doi.org/"
@@ -35,75 +37,65 @@ SMART_URL="https://www.ebi.ac.uk/interpro/entry/smart/"
 HAMAP_URL="https://hamap.expasy.org/rule/"
 UNIPROTKB_QUERY_URL="https://www.uniprot.org/uniprotkb?query="
 
+#
+# URL templates of the external resources, by resource prefix;
+# the string {item} is replaced by the ID of the item in the resource
+#
+EXTERNAL_RESOURCES = {
+  "geonames": GEONAMES_URL + "{item}",
+  "MICRO": MICRO_URL + "{item}",
+  "GO": GO_URL + "{item}",
+  "Wikipedia": WIKIPEDIA_URL + "{item}",
+  "Wiktionary": WIKTIONARY_URL + "{item}",
+  "taxid": TAXID_URL + "{item}",
+  "pmid": PMID_URL + "{item}",
+  "PMID": PMID_URL + "{item}",
+  "sctid": SNOMED_URL + "{item}",
+  "bacdive": BACDIVE_URL + "{item}",
+  "interridge": INTERRIDGE_URL + "{item}",
+  "doi": DOI_URL + "{item}",
+  "DOI": DOI_URL + "{item}",
+  "http": HTTP_URL + "{item}",
+  "https": HTTPS_URL + "{item}",
+  "InterPro": INTERPRO_URL + "{item}",
+  "TC": TC_URL + "{item}",
+  "Pfam": PFAM_URL + "{item}",
+  "Pfam_clan": PFAM_CLAN_URL + "{item}",
+  "CDD": CDD_URL + "{item}",
+  "EC": EC_URL + "{item}",
+  "BRENDA_EC": BRENDA_EC_URL + "{item}",
+  "SO": SO_URL + "{item}",
+  "KEGG": KEGG_URL + "{item}",
+  "COG_category": COG_CAT_URL + "{item}",
+  "COG": COG_URL + "{item}",
+  "arCOG": ARCOG_URL + "{item}",
+  "PROSITE": PROSITE_URL + "{item}",
+  "PIRSF": PIRSF_URL + "{item}",
+  "TIGRFAMs": TIGRFAMS_URL + "{item}",
+  "SFLD": SFLD_URL + "{item}",
+  "SMART": SMART_URL + "{item}",
+  "HAMAP": HAMAP_URL + "{item}",
+}
+for obo_resource in ["ENVO", "UBERON", "RO", "CHEBI", "OMP", "NCIT", "OHMI"]:
+  EXTERNAL_RESOURCES[obo_resource] = OBO_URL + obo_resource + "_{item}"
+
+def load_external_resources(path):
+  """
+  Add the external resources listed in a JSON file
+  (an object mapping resource prefixes to URL templates, in which
+  {item} is replaced by the item ID) or change their URL templates.
+  """
+  with open(path) as f:
+    EXTERNAL_RESOURCES.update(json.load(f))
+  link_external_resource.cache_clear()
+
+@functools.lru_cache(maxsize=65536)
 def link_external_resource(resource, item, text=None):
   if text is None:
     text = item
-  url = None
-  if resource == "geonames":
-      url = GEONAMES_URL + item
-  elif resource in ["ENVO", "UBERON", "RO", "CHEBI", "OMP", "NCIT", "OHMI"]:
-      url = OBO_URL + resource + "_" + item
-  elif resource == "MICRO":
-      url = MICRO_URL + item
-  elif resource == "GO":
-      url = GO_URL + item
-  elif resource == "Wikipedia":
-      url = WIKIPEDIA_URL + item
-  elif resource == "Wiktionary":
-      url = WIKTIONARY_URL + item
-  elif resource == "taxid":
-      url = TAXID_URL + item
-  elif resource == "pmid" or resource == "PMID":
-      url = PMID_URL + item
-  elif resource == "sctid":
-      url = SNOMED_URL + item
-  elif resource == "bacdive":
-      url = BACDIVE_URL + item
-  elif resource == "interridge":
-      url = INTERRIDGE_URL + item
-  elif resource == "doi" or resource == "DOI":
-      url = DOI_URL + item
-  elif resource == "http":
-      url = HTTP_URL + item
-  elif resource == "https":
-      url = HTTPS_URL + item
-  elif resource == 'InterPro':
-    url = INTERPRO_URL + item
-  elif resource == 'TC':
-    url = TC_URL + item
-  elif resource == 'Pfam':
-    url = PFAM_URL + item
-  elif resource == 'Pfam_clan':
-    url = PFAM_CLAN_URL + item
-  elif resource == 'CDD':
-    url = CDD_URL + item
-  elif resource == 'EC':
-    url = EC_URL + item
-  elif resource == 'BRENDA_EC':
-    url = BRENDA_EC_URL + item
-  elif resource == 'SO':
-    url = SO_URL + item
-  elif resource == 'KEGG':
-    url = KEGG_URL + item
-  elif resource == 'COG_category':
-    url = COG_CAT_URL + item
-  elif resource == 'COG':
-    url = COG_URL + item
-  elif resource == 'arCOG':
-    url = ARCOG_URL + item
-  elif resource == 'PROSITE':
-    url = PROSITE_URL + item
-  elif resource == 'PIRSF':
-    url = PIRSF_URL + item
-  elif resource == 'TIGRFAMs':
-    url = TIGRFAMS_URL + item
-  elif resource == 'SFLD':
-    url = SFLD_URL + item
-  elif resource == 'SMART':
-    url = SMART_URL + item
-  elif resource == 'HAMAP':
-    url = HAMAP_URL + item
-  if url:
+  url_template = EXTERNAL_RESOURCES.get(resource)
+  if url_template:
+    url = url_template.replace("{item}", item)
     return f"<a href='{url}' target='_blank'>{text}</a>"
   else:
     return None
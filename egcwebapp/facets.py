@@ -0,0 +1,80 @@
+#
+# Facets of the table columns, i.e. distinct values and their counts,
+# used for the filter dropdowns of the datatables.
+#
+# The facets are computed from the plain-text column values (see
+# column_values.py) in a single pass over all records, when a file
+# is loaded, and updated when records are added or removed.
+#
+
+from collections import Counter
+from egcwebapp.column_values import column_value
+from egcwebapp.datatables import table_columns
+
+class FacetIndex:
+  """
+  Counts of the distinct values of the table columns of each record kind.
+
+  Args:
+    record_kind_info:   the record_kind_info dictionary
+  """
+
+  def __init__(self, record_kind_info):
+    self.record_kind_info = record_kind_info
+    self.kind_of_type = {record_type: record_kind \
+        for record_kind, info in record_kind_info.items() \
+          for record_type in info["record_types"]}
+    self.columns = {record_kind: table_columns(info) \
+        for record_kind, info in record_kind_info.items()}
+    self.egc_data = None
+    self.counts = {}
+    self.clear()
+
+  def clear(self):
+    # record kind -> column key -> Counter of the values;
+    # the tags are not used as filters
+    self.counts = {record_kind: {column: Counter() \
+                     for column in columns if column not in [None, "tags"]} \
+                   for record_kind, columns in self.columns.items()}
+
+  def build(self, egc_data):
+    self.egc_data = egc_data
+    self.clear()
+    for record_type in self.kind_of_type:
+      for record in egc_data.find_all(record_type):
+        self.add(record)
+
+  def _record_values(self, record):
+    record_kind = self.kind_of_type[record["record_type"]]
+    for column, counter in self.counts[record_kind].items():
+      yield counter, column_value(record, record_kind, column, self.egc_data)
+
+  def add(self, record):
+    for counter, value in self._record_values(record):
+      counter[value] += 1
+
+  def remove(self, record):
+    for counter, value in self._record_values(record):
+      counter[value] -= 1
+      if counter[value] <= 0:
+        del counter[value]
+
+  def facets(self, record_kind, limit):
+    """
+    Facets of the columns of a record kind, in the order of the datatable
+    columns (None for the columns without facets).
+
+    For each column, the number of distinct values is given, and the
+    (value, count) pairs, sorted by value, if they are not more than limit.
+    """
+    result = []
+    for column in self.columns[record_kind]:
+      if column not in self.counts[record_kind]:
+        result.append(None)
+        continue
+      counter = self.counts[record_kind][column]
+      facet = {"column": column, "n_values": len(counter), "values": None}
+      if len(counter) <= limit:
+        facet["values"] = sorted(counter.items())
+      result.append(facet)
+    return result
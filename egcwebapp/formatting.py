@@ -32,39 +32,55 @@ def break_string(string, goal_length, min_length=None, breaking_chars=" ,"):
         >>> break_string("This is a test string", 10, breaking_chars="-")
         ['This is a test string']
     """
-    # Check if string is already shorter than goal length
-    if len(string) <= goal_length:
-        return [string]
+    return list(iter_break_string(string, goal_length, min_length,
+                                  breaking_chars))
 
-    if min_length is None:
-      min_length = int(goal_length * 0.9)
-
-    # Find the first breaking character at the goal length
-    if string[goal_length] in breaking_chars:
-        return [string[:goal_length+1]] + break_string(string[goal_length+1:],
-                goal_length, min_length, breaking_chars)
-
-    # Find the last breaking character before the deviation range
-    last_break = -1
-    for i in range(min_length, goal_length):
-        if i >= 0 and string[i] in breaking_chars:
-            last_break = i
+def iter_break_string(string, goal_length, min_length=None,
+                      breaking_chars=" ,"):
+    """Generator version of `break_string`, yielding the pieces.
 
-    # Find the first breaking character after the goal length
-    first_break = -1
-    for i in range(goal_length+1, len(string)):
-        if string[i] in breaking_chars:
-            first_break = i
-            break
-
-    # Choose the preferred breaking position based on priority
-    if last_break >= 0:
-        return [string[:last_break+1]] + break_string(string[last_break+1:],
-                goal_length, min_length, breaking_chars)
-    elif first_break > 0:
-        return [string[:first_break+1]] + break_string(string[first_break+1:],
-                goal_length, min_length, breaking_chars)
-    else:
-        return [string]
+    The pieces are searched iteratively, in time linear in the length
+    of the string: the string is not copied except for the yielded pieces,
+    the region before the goal length is searched with `str.rfind` and
+    the next breaking character after the goal length is found using the
+    positions of the next occurrence of each breaking character, which
+    only move forward.
+    """
+    if min_length is None:
+        min_length = int(goal_length * 0.9)
+    chars = set(breaking_chars)
+    # position of the next occurrence of each breaking character
+    # (only valid if not before the current position; -1 if none)
+    next_occurrence = dict.fromkeys(chars, 0)
 
+    def first_break_from(pos):
+        first = -1
+        for char in chars:
+            p = next_occurrence[char]
+            if p != -1 and p < pos:
+                p = string.find(char, pos)
+                next_occurrence[char] = p
+            if p != -1 and (first == -1 or p < first):
+                first = p
+        return first
 
+    start = 0
+    while len(string) - start > goal_length:
+        goal = start + goal_length
+        if string[goal] in breaking_chars:
+            end = goal + 1
+        else:
+            # last breaking character between min_length and goal_length
+            region_start = start + max(min_length, 0)
+            last_break = max((string.rfind(char, region_start, goal) \
+                                for char in chars), default=-1)
+            if last_break >= 0:
+                end = last_break + 1
+            else:
+                first_break = first_break_from(goal + 1)
+                if first_break < 0:
+                    break
+                end = first_break + 1
+        yield string[start:end]
+        start = end
+    yield string[start:]
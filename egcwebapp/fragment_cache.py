@@ -0,0 +1,119 @@
+#
+# Cache of the rendered nested tables and tooltip tables.
+#
+# The nested tables (records referred to by a record, records referring
+# to a record) are rendered again and again, while navigating the graph of
+# the records, and so are the tables of the records shown in the tooltips
+# (also when fetched in batches). Thus they are cached, until one of the
+# records on which their rendering depends is changed.
+#
+
+import threading
+from collections import OrderedDict, defaultdict
+
+class FragmentCache:
+  """
+  Least recently used cache of rendered HTML fragments, with a bound
+  on the total size of the fragments.
+
+  For each entry, the IDs of the records on which the rendering depends
+  are given, so that the entries can be invalidated when any of them
+  changes (see invalidate()).
+
+  Args:
+    max_bytes:  maximum total size of the cached fragments
+                (approximated by their length)
+  """
+
+  def __init__(self, max_bytes=64*1024*1024):
+    self.max_bytes = max_bytes
+    self.entries = OrderedDict()
+    self.dependencies = {}
+    self.keys_by_record = defaultdict(set)
+    self.n_bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.invalidations = 0
+    # increased at each invalidation, so that fragments rendered
+    # while the records were changed are not stored
+    self.generation = 0
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      html = self.entries.get(key)
+      if html is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+        self.entries.move_to_end(key)
+      return html
+
+  def _forget(self, key):
+    html = self.entries.pop(key)
+    self.n_bytes -= len(html)
+    for record_id in self.dependencies.pop(key):
+      keys = self.keys_by_record.get(record_id)
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del self.keys_by_record[record_id]
+
+  def put(self, key, html, dependencies, generation=None):
+    if len(html) > self.max_bytes:
+      return
+    with self.lock:
+      if generation is not None and generation != self.generation:
+        return
+      if key in self.entries:
+        self._forget(key)
+      self.entries[key] = html
+      self.n_bytes += len(html)
+      self.dependencies[key] = set(dependencies)
+      for record_id in self.dependencies[key]:
+        self.keys_by_record[record_id].add(key)
+      while self.n_bytes > self.max_bytes:
+        self._forget(next(iter(self.entries)))
+        self.evictions += 1
+
+  def get_or_render(self, key, render):
+    """
+    Cached fragment, or fragment rendered by render(), which must
+    return (html, IDs of the records on which the rendering depends).
+    """
+    html = self.get(key)
+    if html is None:
+      generation = self.generation
+      html, dependencies = render()
+      self.put(key, html, dependencies, generation)
+    return html
+
+  def invalidate(self, record_ids):
+    """
+    Remove the entries depending on any of the given records.
+    """
+    with self.lock:
+      self.generation += 1
+      for record_id in record_ids:
+        for key in list(self.keys_by_record.get(record_id, ())):
+          self._forget(key)
+          self.invalidations += 1
+
+  def clear(self):
+    with self.lock:
+      self.generation += 1
+      self.entries.clear()
+      self.dependencies.clear()
+      self.keys_by_record.clear()
+      self.n_bytes = 0
+
+  def stats(self):
+    with self.lock:
+      n_requests = self.hits + self.misses
+      return {"entries": len(self.entries), "bytes": self.n_bytes,
+              "max_bytes": self.max_bytes, "hits": self.hits,
+              "misses": self.misses,
+              "hit_ratio": self.hits / n_requests if n_requests else None,
+              "evictions": self.evictions,
+              "invalidations": self.invalidations}
@@ -0,0 +1,149 @@
+#
+# Graph of the references between the records.
+#
+# The adjacency lists (records referred to by each record, records
+# referring to each record) are built in a single pass over all records,
+# when a file is loaded, and updated when records are added or removed.
+# They are used for returning the neighbourhood of a record up to a given
+# depth with a single request, instead of one request for each hop.
+#
+# An ID can be defined by multiple records (which is reported as an
+# integrity problem, see integrity.py); thus the references are kept for
+# each record, and the references of an ID are those of all its records.
+#
+
+from collections import defaultdict, deque, Counter
+from egcwebapp.references import record_references
+
+DIRECTIONS = ["in", "out", "both"]
+
+class ReferenceGraph:
+  """
+  Adjacency index of the references between the records.
+
+  Args:
+    record_kind_info:   the record_kind_info dictionary
+  """
+
+  def __init__(self, record_kind_info):
+    self.kind_of_type = {record_type: record_kind \
+        for record_kind, info in record_kind_info.items() \
+          for record_type in info["record_types"]}
+    self.egc_data = None
+    # record ID -> (record type, referenced IDs) of each record with the ID
+    self.records = defaultdict(list)
+    # record ID -> record type
+    self.record_types = {}
+    # record ID -> IDs of the records it refers to (in order)
+    self.out_edges = {}
+    # record ID -> IDs of the records referring to it
+    # (and number of records with that ID referring to it)
+    self.in_edges = defaultdict(Counter)
+
+  def build(self, egc_data):
+    self.egc_data = egc_data
+    self.records.clear()
+    self.record_types.clear()
+    self.out_edges.clear()
+    self.in_edges.clear()
+    for record_type in self.kind_of_type:
+      for record in egc_data.find_all(record_type):
+        self.add(record)
+
+  def _set_node(self, record_id):
+    entries = self.records.get(record_id)
+    if not entries:
+      self.records.pop(record_id, None)
+      self.record_types.pop(record_id, None)
+      self.out_edges.pop(record_id, None)
+      return
+    self.record_types[record_id] = entries[0][0]
+    if len(entries) == 1:
+      self.out_edges[record_id] = entries[0][1]
+    else:
+      self.out_edges[record_id] = list(dict.fromkeys(
+          ref_id for record_type, references in entries \
+                   for ref_id in references))
+
+  def add(self, record):
+    record_id = self.egc_data.record_id(record)
+    references = record_references(record, self.egc_data)
+    self.records[record_id].append((record["record_type"], references))
+    self._set_node(record_id)
+    for ref_id in references:
+      self.in_edges[ref_id][record_id] += 1
+
+  def remove(self, record):
+    record_id = self.egc_data.record_id(record)
+    entries = self.records.get(record_id)
+    if not entries:
+      return
+    entry = (record["record_type"], record_references(record, self.egc_data))
+    # the record removed is the one with the same references, if any
+    index = entries.index(entry) if entry in entries else 0
+    record_type, references = entries.pop(index)
+    self._set_node(record_id)
+    for ref_id in references:
+      referrers = self.in_edges.get(ref_id)
+      if referrers is not None:
+        referrers[record_id] -= 1
+        if referrers[record_id] <= 0:
+          del referrers[record_id]
+        if not referrers:
+          del self.in_edges[ref_id]
+
+  def __contains__(self, record_id):
+    return record_id in self.record_types
+
+  def neighbours(self, record_id, direction):
+    if direction in ["out", "both"]:
+      for ref_id in self.out_edges.get(record_id, []):
+        yield ref_id, (record_id, ref_id)
+    if direction in ["in", "both"]:
+      for ref_by_id in sorted(self.in_edges.get(record_id, [])):
+        yield ref_by_id, (ref_by_id, record_id)
+
+  def node(self, record_id, depth):
+    record_type = self.record_types.get(record_id)
+    return {"id": record_id, "record_type": record_type,
+            "record_kind": self.kind_of_type.get(record_type),
+            "depth": depth}
+
+  def neighbourhood(self, record_id, depth=1, direction="both",
+                    max_nodes=1000):
+    """
+    Subgraph of the records reachable from a record in at most depth
+    references, followed in the given direction (see DIRECTIONS:
+    out = referred to by the record, in = referring to the record).
+
+    The traversal is breadth-first and stops after max_nodes nodes.
+    Referenced IDs which are not defined by any record are included
+    as nodes with record_type None.
+
+    Returns:
+      (nodes, edges, truncated):
+        nodes:     list of dicts (id, record_type, record_kind, depth)
+        edges:     list of (referring ID, referred ID), between the nodes
+        truncated: True if nodes were left out because of max_nodes
+    """
+    depths = {record_id: 0}
+    nodes = [self.node(record_id, 0)]
+    edges = set()
+    truncated = False
+    queue = deque([record_id])
+    while queue:
+      current_id = queue.popleft()
+      if depths[current_id] == depth:
+        continue
+      for neighbour_id, edge in self.neighbours(current_id, direction):
+        if neighbour_id not in depths:
+          if len(nodes) >= max_nodes:
+            truncated = True
+            continue
+          depths[neighbour_id] = depths[current_id] + 1
+          nodes.append(self.node(neighbour_id, depths[neighbour_id]))
+          queue.append(neighbour_id)
+        edges.add(edge)
+    # edges among the nodes which were not followed (e.g. between
+    # two nodes at the maximum depth) are not included
+    return nodes, sorted(edges), truncated
@@ -0,0 +1,181 @@
+#
+# Optional instrumentation of the application, for finding out where
+# the time is spent when handling requests.
+#
+# If enabled (environment variable EGCWEBAPP_INSTRUMENTATION=1), the time
+# spent is measured for each route, template, column context processor and
+# EGCData method (see EGC_DATA_METHODS). The totals are exposed at
+# /metrics (Prometheus text format) and those of each request in its
+# Server-Timing header (shown e.g. in the network tab of the browser
+# developer tools).
+#
+# The times are inclusive, e.g. the time of row.html includes the time
+# of the column templates included by it.
+#
+
+import re
+import time
+import functools
+import threading
+from flask import g, request, has_request_context, Response
+
+EGC_DATA_METHODS = ["find", "find_all", "ref_by", "ref_by_count",
+                    "id_exists", "line"]
+
+# categories of measures: name in the metrics, label name, description
+CATEGORIES = {
+  "route": ("egcwebapp_request_seconds", "route",
+            "Time spent handling requests, by route"),
+  "template": ("egcwebapp_template_seconds", "template",
+               "Time spent rendering templates, by template"),
+  "context": ("egcwebapp_context_processor_seconds", "processor",
+              "Time spent in the column context processors, by processor"),
+  "egc_data": ("egcwebapp_egc_data_seconds", "method",
+               "Time spent in the EGCData methods, by method"),
+}
+
+SERVER_TIMING_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+def _escape_label(value):
+  return str(value).replace("\\", "\\\\").replace('"', '\\"')\
+                   .replace("\n", "\\n")
+
+class Instrumentation:
+  """
+  Collector of the time spent by category (see CATEGORIES) and name.
+  """
+
+  def __init__(self):
+    # category -> name -> [number of calls, total seconds]
+    self.totals = {category: {} for category in CATEGORIES}
+    self.lock = threading.Lock()
+
+  def record(self, category, name, seconds):
+    with self.lock:
+      total = self.totals[category].setdefault(name, [0, 0.0])
+      total[0] += 1
+      total[1] += seconds
+    if has_request_context():
+      timings = g.setdefault("instrumentation_timings", {})
+      total = timings.setdefault((category, name), [0, 0.0])
+      total[0] += 1
+      total[1] += seconds
+
+  def timed(self, category, name, func):
+    """
+    Wrap a function, recording the time spent in it.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      start = time.perf_counter()
+      try:
+        return func(*args, **kwargs)
+      finally:
+        self.record(category, name, time.perf_counter() - start)
+    return wrapper
+
+  def timed_functions(self, category, functions):
+    """
+    Copy of a dictionary, where the functions are wrapped by timed().
+    """
+    return {name: self.timed(category, name, value) \
+                    if callable(value) else value \
+              for name, value in functions.items()}
+
+  def instrument_egc_data(self, egc_data):
+    for method in EGC_DATA_METHODS:
+      func = getattr(egc_data, method, None)
+      if func is not None and not hasattr(func, "__wrapped__"):
+        setattr(egc_data, method, self.timed("egc_data", method, func))
+
+  def _instrument_template(self, template):
+    if getattr(template, "instrumented", False):
+      return
+    render_func = template.root_render_func
+    name = template.name
+
+    def root_render_func(context):
+      # the output of the templates is consumed at once, thus the time
+      # until the generator is exhausted is the rendering time
+      start = time.perf_counter()
+      try:
+        yield from render_func(context)
+      finally:
+        self.record("template", name, time.perf_counter() - start)
+
+    template.root_render_func = root_render_func
+    template.instrumented = True
+
+  def instrument_templates(self, env):
+    """
+    Instrument the templates loaded by a Jinja environment,
+    including those loaded by include and extends.
+    """
+    get_template = env.get_template
+
+    @functools.wraps(get_template)
+    def instrumented_get_template(*args, **kwargs):
+      template = get_template(*args, **kwargs)
+      self._instrument_template(template)
+      return template
+
+    env.get_template = instrumented_get_template
+
+  def server_timing(self, timings):
+    entries = []
+    for (category, name), (n_calls, seconds) in sorted(timings.items()):
+      metric = SERVER_TIMING_NAME_RE.sub("_", f"{category}.{name}")
+      entries.append(f'{metric};dur={seconds * 1000:.2f};'+\
+                     f'desc="{n_calls} calls"')
+    return ", ".join(entries)
+
+  def prometheus(self, gauges=None):
+    """
+    Metrics in the Prometheus text format.
+
+    Args:
+      gauges: further metrics, as dict name -> (description, value)
+    """
+    lines = []
+    with self.lock:
+      for category, (metric, label, description) in CATEGORIES.items():
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} summary")
+        for name, (n_calls, seconds) in sorted(self.totals[category].items()):
+          labels = f'{{{label}="{_escape_label(name)}"}}'
+          lines.append(f"{metric}_count{labels} {n_calls}")
+          lines.append(f"{metric}_sum{labels} {seconds:.6f}")
+    for name, (description, value) in (gauges or {}).items():
+      lines.append(f"# HELP {name} {description}")
+      lines.append(f"# TYPE {name} gauge")
+      lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+  def init_app(self, app, gauges=None):
+    """
+    Measure the requests of an app and add the /metrics route.
+
+    Args:
+      gauges: function returning further metrics (see prometheus())
+    """
+    self.instrument_templates(app.jinja_env)
+
+    @app.before_request
+    def start_timing():
+      g.instrumentation_start = time.perf_counter()
+
+    @app.after_request
+    def add_server_timing(response):
+      start = g.pop("instrumentation_start", None)
+      if start is None:
+        return response
+      self.record("route", request.endpoint or "unknown",
+                  time.perf_counter() - start)
+      timings = g.pop("instrumentation_timings", {})
+      response.headers["Server-Timing"] = self.server_timing(timings)
+      return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+      return Response(self.prometheus(gauges() if gauges else None),
+                      mimetype="text/plain; version=0.0.4")
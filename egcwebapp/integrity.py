@@ -0,0 +1,255 @@
+#
+# Integrity checks of the records of a file.
+#
+# The following problems are reported:
+# - dangling references, i.e. IDs referred to by records, which are not
+#   defined by any record;
+# - reference cycles in the definitions of the units and of the groups;
+# - IDs defined by more than one record.
+#
+# The dangling references and duplicated IDs are computed from the
+# reference graph (see graph.py) when a file is loaded and updated when
+# records are added or removed. The cycles are searched in a background
+# thread, after loading a file and after each change to a unit or group.
+#
+
+import logging
+import threading
+from contextlib import contextmanager
+from collections import Counter
+from egcwebapp.references import record_references
+
+logger = logging.getLogger(__name__)
+
+# record types whose definitions can refer to records of the same type
+DEFINITION_RECORD_TYPES = ["U", "G"]
+
+def find_cycles(adjacency):
+  """
+  Strongly connected components of a directed graph which contain
+  a cycle, using an iterative version of Tarjan's algorithm.
+
+  Args:
+    adjacency:  dict node -> list of nodes; edges to nodes
+                which are not keys of the dict are ignored
+
+  Returns:
+    list of sorted lists of nodes, sorted
+  """
+  index = {}
+  lowlink = {}
+  on_stack = set()
+  stack = []
+  cycles = []
+  next_index = 0
+  for root in adjacency:
+    if root in index:
+      continue
+    work = [(root, iter(adjacency[root]))]
+    index[root] = lowlink[root] = next_index
+    next_index += 1
+    stack.append(root)
+    on_stack.add(root)
+    while work:
+      node, neighbours = work[-1]
+      for neighbour in neighbours:
+        if neighbour not in adjacency:
+          continue
+        if neighbour not in index:
+          index[neighbour] = lowlink[neighbour] = next_index
+          next_index += 1
+          stack.append(neighbour)
+          on_stack.add(neighbour)
+          work.append((neighbour, iter(adjacency[neighbour])))
+          break
+        if neighbour in on_stack:
+          lowlink[node] = min(lowlink[node], index[neighbour])
+      else:
+        work.pop()
+        if work:
+          parent = work[-1][0]
+          lowlink[parent] = min(lowlink[parent], lowlink[node])
+        if lowlink[node] == index[node]:
+          component = []
+          while True:
+            member = stack.pop()
+            on_stack.discard(member)
+            component.append(member)
+            if member == node:
+              break
+          if len(component) > 1 or node in adjacency[node]:
+            cycles.append(sorted(component))
+  return sorted(cycles)
+
+class IntegrityChecker:
+  """
+  Integrity problems of the records, kept up to date while they change.
+
+  The add() and remove() methods must be called after the corresponding
+  methods of the reference graph.
+
+  Args:
+    graph:  the ReferenceGraph of the records
+  """
+
+  def __init__(self, graph):
+    self.graph = graph
+    self.egc_data = None
+    # record ID -> number of records with that ID
+    self.id_counts = Counter()
+    # IDs with a count larger than 1
+    self.duplicate_ids = set()
+    # referenced IDs which are not defined
+    self.dangling = set()
+    # IDs of the units and groups
+    self.definition_ids = set()
+    self.cycles = []
+    # the cycles are up to date if cycles_version == version
+    self.version = 0
+    self.cycles_version = None
+    self.pending = None
+    self.worker = None
+    self.lock = threading.Lock()
+    # number of nested cycles_deferred() blocks, and if a definition
+    # changed in them
+    self.deferring = 0
+    self.deferred = False
+
+  def build(self, egc_data):
+    self.egc_data = egc_data
+    self.id_counts.clear()
+    self.duplicate_ids.clear()
+    self.definition_ids.clear()
+    for record_type in self.graph.kind_of_type:
+      for record in egc_data.find_all(record_type):
+        self._count(record, 1)
+    self.dangling = {ref_id for ref_id in self.graph.in_edges \
+                       if ref_id not in self.id_counts}
+    self.check_cycles()
+
+  def _count(self, record, delta):
+    record_id = self.egc_data.record_id(record)
+    self.id_counts[record_id] += delta
+    if self.id_counts[record_id] > 1:
+      self.duplicate_ids.add(record_id)
+    else:
+      self.duplicate_ids.discard(record_id)
+      if self.id_counts[record_id] <= 0:
+        del self.id_counts[record_id]
+    if record["record_type"] in DEFINITION_RECORD_TYPES:
+      if record_id in self.id_counts:
+        self.definition_ids.add(record_id)
+      else:
+        self.definition_ids.discard(record_id)
+    return record_id
+
+  def _update_dangling(self, ref_ids):
+    # an ID exists as long as any record has it (see id_counts)
+    for ref_id in ref_ids:
+      if ref_id not in self.id_counts and ref_id in self.graph.in_edges:
+        self.dangling.add(ref_id)
+      else:
+        self.dangling.discard(ref_id)
+
+  def _definition_changed(self):
+    if self.deferring:
+      self.deferred = True
+    else:
+      self.check_cycles()
+
+  def add(self, record):
+    record_id = self._count(record, 1)
+    self._update_dangling([record_id] + \
+        record_references(record, self.egc_data))
+    if record["record_type"] in DEFINITION_RECORD_TYPES:
+      self._definition_changed()
+
+  def remove(self, record):
+    record_id = self._count(record, -1)
+    self._update_dangling([record_id] + \
+        record_references(record, self.egc_data))
+    if record["record_type"] in DEFINITION_RECORD_TYPES:
+      self._definition_changed()
+
+  @contextmanager
+  def cycles_deferred(self):
+    """
+    Search the cycles only once, after all changes done in the block
+    (e.g. a bulk change), if any of them changed a unit or group.
+    """
+    self.deferring += 1
+    try:
+      yield
+    finally:
+      self.deferring -= 1
+      if self.deferring == 0 and self.deferred:
+        self.deferred = False
+        self.check_cycles()
+
+  def is_dangling(self, record_id):
+    return record_id in self.dangling
+
+  def check_cycles(self):
+    """
+    Search the cycles in the unit and group definitions in the background.
+
+    Only the version is increased here, so that a change costs O(1); the
+    worker thread copies the references of the definitions when starting
+    a search and, if the records were changed meanwhile, searches again.
+    """
+    with self.lock:
+      self.version += 1
+      self.pending = self.version
+      if self.worker is None:
+        self.worker = threading.Thread(target=self._check_cycles_loop,
+                                       daemon=True)
+        self.worker.start()
+
+  def _adjacency(self):
+    # the copies of the set and dict are atomic; the reference lists
+    # are replaced, not modified, by the graph when records change
+    definition_ids = self.definition_ids.copy()
+    out_edges = self.graph.out_edges.copy()
+    return {record_id: out_edges.get(record_id, []) \
+              for record_id in definition_ids}
+
+  def _check_cycles_loop(self):
+    while True:
+      with self.lock:
+        if self.pending is None:
+          self.worker = None
+          return
+        version = self.pending
+        self.pending = None
+      try:
+        cycles = find_cycles(self._adjacency())
+      except Exception:
+        logger.exception("Failed searching reference cycles")
+        continue
+      with self.lock:
+        self.cycles = cycles
+        self.cycles_version = version
+
+  def wait(self):
+    """
+    Wait until the search of the cycles is done.
+    """
+    worker = self.worker
+    while worker is not None:
+      worker.join()
+      worker = self.worker
+
+  def report(self):
+    with self.lock:
+      cycles = self.cycles
+      cycles_up_to_date = self.cycles_version == self.version
+    return {
+      "n_records": sum(self.id_counts.values()),
+      "dangling_references": [{"id": ref_id,
+          "referred_by": sorted(self.graph.in_edges.get(ref_id, []))} \
+        for ref_id in sorted(self.dangling)],
+      "duplicate_ids": [{"id": record_id,
+          "n_records": self.id_counts[record_id]} \
+        for record_id in sorted(self.duplicate_ids)],
+      "cycles": cycles,
+      "cycles_up_to_date": cycles_up_to_date}
@@ -0,0 +1,363 @@
+#
+# Write-behind journal of the changes to the records.
+#
+# Instead of rewriting the whole EGC file at each change, the changes are
+# appended to a journal file next to it (<egc file>.journal, one JSON
+# object per line). The journal is compacted into the EGC file
+# (i.e. the EGC file is saved and the journal emptied) in the background,
+# some time after the last change, or when the file is downloaded.
+#
+# If the application stops before the journal is compacted, the journal
+# is replayed when the file is loaded again at startup.
+#
+# When multiple processes serve the same file (see wsgi.py), the journal
+# is shared by them: it is written under an exclusive file lock
+# (<egc file>.lock) and each process applies the changes written by the
+# other processes before handling a request; if the journal was compacted
+# by another process in the meantime, the EGC file is reloaded instead.
+#
+# The processes also share which file is served: when a file is loaded
+# (at startup or uploaded), its path is written to a pointer file (under
+# an exclusive lock); before handling a request, each process loads the
+# file of the pointer, if it is not the file it serves.
+#
+# In read-only mode, the journal is replayed, but never compacted
+# into the EGC file.
+#
+
+import os
+import json
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+  import fcntl
+except ImportError: # e.g. on Windows, where a single process is supported
+  fcntl = None
+
+logger = logging.getLogger(__name__)
+
+def _stat(path):
+  try:
+    return os.stat(path)
+  except FileNotFoundError:
+    return None
+
+def file_signature(path):
+  """
+  Modification time and size of a file (None if it does not exist).
+  """
+  st = _stat(path)
+  if st is None:
+    return None
+  return (st.st_mtime_ns, st.st_size)
+
+class Journal:
+  """
+  Journal of the changes to the records of an EGC file.
+
+  Args:
+    compact_delay:  seconds of inactivity after which the changes are
+                    compacted into the EGC file in the background
+    apply_change:   function applying a change (dict with keys
+                    op, id, record) written by another process
+    reload:         function reloading the EGC file, after it was
+                    saved by another process (it must call open())
+    load:           function loading another EGC file (path), after it
+                    was loaded by another process (it must call open())
+    pointer_path:   path of the file containing the path of the EGC file
+                    served by all processes (None: not shared)
+    read_only:      if True, the journal is never compacted
+  """
+
+  def __init__(self, compact_delay=30, apply_change=None, reload=None,
+               load=None, pointer_path=None, read_only=False):
+    self.compact_delay = compact_delay
+    self.apply_change = apply_change
+    self.reload = reload
+    self.load = load
+    self.pointer_path = pointer_path
+    # (inode, mtime, size) of the pointer file, when it was last read
+    self.pointer_signature = None
+    self.read_only = read_only
+    self.egc_data = None
+    self.path = None
+    self.lock_path = None
+    # (inode, size) of the journal, up to which the changes were applied
+    self.position = (None, 0)
+    # signature of the EGC file, when it was last loaded or saved
+    self.file_signature = None
+    self.timer = None
+    self.lock = threading.RLock()
+    self.lock_depth = 0
+    self.lock_file = None
+    atexit.register(self.compact)
+
+  @contextmanager
+  def locked(self):
+    """
+    Exclusive access to the journal, across threads and processes.
+    """
+    with self.lock:
+      if self.lock_depth == 0 and fcntl and self.lock_path:
+        self.lock_file = open(self.lock_path, "a")
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+      self.lock_depth += 1
+      try:
+        yield
+      finally:
+        self.lock_depth -= 1
+        if self.lock_depth == 0 and self.lock_file:
+          fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+          self.lock_file.close()
+          self.lock_file = None
+
+  @contextmanager
+  def changing(self):
+    """
+    Exclusive access to the journal for changing the records,
+    after applying the changes written by other processes.
+    """
+    # a file loaded by another process is loaded before locking,
+    # since the lock is that of the file
+    self._follow_pointer()
+    with self.locked():
+      self.sync()
+      yield
+
+  def _pointer_signature(self):
+    st = _stat(self.pointer_path)
+    if st is None:
+      return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+  @contextmanager
+  def _pointer_locked(self):
+    with open(self.pointer_path + ".lock", "a") as lock_file:
+      if fcntl:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+      yield
+
+  def publish(self, file_path):
+    """
+    Write the path of the EGC file to the pointer file, so that the
+    other processes load it.
+    """
+    if not self.pointer_path:
+      return
+    with self._pointer_locked():
+      tmp_path = f"{self.pointer_path}.{os.getpid()}.tmp"
+      with open(tmp_path, "w") as f:
+        json.dump({"path": os.path.abspath(file_path)}, f)
+      os.replace(tmp_path, self.pointer_path)
+      self.pointer_signature = self._pointer_signature()
+
+  def _follow_pointer(self):
+    """
+    Load the file of the pointer, if the pointer changed and it is not
+    the file served by this process.
+
+    Returns:
+      True if another file was loaded
+    """
+    if not self.pointer_path or \
+        self._pointer_signature() == self.pointer_signature:
+      return False
+    with self._pointer_locked():
+      self.pointer_signature = self._pointer_signature()
+      try:
+        with open(self.pointer_path) as f:
+          file_path = json.load(f)["path"]
+      except (OSError, ValueError, KeyError):
+        return False
+    if self.egc_data is not None and \
+        os.path.abspath(self.egc_data.file_path) == file_path:
+      return False
+    logger.info(f"Loading {file_path}, loaded by another process")
+    self.load(file_path)
+    return True
+
+  def open(self, egc_data, replay=True, compact=True, publish=False):
+    """
+    Start journaling the changes to the records of egc_data.
+
+    If replay is True, the changes in an existing journal of the file
+    are applied to the records and (if compact is True) compacted into
+    the file; otherwise an existing journal is discarded (unless
+    read-only). If publish is True, the path of the file is written to
+    the pointer file, so that the other processes load it.
+    """
+    with self.lock:
+      if self.egc_data is not None and \
+          self.egc_data.file_path != egc_data.file_path:
+        self.compact()
+      else:
+        # the file was replaced or reloaded, thus nothing must be saved
+        self._cancel_compaction()
+      self.egc_data = egc_data
+      self.path = egc_data.file_path + ".journal"
+      self.lock_path = egc_data.file_path + ".lock"
+      with self.locked():
+        self.position = (None, 0)
+        self.file_signature = file_signature(egc_data.file_path)
+        if os.path.exists(self.path):
+          if replay:
+            n_changes = self.replay()
+            logger.info(f"Replayed {n_changes} changes from {self.path}")
+            if compact:
+              self.compact()
+          elif not self.read_only:
+            os.remove(self.path)
+      if publish:
+        self.publish(egc_data.file_path)
+
+  def _read_changes(self, offset):
+    """
+    Read the changes in the journal after the given offset.
+
+    Yields:
+      (change, offset after the change)
+    """
+    with open(self.path, "rb") as f:
+      f.seek(offset)
+      for line in f:
+        offset += len(line)
+        try:
+          change = json.loads(line)
+        except json.JSONDecodeError:
+          # incomplete last line, written while the application stopped
+          logger.warning(f"Skipped invalid journal line: {line!r}")
+          continue
+        yield change, offset
+
+  def replay(self):
+    n_changes = 0
+    inode = os.stat(self.path).st_ino
+    offset = 0
+    for change, offset in self._read_changes(0):
+      if change["op"] == "create":
+        self.egc_data.create(change["record"])
+      elif change["op"] == "update":
+        self.egc_data.update(change["id"], change["record"])
+      elif change["op"] == "delete":
+        self.egc_data.delete(change["id"])
+      n_changes += 1
+    self.position = (inode, offset)
+    return n_changes
+
+  def _is_synced(self):
+    if file_signature(self.egc_data.file_path) != self.file_signature:
+      return False
+    st = _stat(self.path)
+    if st is None:
+      return self.position[0] is None
+    return (st.st_ino, st.st_size) == self.position
+
+  def sync(self):
+    """
+    Load the file loaded by another process, or apply the changes
+    written to the journal by other processes.
+    """
+    if self._follow_pointer():
+      return
+    if self.egc_data is None or self._is_synced():
+      return
+    with self.locked():
+      if file_signature(self.egc_data.file_path) != self.file_signature:
+        logger.info(f"Reloading {self.egc_data.file_path}, "+\
+                    "saved by another process")
+        self.reload()
+        return
+      st = _stat(self.path)
+      if st is None:
+        self.position = (None, 0)
+        return
+      offset = self.position[1] if st.st_ino == self.position[0] else 0
+      for change, offset in self._read_changes(offset):
+        self.apply_change(change)
+      self.position = (st.st_ino, offset)
+
+  def version(self):
+    """
+    Version of the records, which changes with each change and is the same
+    in all processes serving the file, after applying the same changes.
+    """
+    return (self.path, self.file_signature, self.position)
+
+  def last_modified(self):
+    """
+    Time of the last change of the records, in seconds since the epoch.
+    """
+    times = []
+    if self.file_signature:
+      times.append(self.file_signature[0] / 1e9)
+    if self.position[0] is not None:
+      st = _stat(self.path)
+      if st is not None:
+        times.append(st.st_mtime)
+    return max(times) if times else None
+
+  def _append(self, *changes):
+    with self.locked():
+      with open(self.path, "ab") as f:
+        f.write(b"".join(json.dumps(change).encode() + b"\n" \
+                         for change in changes))
+        f.flush()
+        os.fsync(f.fileno())
+        st = os.fstat(f.fileno())
+      self.position = (st.st_ino, st.st_size)
+      self._schedule_compaction()
+
+  def log_create(self, record):
+    self._append({"op": "create", "record": record})
+
+  def log_update(self, record_id, record):
+    self._append({"op": "update", "id": record_id, "record": record})
+
+  def log_delete(self, record_id):
+    self._append({"op": "delete", "id": record_id})
+
+  def log_changes(self, changes):
+    """
+    Write multiple changes (dicts with keys op, id, record) at once.
+    """
+    if changes:
+      self._append(*changes)
+
+  def _cancel_compaction(self):
+    if self.timer:
+      self.timer.cancel()
+      self.timer = None
+
+  def _schedule_compaction(self):
+    self._cancel_compaction()
+    self.timer = threading.Timer(self.compact_delay,
+                                 self._compact_in_background)
+    self.timer.daemon = True
+    self.timer.start()
+
+  def _compact_in_background(self):
+    try:
+      self.compact()
+    except Exception:
+      logger.exception(f"Failed compacting the journal {self.path}")
+
+  def compact(self):
+    """
+    Save the records to the EGC file and empty the journal.
+
+    The changes written by other processes are applied first.
+    """
+    if self.egc_data is None or self.read_only:
+      return
+    with self.locked():
+      self._cancel_compaction()
+      if not os.path.exists(self.path):
+        return
+      self.sync()
+      self.egc_data.save()
+      os.remove(self.path)
+      self.position = (None, 0)
+      self.file_signature = file_signature(self.egc_data.file_path)
@@ -0,0 +1,35 @@
+#
+# EGC lines of the records, shown in the tooltips of the tables.
+#
+# The lines are not embedded in the table pages, but requested by the
+# tooltips when first shown; they are computed by the EGCData when first
+# requested and kept, until the record is changed.
+#
+
+class RecordLines:
+  """
+  Cache of the EGC lines of the records, by record ID.
+  """
+
+  def __init__(self):
+    self.egc_data = None
+    self.lines = {}
+
+  def reset(self, egc_data):
+    self.egc_data = egc_data
+    self.lines.clear()
+
+  def get(self, record_id):
+    """
+    EGC line of a record, or None if the record does not exist.
+    """
+    line = self.lines.get(record_id)
+    if line is None:
+      if not self.egc_data.id_exists(record_id):
+        return None
+      line = self.egc_data.line(record_id)
+      self.lines[record_id] = line
+    return line
+
+  def invalidate(self, record_id):
+    self.lines.pop(record_id, None)
@@ -0,0 +1,152 @@
+#
+# References between records and reverse-reference index.
+#
+# The references of each record are those which are rendered
+# as links to other records in the datatables (see the column templates
+# and the group/unit definition context processors).
+#
+# These are used only for displaying the records (e.g. referenced-by
+# counts, reference graph); whether a record can be deleted is decided
+# by egctools (EGCData.is_ref_by), which resolves the references itself.
+#
+
+import re
+from collections import defaultdict
+from egcwebapp.external_links import link_external_resource
+
+IDENTIFIER_RE = re.compile(r"[a-zA-Z0-9_]+")
+FULL_IDENTIFIER_RE = re.compile(r"^([a-zA-Z0-9_]+)$")
+DERIVED_RE = re.compile(r"^derived:([a-zA-Z0-9_]+):.*")
+HOMOLOG_RE = re.compile(r"^homolog:([a-zA-Z0-9_]+)")
+EXTERNAL_RE = re.compile(r"^(.+):([^!#]+)([!#].*)?$")
+
+CATEGORY_BASE_TYPES = ['family_or_domain', 'function', 'ortholog_group',
+                       'ortholog_group_category']
+CATEGORY_RESOURCES = ['InterPro', 'Pfam', 'TC', 'Pfam_clan', 'CDD', 'EC',
+                      'BRENDA_EC', 'GO', 'COG', 'COG_category', 'arCOG']
+
+def group_definition_references(group_type, definition):
+  m = EXTERNAL_RE.match(definition)
+  if m and link_external_resource(m.group(1), m.group(2)):
+    return []
+  if group_type == 'combined' or group_type == 'inverted':
+    return IDENTIFIER_RE.findall(definition)
+  m = DERIVED_RE.match(definition)
+  if m:
+    return [m.group(1)]
+  return []
+
+def unit_definition_references(unit_type, definition):
+  base_type = unit_type['base_type']
+  kind = unit_type['kind']
+  enumerating = unit_type['enumerating']
+  if definition == ".":
+    return []
+  if kind == "category" and base_type in CATEGORY_BASE_TYPES \
+      and unit_type.get('resource', None) in CATEGORY_RESOURCES:
+    return []
+  if definition.startswith("ref:"):
+    return []
+  if not enumerating and unit_type['multi']:
+    simple_type = {"base_type": base_type, "multi": False,
+                   "kind": "simple", "enumerating": False}
+    references = []
+    for part in definition.split(","):
+      references.extend(unit_definition_references(simple_type, part))
+    return references
+  if base_type.endswith('_homologs'):
+    m = HOMOLOG_RE.match(definition)
+    return [m.group(1)] if m else []
+  elif base_type == 'arrangement' and enumerating:
+    return [part for part in definition.split(',') \
+              if FULL_IDENTIFIER_RE.match(part)]
+  elif enumerating:
+    return IDENTIFIER_RE.findall(definition)
+  m = DERIVED_RE.match(definition)
+  return [m.group(1)] if m else []
+
+def _sources(source):
+  return [source] if isinstance(source, str) else list(source)
+
+def record_references(record, egc_data):
+  """
+  IDs of the records referenced by a record, without repetitions.
+  """
+  record_type = record["record_type"]
+  references = []
+  if record_type in ["S", "T"]:
+    document_id = record["document_id"]
+    references.append(egc_data.compose_id("D",
+        document_id["resource_prefix"], document_id["item"]))
+  elif record_type == "U":
+    references.extend(unit_definition_references(record["type"],
+                                                  record["definition"]))
+  elif record_type == "A":
+    references.append(record["unit_id"])
+    mode = record["mode"]
+    if isinstance(mode, dict) and mode.get("mode") and mode.get("reference"):
+      references.append(mode["reference"])
+  elif record_type == "G":
+    references.extend(group_definition_references(record["type"],
+                                                  record["definition"]))
+  elif record_type == "M":
+    references.append(record["unit_id"])
+  elif record_type == "V":
+    references.extend(_sources(record["source"]))
+    references.append(record["attribute"])
+    references.append(record["group"]["id"])
+  elif record_type == "C":
+    references.extend(_sources(record["source"]))
+    if isinstance(record["attribute"], str):
+      references.append(record["attribute"])
+    else:
+      references.append(record["attribute"]["id1"])
+      references.append(record["attribute"]["id2"])
+    references.append(record["group1"]["id"])
+    references.append(record["group2"]["id"])
+  return list(dict.fromkeys(references))
+
+class RefByIndex:
+  """
+  Number of records of each record type which refer to each record ID.
+
+  The index is built in a single pass over all records, when a file
+  is loaded, and updated when records are added or removed.
+  """
+
+  def __init__(self):
+    self.egc_data = None
+    self.counts = defaultdict(lambda: defaultdict(int))
+
+  def build(self, egc_data, record_types):
+    self.egc_data = egc_data
+    self.counts.clear()
+    for record_type in record_types:
+      for record in egc_data.find_all(record_type):
+        self.add(record)
+
+  def add(self, record):
+    record_type = record["record_type"]
+    for ref_id in record_references(record, self.egc_data):
+      self.counts[ref_id][record_type] += 1
+
+  def remove(self, record):
+    record_type = record["record_type"]
+    for ref_id in record_references(record, self.egc_data):
+      ref_by = self.counts.get(ref_id)
+      if ref_by is None or ref_by.get(record_type, 0) == 0:
+        continue
+      ref_by[record_type] -= 1
+      if ref_by[record_type] == 0:
+        del ref_by[record_type]
+      if not ref_by:
+        del self.counts[ref_id]
+
+  def count(self, record_id, ref_by_rt):
+    """
+    Number of records of type ref_by_rt which refer to record_id.
+    """
+    ref_by = self.counts.get(record_id)
+    if ref_by is None:
+      return 0
+    return ref_by.get(ref_by_rt, 0)
@@ -0,0 +1,132 @@
+#
+# Precompiled renderers of the datatable rows of each record kind.
+#
+# For each column of each record kind, the template or context processor
+# used for rendering it is resolved once, when the app is created,
+# so that rendering a row is a loop over a list of callables.
+#
+
+from pathlib import Path
+from markupsafe import Markup, escape
+from egcwebapp.record_kinds import record_kind_info
+from egcwebapp.context import column_context_processors
+from egcwebapp.column_values import column_value
+
+def _template_cell(template):
+  return lambda context: Markup(template.render(context))
+
+def _processor_cell(processor):
+  return lambda context: Markup(processor(context["record"]))
+
+def _value_cell(column):
+  return lambda context: escape(context["record"].get(column, ""))
+
+class RowRenderer:
+  """
+  Renderer of the columns of the records of a record kind.
+
+  Args:
+    app:            the Flask app
+    record_kind:    the record kind
+    base_context:   variables available to all column templates
+                    (e.g. mode and column context processors)
+  """
+
+  def __init__(self, app, record_kind, base_context):
+    self.record_kind = record_kind
+    self.info = record_kind_info[record_kind]
+    self.base_context = base_context
+    env = app.jinja_env
+    templatesdir = Path(app.root_path) / 'templates'
+    self.columns = self.info["table_columns"] + [("tags", "Tags")]
+    self.cells = []
+    for col, collbl in self.columns:
+      specific = f"columns/{record_kind}_{col}.html"
+      generic = f"columns/record_{col}.html"
+      if (templatesdir / specific).exists():
+        cell = _template_cell(env.get_template(specific))
+      elif (templatesdir / generic).exists():
+        cell = _template_cell(env.get_template(generic))
+      elif f"{record_kind}_{col}" in base_context:
+        cell = _processor_cell(base_context[f"{record_kind}_{col}"])
+      elif f"record_{col}" in base_context:
+        cell = _processor_cell(base_context[f"record_{col}"])
+      else:
+        cell = _value_cell(col)
+      self.cells.append(cell)
+    self.actions_cell = _template_cell(\
+        env.get_template("actions_column.html"))
+    if len(self.info["ref_by_kinds"]) > 0:
+      self.ref_by_cell = _template_cell(\
+          env.get_template(f"columns/{record_kind}_ref_by.html"))
+    else:
+      self.ref_by_cell = None
+
+  def context(self, record, egc_data, main=False, prev=None,
+              ancestor_ids=None, in_tooltip=False):
+    context = dict(self.base_context)
+    context.update({
+      "record": record, "record_kind": self.record_kind, "info": self.info,
+      "egc_data": egc_data, "record_id": egc_data.record_id(record),
+      "record_type": record["record_type"],
+      "nested_colspan": self.info["nested_colspan"],
+      "main": main, "prev": prev, "ancestor_ids": ancestor_ids,
+      "in_tooltip": in_tooltip})
+    return context
+
+  def render_cells(self, record, egc_data, **kwargs):
+    """
+    Render the cells of the datatable row of a record, as a list of strings.
+
+    The keyword arguments (main, prev, ancestor_ids, in_tooltip)
+    are passed to the column templates.
+    """
+    context = self.context(record, egc_data, **kwargs)
+    cells = [self.actions_cell(context)]
+    cells.extend(cell(context) for cell in self.cells)
+    if self.ref_by_cell:
+      cells.append(self.ref_by_cell(context))
+    return cells
+
+  def render_row(self, record, egc_data, **kwargs):
+    """
+    Render the datatable row of a record.
+
+    The cells of the table columns contain their plain-text value
+    (see column_values.py) as data-search attribute, which is used by
+    the datatable for filtering, instead of the rendered text (which
+    contains e.g. the icons of the references).
+    """
+    cells = self.render_cells(record, egc_data, **kwargs)
+    search_values = [column_value(record, self.record_kind, col, egc_data) \
+                       for col, collbl in self.info["table_columns"]]
+    attributes = [""] + [f' data-search="{escape(value)}"' \
+                           for value in search_values]
+    attributes.extend([""] * (len(cells) - len(attributes)))
+    return Markup("<tr>" + "".join(f"<td{attrs}> {cell} </td>" \
+                     for attrs, cell in zip(attributes, cells)) + "</tr>")
+
+  def render_columns(self, record, egc_data, **kwargs):
+    """
+    Render the table columns of a record (without the actions and
+    referenced by columns), as a list of (label, html) tuples.
+    """
+    context = self.context(record, egc_data, **kwargs)
+    return [(collbl, cell(context)) \
+              for (col, collbl), cell in zip(self.columns, self.cells)]
+
+def row_renderers(app):
+  """
+  Create the row renderers of all record kinds.
+
+  Returns:
+    dict: record kind -> RowRenderer
+  """
+  base_context = column_context_processors()
+  base_context["mode"] = app.config["MODE"]
+  base_context["static_export"] = app.config.get("STATIC_EXPORT", False)
+  if getattr(app, "instrumentation", None):
+    base_context = app.instrumentation.timed_functions("context",
+                                                       base_context)
+  return {record_kind: RowRenderer(app, record_kind, base_context) \
+            for record_kind in record_kind_info}
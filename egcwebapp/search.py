@@ -0,0 +1,123 @@
+#
+# Full-text search over all records.
+#
+# An inverted index maps each token (lowercase alphanumeric word) of the
+# fields, tags and comment of the records to the IDs of the records
+# containing it. It is built in a single pass over all records, when a file
+# is loaded, and updated when records are added or removed.
+#
+
+import re
+import heapq
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+def _text_values(value):
+  if isinstance(value, dict):
+    for key, item in value.items():
+      if isinstance(item, dict) and "value" in item and "type" in item:
+        # tag: the name and value are searchable, not the type
+        yield key
+        yield from _text_values(item["value"])
+      else:
+        yield from _text_values(item)
+  elif isinstance(value, (list, tuple)):
+    for item in value:
+      yield from _text_values(item)
+  elif value is not None and not isinstance(value, bool):
+    yield str(value)
+
+def tokenize(text):
+  return TOKEN_RE.findall(text.lower())
+
+def record_tokens(record):
+  """
+  Distinct tokens of the fields, tags and comment of a record.
+  """
+  tokens = set()
+  for key, value in record.items():
+    if key == "record_type":
+      continue
+    for text in _text_values(value):
+      tokens.update(tokenize(text))
+  return tokens
+
+class SearchIndex:
+  """
+  Inverted index of the tokens of the records.
+
+  Args:
+    record_kind_info:   the record_kind_info dictionary
+  """
+
+  def __init__(self, record_kind_info):
+    self.kind_of_type = {record_type: record_kind \
+        for record_kind, info in record_kind_info.items() \
+          for record_type in info["record_types"]}
+    self.record_kinds = list(record_kind_info.keys())
+    self.egc_data = None
+    # token -> record kind -> set of record IDs
+    self.postings = defaultdict(lambda: defaultdict(set))
+
+  def build(self, egc_data):
+    self.egc_data = egc_data
+    self.postings.clear()
+    for record_type in self.kind_of_type:
+      for record in egc_data.find_all(record_type):
+        self.add(record)
+
+  def add(self, record):
+    record_kind = self.kind_of_type[record["record_type"]]
+    record_id = self.egc_data.record_id(record)
+    for token in record_tokens(record):
+      self.postings[token][record_kind].add(record_id)
+
+  def remove(self, record):
+    record_kind = self.kind_of_type[record["record_type"]]
+    record_id = self.egc_data.record_id(record)
+    for token in record_tokens(record):
+      by_kind = self.postings.get(token)
+      if by_kind is None or record_kind not in by_kind:
+        continue
+      by_kind[record_kind].discard(record_id)
+      if not by_kind[record_kind]:
+        del by_kind[record_kind]
+      if not by_kind:
+        del self.postings[token]
+
+  def search(self, query, limit=20):
+    """
+    Records containing all tokens of the query.
+
+    Returns:
+      list of (record kind, number of matching records,
+               the first limit IDs of the matching records, sorted)
+      for each record kind with matching records
+    """
+    tokens = set(tokenize(query))
+    if not tokens:
+      return []
+    results = []
+    for record_kind in self.record_kinds:
+      id_sets = []
+      for token in tokens:
+        by_kind = self.postings.get(token)
+        if by_kind is None or record_kind not in by_kind:
+          id_sets = None
+          break
+        id_sets.append(by_kind[record_kind])
+      if not id_sets:
+        continue
+      id_sets.sort(key=len)
+      if len(id_sets) > 1:
+        record_ids = id_sets[0].intersection(*id_sets[1:])
+      else:
+        record_ids = id_sets[0]
+      if record_ids:
+        # the first IDs in sorted order, so that the results do not depend
+        # on the order of the sets (selected in O(n log limit), instead of
+        # sorting all matching records, for frequent words)
+        results.append((record_kind, len(record_ids),
+                        heapq.nsmallest(limit, record_ids)))
+    return results
@@ -0,0 +1,150 @@
+#
+# Snapshots of the parsed EGC files.
+#
+# Parsing a large EGC file takes much longer than unpickling the parsed
+# records. Thus, after a file is parsed, the EGCData object (records and
+# indices) is pickled to a snapshot file, which is used instead of parsing
+# the file again, as long as the file is unchanged, i.e. has the same path,
+# size, modification time and content hash.
+#
+# The snapshot file starts with a header (a line of JSON), containing
+# the key of the parsed file, so that an outdated snapshot is recognized
+# without reading the records. Since unpickling can execute arbitrary
+# code, the header also contains a HMAC of the snapshot, computed with a
+# secret of the server, which is checked before unpickling; furthermore,
+# the snapshots must be stored in a directory which clients cannot write
+# to (i.e. not in the upload directory).
+#
+
+import os
+import hmac
+import json
+import hashlib
+import logging
+import pickle
+import secrets
+from importlib import metadata
+from egctools.egcdata import EGCData
+
+logger = logging.getLogger(__name__)
+
+# to be increased when the format of the snapshots changes
+SNAPSHOT_FORMAT = 2
+
+def _egctools_version():
+  try:
+    return metadata.version("egctools")
+  except metadata.PackageNotFoundError:
+    return None
+
+def file_key(path, chunk_size=1 << 20):
+  """
+  Key identifying the contents of a file: (path, size, mtime, sha256).
+  """
+  path = os.path.abspath(path)
+  st = os.stat(path)
+  sha256 = hashlib.sha256()
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+      sha256.update(chunk)
+  return (path, st.st_size, st.st_mtime_ns, sha256.hexdigest())
+
+def snapshot_path(snapshot_dir, path):
+  """
+  Path of the snapshot of an EGC file.
+  """
+  path = os.path.abspath(path)
+  path_hash = hashlib.sha256(path.encode()).hexdigest()[:16]
+  return os.path.join(snapshot_dir,
+                      f"{os.path.basename(path)}.{path_hash}.snapshot")
+
+def snapshot_secret(path):
+  """
+  Secret for authenticating the snapshots, read from a file; if the file
+  does not exist, it is created with a new random secret.
+  """
+  try:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+  except FileExistsError:
+    pass
+  else:
+    with os.fdopen(fd, "w") as f:
+      f.write(secrets.token_hex(32))
+  with open(path) as f:
+    secret = f.read().strip()
+  if not secret:
+    raise ValueError(f"Empty snapshot secret file {path}")
+  return secret.encode()
+
+def _header(key):
+  return {"format": SNAPSHOT_FORMAT, "egctools": _egctools_version(),
+          "key": list(key)}
+
+def _signature(secret, header, data):
+  signature = hmac.new(secret, digestmod=hashlib.sha256)
+  signature.update(json.dumps(header, sort_keys=True).encode())
+  signature.update(data)
+  return signature.hexdigest()
+
+def load_snapshot(path, key, secret):
+  """
+  Load the EGCData from a snapshot, if it exists, its key matches
+  and its signature is valid.
+
+  Returns:
+    EGCData or None
+  """
+  try:
+    with open(path, "rb") as f:
+      header = json.loads(f.readline())
+      signature = header.pop("signature", None)
+      if header != _header(key):
+        return None
+      data = f.read()
+    if signature is None or not hmac.compare_digest(signature,
+        _signature(secret, header, data)):
+      logger.warning(f"Invalid signature of the snapshot {path}")
+      return None
+    return pickle.loads(data)
+  except FileNotFoundError:
+    return None
+  except Exception:
+    logger.exception(f"Failed reading the snapshot {path}")
+    return None
+
+def save_snapshot(path, key, egc_data, secret):
+  """
+  Write the snapshot of an EGCData (atomically replacing an old one).
+  """
+  tmp_path = f"{path}.{os.getpid()}.tmp"
+  try:
+    data = pickle.dumps(egc_data, protocol=pickle.HIGHEST_PROTOCOL)
+    header = _header(key)
+    header["signature"] = _signature(secret, _header(key), data)
+    with open(tmp_path, "wb") as f:
+      f.write(json.dumps(header, sort_keys=True).encode() + b"\n")
+      f.write(data)
+    os.replace(tmp_path, path)
+  except Exception:
+    logger.exception(f"Failed writing the snapshot {path}")
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+
+def load_egc_data(path, snapshot_dir, secret):
+  """
+  Load an EGC file, from its snapshot in snapshot_dir, if up to date,
+  otherwise by parsing it (and writing a new snapshot).
+
+  Args:
+    secret:   secret for authenticating the snapshots (see snapshot_secret)
+  """
+  key = file_key(path)
+  snapshot = snapshot_path(snapshot_dir, path)
+  egc_data = load_snapshot(snapshot, key, secret)
+  if egc_data is not None:
+    logger.info(f"Loaded {path} from the snapshot {snapshot}")
+    return egc_data
+  egc_data = EGCData.from_file(path)
+  os.makedirs(snapshot_dir, exist_ok=True)
+  save_snapshot(snapshot, key, egc_data, secret)
+  return egc_data
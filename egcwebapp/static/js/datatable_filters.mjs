@@ -1,26 +1,42 @@
-export function addColumnFilters(table) {
-  if (table.data().length === 1) {
+// Add filters to the column headers of a table; the values of the
+// dropdown filters are the facets computed by the server for all records
+// (also those which are not loaded, with server-side processing)
+export async function addColumnFilters(table) {
+  const serverSide = table.page.info().serverSide;
+  if (!serverSide && table.data().length === 1) {
     return;
   }
+  const facetsUrl = $(table.table().node()).data('facets');
+  let facets = [];
+  if (facetsUrl) {
+    try {
+      const response = await fetch(facetsUrl);
+      if (response.ok) {
+        facets = (await response.json()).columns;
+      }
+    } catch (error) {
+      console.error(error);
+    }
+  }
   table.columns().every(function() {
     var column = this;
     var header = $(column.header());
-    var uniqueValues = column.data().unique().sort();
+    const facet = facets[column.index()];
 
     if (header.text().indexOf("Referenced") != -1 || header.text() === "") {
       return;
     }
 
     // In some cases use dropdown filter
-    if (header.text() == 'Type' ||
-        (uniqueValues.length <= 20 && header.text() != "Tags")) {
+    if (facet && facet.values &&
+        (header.text() == 'Type' || facet.values.length <= 20)) {
       var select = $("<select>").appendTo(header).addClass("form-control")
         .addClass("filter")
         .attr("data-placeholder", "Filter " + header.text() + "...")
         .append($("<option>").val("").text(""));
 
-      $.each(uniqueValues, function(index, value) {
-        select.append($("<option>").val(value).text(value));
+      $.each(facet.values, function(index, [value, count]) {
+        select.append($("<option>").val(value).text(`${value} (${count})`));
       });
 
       // Apply filter on select change
@@ -29,7 +45,10 @@ export function addColumnFilters(table) {
         if (value === "") {
           column.search("").draw();
         } else {
-          column.search("^" + value + "$", true, false).draw();
+          // the cells are searched by their plain-text value (data-search
+          // attribute, see renderers.py), which is that of the facets
+          const escaped = $.fn.dataTable.util.escapeRegex(value);
+          column.search("^\\s*" + escaped + "\\s*$", true, false).draw();
         }
       });
     } else { // Otherwise, use text input filter
@@ -1,79 +1,32 @@
-import { initTooltip } from "./tooltips.js";
+import { initLazyTooltip } from "./tooltips.js";
 
 export function initRecordKindSpecificTooltips() {
   $(".document-info").each(function() {
-    const $pmidCell = $(this).prev();
-    const pmid = $pmidCell.text();
-    const url = $pmidCell.parent().next().find("a").attr("href");
-    initDocumentInfoTooltip($(this), pmid, url);
+    if (this._tippy) {
+      return;
+    }
+    const documentId = $(this).prev().data("document-id");
+    const pmid = $(this).prev().text();
+    initLazyTooltip($(this), "article information",
+      () => getDocumentInfoTable(documentId, pmid));
   });
 }
 
-async function initDocumentInfoTooltip(target, pmid, url) {
-  initTooltip(target, "article information",
-    await getDocumentInfoTable(pmid, url));
-}
-
 function parseDocumentInfoJSON(json) {
   const {title, DOI, author, journal} = json;
   const journalTitle = json['container-title'] ? json['container-title'] : '';
   const volume = json.volume || '';
   const issue = json.issue || '';
   const page = json.page || '';
-  const authors = author.map(a => a.given + ' ' + a.family).join(', ');
+  const authors = (author || []).map(a => a.given + ' ' + a.family).join(', ');
 
   return { title, DOI, authors, journalTitle, volume, issue, page };
 }
 
-function extractDoiFromUrl(url) {
-  const doiMatch = url.match(/\/doi\/(.*?)(\?|$)/);
-  if (doiMatch && doiMatch[1]) {
-    console.log("Extracted DOI from URL:", doiMatch[1]);
-    return doiMatch[1];
-  }
-  const doiMatch2 = url.match(/(\/|=)(10\..*?)(\?|$)/);
-  if (doiMatch2 && doiMatch2[2]) {
-    console.log("Extracted DOI from URL:", doiMatch2[2]);
-    return doiMatch2[2];
-  }
-  return null;
-}
-
-async function fetchDoiFromPmid(pmid) {
+// the metadata are fetched (and cached) by the server
+async function fetchDocumentInfoJSON(documentId) {
   const response = await fetch(
-    `https://www.ncbi.nlm.nih.gov/pmc/utils/idconv/v1.0/?ids=${pmid}`
-  );
-  if (!response.ok) {
-    throw new Error("Failed to fetch DOI");
-  }
-  const xml = await response.text();
-  const xmlDoc = $.parseXML(xml);
-  const $xml = $(xmlDoc);
-  const doi = $xml.find("record").attr("doi");
-  if (!doi) {
-    throw new Error("No DOI found");
-  }
-  return doi;
-}
-
-async function doiFromUrlOrPmid(url, pmid) {
-  try {
-    var doi = extractDoiFromUrl(url);
-    if (!doi) {
-      doi = await fetchDoiFromPmid(pmid);
-    }
-    return doi;
-  } catch (error) {
-    console.error(error);
-    return "Error: Failed to fetch DOI";
-  }
-}
-
-async function fetchDocumentInfoJSON(doi) {
-  const url = `http://dx.doi.org/${doi}`;
-  const headers = new Headers();
-  headers.append("Accept", "application/json;q=1");
-  const response = await fetch(url, { headers });
+    `/api/documents/${encodeURIComponent(documentId)}/metadata`);
   if (!response.ok) {
     throw new Error("Failed to fetch JSON information");
   }
@@ -117,10 +70,9 @@ const tooltipTemplate = (pmid, data) => `
   </table>
 `;
 
-async function getDocumentInfoTable(pmid, url) {
+async function getDocumentInfoTable(documentId, pmid) {
   try {
-    const doi = await doiFromUrlOrPmid(url, pmid);
-    const json = await fetchDocumentInfoJSON(doi);
+    const json = await fetchDocumentInfoJSON(documentId);
     const data = parseDocumentInfoJSON(json);
     return tooltipTemplate(pmid, data);
   } catch (error) {
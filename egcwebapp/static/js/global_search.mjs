@@ -0,0 +1,75 @@
+// Search box of the top navigation bar: the records of all kinds
+// containing all words of the query are looked up by the server
+// (/api/search) while typing, and shown grouped by record kind
+
+function escapeHtml(text) {
+  return $("<div>").text(text).html();
+}
+
+function resultsHtml(data) {
+  if (data.results.length == 0) {
+    return `<p>No records found for <i>${escapeHtml(data.query)}</i></p>`;
+  }
+  return data.results.map(group => {
+    const links = group.records.map(record =>
+      `<a href="${record.url}">${escapeHtml(record.id)}</a>`).join(" ");
+    const more = group.n_results > group.records.length ?
+      ` and ${group.n_results - group.records.length} more` : "";
+    return `<div class="global-search-group">
+      <b>${escapeHtml(group.title)}s (${group.n_results})</b>:
+      ${links}${more}</div>`;
+  }).join("");
+}
+
+export function initGlobalSearch(inputSelector, resultsSelector) {
+  const $input = $(inputSelector);
+  const $results = $(resultsSelector);
+  let timer = null;
+  let lastQuery = null;
+
+  async function search() {
+    const query = $input.val().trim();
+    if (query === lastQuery) {
+      return;
+    }
+    lastQuery = query;
+    if (query === "") {
+      $results.hide();
+      return;
+    }
+    try {
+      const response = await fetch(
+        `${$input.data("url")}?q=${encodeURIComponent(query)}`);
+      if (!response.ok) {
+        throw new Error(`Search failed: ${response.status}`);
+      }
+      const data = await response.json();
+      // ignore the responses of outdated queries
+      if (query === lastQuery) {
+        $results.html(resultsHtml(data)).show();
+      }
+    } catch (error) {
+      console.error(error);
+    }
+  }
+
+  $input.on("input", function() {
+    clearTimeout(timer);
+    timer = setTimeout(search, 200);
+  });
+  $input.on("focus", function() {
+    if ($input.val().trim() !== "") {
+      $results.show();
+    }
+  });
+  $input.on("keydown", function(event) {
+    if (event.key === "Escape") {
+      $results.hide();
+    }
+  });
+  $(document).on("click", function(event) {
+    if (!$(event.target).closest(`${inputSelector}, ${resultsSelector}`).length) {
+      $results.hide();
+    }
+  });
+}
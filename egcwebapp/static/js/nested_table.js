@@ -1,37 +1,44 @@
 import { addColumnFilters } from './datatable_filters.mjs';
+import { initRelatedTooltips, initEgcTooltips, invalidateRecordTooltips }
+  from './tooltips.js';
 
-export function openNestedTable(thisRecordsName, nestedRecordsName, colspan) {
-  return function(event) {
-    event.preventDefault();
-    var $count = $(this).closest(`.count-${thisRecordsName}-${nestedRecordsName}`);
-    var ancestorIds = $count.data('ancestor-ids');
-    var $currentRow = $count.closest('tr');
-    const msg = `${nestedRecordsName} which refer to ${ancestorIds}`;
-
-    $.ajax({
-      url: `/api/${thisRecordsName}/${ancestorIds}/${nestedRecordsName}`,
-      type: 'GET',
-      success: function(response) {
-        console.log(`Success fetching ${msg}`);
-
-        const nestedClassName = `nested-${nestedRecordsName}`;
-        // Remove existing nested table if any
-        if ($currentRow.next(`.${nestedClassName}`).length > 0) {
-          $currentRow.next(`.${nestedClassName}`).remove();
-        }
-
-        var $newRow = $(`<tr class="${nestedClassName}"></tr>`);
-        var $newCell = $(`<td colspan="${colspan}"></td>`);
-
-        $newCell.append(response);
-        $newRow.append($newCell);
-        $currentRow.after($newRow);
-      },
-      error: function(response) {
-        console.log(`Error fetching ${msg}:`, response);
+// Open the nested table of the records which refer to a record;
+// the record kinds are given by the data attributes of the link,
+// the number of columns of the nested table by those of the table
+export function openRefByNested(event) {
+  event.preventDefault();
+  const thisRecordsName = $(this).data('records');
+  const nestedRecordsName = $(this).data('nested-records');
+  const colspan = $(this).closest('table').data('colspan');
+  var $count = $(this).closest(`.count-${thisRecordsName}-${nestedRecordsName}`);
+  var ancestorIds = $count.data('ancestor-ids');
+  var $currentRow = $count.closest('tr');
+  const msg = `${nestedRecordsName} which refer to ${ancestorIds}`;
+
+  $.ajax({
+    url: `/api/${thisRecordsName}/${ancestorIds}/${nestedRecordsName}`,
+    type: 'GET',
+    success: function(response) {
+      console.log(`Success fetching ${msg}`);
+
+      const nestedClassName = `nested-${nestedRecordsName}`;
+      // Remove existing nested table if any
+      if ($currentRow.next(`.${nestedClassName}`).length > 0) {
+        $currentRow.next(`.${nestedClassName}`).remove();
       }
-    });
-  }
+
+      var $newRow = $(`<tr class="${nestedClassName}"></tr>`);
+      var $newCell = $(`<td colspan="${colspan}"></td>`);
+
+      $newCell.append(response);
+      $newRow.append($newCell);
+      $currentRow.after($newRow);
+      initTables($newCell);
+    },
+    error: function(response) {
+      console.log(`Error fetching ${msg}:`, response);
+    }
+  });
 }
 
 export function openEditForm(event) {
@@ -73,6 +80,14 @@ export function cancelNestedEditForm(event) {
     $currentRow.remove();
 }
 
+// IDs of the records shown in a table row, i.e. the record of the row
+// and those it refers to, whose tooltips change when the record changes
+function rowRecordIds($row) {
+  return $row.find('[data-record-id], [data-related-id]').map(function() {
+    return String($(this).data('record-id') ?? $(this).data('related-id'));
+  }).get();
+}
+
 export function submitNestedEditForm(event) {
   event.preventDefault();
 
@@ -95,8 +110,13 @@ export function submitNestedEditForm(event) {
       // - html: string
       if (response.success) {
         console.log(`Success updating ${recordKind} ${recordId}`);
-        $currentRow.prev().replaceWith(response.html);
+        const $table = $currentRow.closest('table');
+        const $newRow = $($.parseHTML(response.html));
+        invalidateRecordTooltips([recordId,
+          ...rowRecordIds($currentRow.prev()), ...rowRecordIds($newRow)]);
+        $currentRow.prev().replaceWith($newRow);
         $currentRow.remove();
+        initTableTooltips($table);
       } else {
         console.log(`Failure updating ${recordKind} ${recordId}`);
         const colspan = $currentRow.children('td').attr('colspan');
@@ -130,8 +150,12 @@ export function submitCopyNestedEditForm(event) {
       const $currentRow = $form.closest('tr');
       if (response.success) {
         console.log(`Success creating copy of ${recordKind} ${recordId}`);
-        $currentRow.prev().after(response.html);
+        const $table = $currentRow.closest('table');
+        const $newRow = $($.parseHTML(response.html));
+        invalidateRecordTooltips(rowRecordIds($newRow));
+        $currentRow.prev().after($newRow);
         $currentRow.remove();
+        initTableTooltips($table);
       } else {
         console.log(`Failure creating copy of ${recordKind} ${recordId}`);
         const colspan = $currentRow.children('td').attr('colspan');
@@ -156,48 +180,104 @@ export function initNestedTable(table_id, drawCallback) {
 }
 
 export function initMainTable(table_id, drawCallback) {
-  var table = $('#' + table_id).DataTable({
+  const $table = $('#' + table_id);
+  var options = {
     "drawCallback": drawCallback
-  });
+  };
+  // tables with many records (above the EGCWEBAPP_SERVER_SIDE_THRESHOLD)
+  // are filtered, sorted and paginated on the server
+  const serverSideUrl = $table.data('server-side');
+  if (serverSideUrl) {
+    options["serverSide"] = true;
+    options["processing"] = true;
+    options["ajax"] = serverSideUrl;
+    options["order"] = [];
+    options["searchDelay"] = 400;
+  }
+  var table = $table.DataTable(options);
   addColumnFilters(table);
   return table;
 }
 
-export function openRelatedNested(thisRecordsName, nestedRecordsName, colspan) {
-  return function(event) {
-    event.preventDefault();
-    var $link = $(this).closest(`.related-${thisRecordsName}-${nestedRecordsName}`);
-    var relatedId = $link.data('related-id');
-    var ancestorIds = $link.data('ancestor-ids');
-    var $currentRow = $link.closest('tr');
-    const msg = `${nestedRecordsName} '${relatedId}' related to: ${ancestorIds}`;
-
-    $.ajax({
-      url: `/api/ref/${ancestorIds}/${nestedRecordsName}/${relatedId}`,
-      type: 'GET',
-      success: function(response) {
-        console.log(`Success fetching ${msg}`);
-
-        const nestedClassName = `nested-${nestedRecordsName}`;
-        // Remove existing nested table if any
-        if ($currentRow.next(`.${nestedClassName}`).length > 0) {
-          $currentRow.next(`.${nestedClassName}`).remove();
-        }
-
-        var $newRow = $(`<tr class="${nestedClassName}"></tr>`);
-        var $newCell = $(`<td colspan="${colspan}"></td>`);
-        $newCell.append(response);
-        $newRow.append($newCell);
-        $currentRow.after($newRow);
-        console.log(`Done with ${msg}`);
-      },
-      error: function(response) {
-        console.log(`Error fetching ${msg}:`, response);
+// Open the nested table of a record referred to by another record;
+// the record kinds are given by the data attributes of the link
+export function openRelatedNested(event) {
+  event.preventDefault();
+  var $link = $(this);
+  const nestedRecordsName = $link.data('related-records');
+  const colspan = $link.closest('table').data('colspan');
+  var relatedId = $link.data('related-id');
+  var ancestorIds = $link.data('ancestor-ids');
+  var $currentRow = $link.closest('tr');
+  const msg = `${nestedRecordsName} '${relatedId}' related to: ${ancestorIds}`;
+
+  $.ajax({
+    url: `/api/ref/${ancestorIds}/${nestedRecordsName}/${relatedId}`,
+    type: 'GET',
+    success: function(response) {
+      console.log(`Success fetching ${msg}`);
+
+      const nestedClassName = `nested-${nestedRecordsName}`;
+      // Remove existing nested table if any
+      if ($currentRow.next(`.${nestedClassName}`).length > 0) {
+        $currentRow.next(`.${nestedClassName}`).remove();
       }
-    });
+
+      var $newRow = $(`<tr class="${nestedClassName}"></tr>`);
+      var $newCell = $(`<td colspan="${colspan}"></td>`);
+      $newCell.append(response);
+      $newRow.append($newCell);
+      $currentRow.after($newRow);
+      initTables($newCell);
+      console.log(`Done with ${msg}`);
+    },
+    error: function(response) {
+      console.log(`Error fetching ${msg}:`, response);
+    }
+  });
+}
+
+// Initialize the tooltips of the rows of a table, and of the pages
+// referred to in it; the record kinds are given by its data attributes
+export function initTableTooltips(table) {
+  const $table = $(table);
+  initEgcTooltips();
+  const refKinds = String($table.data('ref-kinds') || '');
+  for (const relatedKind of refKinds.split(',').filter(kind => kind)) {
+    initRelatedTooltips(`.${relatedKind}-info`, `${relatedKind}s`);
   }
+  const tooltipJs = $table.data('tooltip-js');
+  if (tooltipJs) {
+    import(tooltipJs).then(module => module.initRecordKindSpecificTooltips());
+  }
+}
+
+// Initialize the datatables in the given element (e.g. a nested table
+// just loaded), which are not initialized yet
+export function initTables(container) {
+  $(container).find('table[data-record-kind]').each(function() {
+    if ($.fn.dataTable.isDataTable(this)) {
+      return;
+    }
+    const table = this;
+    const drawCallback = function() { initTableTooltips(table); };
+    if ($(table).data('main')) {
+      initMainTable(table.id, drawCallback);
+    } else {
+      initNestedTable(table.id, drawCallback);
+    }
+  });
 }
 
+// Event handlers of the links and forms in the tables, delegated
+// to the document, thus bound once, independently of the number of rows
+$(document).on('click', 'a.edit-record', openEditForm);
+$(document).on('click', 'a.show-ref-by', openRefByNested);
+$(document).on('click', 'a.related-nested', openRelatedNested);
+$(document).on('submit', 'form.nested-edit-form', submitNestedEditForm);
+$(document).on('click', 'button.copy-nested-record',
+               submitCopyNestedEditForm);
+$(document).on('click', 'button.cancel-nested-record', cancelNestedEditForm);
 
 function addCloseButton(table_id) {
   const buttonId = `close-nested-table-${table_id}`;
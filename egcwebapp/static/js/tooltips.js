@@ -1,5 +1,5 @@
-// Initialize Tippy.js tooltip
-export async function initTooltip(target, loading, content) {
+// Initialize Tippy.js tooltip, whose content is loaded when first shown
+export function initLazyTooltip(target, loading, loadContent) {
   tippy(target[0], {
     content: "Loading " + loading + "...",
     allowHTML: true,
@@ -8,32 +8,147 @@ export async function initTooltip(target, loading, content) {
     hideOnClick: true,
     maxWidth: 700,
     onShow: async (instance) => {
-      instance.setContent(content);
+      instance.setContent(await loadContent());
     },
   });
 }
 
+// In a static export of the site (see export.py), the data are only
+// available as the exported files, which can be fetched by GET requests
+function isStaticExport() {
+  return document.body.dataset.staticExport === "true";
+}
+
+function escapeHtml(text) {
+  return $("<div>").text(text).html();
+}
+
+// EGC lines of the records, fetched when their tooltip is first shown
+const egcLines = new Map();
+
+function fetchEgcLine(recordId) {
+  if (!egcLines.has(recordId)) {
+    const url = `/api/records/${encodeURIComponent(recordId)}/line`;
+    egcLines.set(recordId, fetch(url).then(response => {
+      if (!response.ok) {
+        throw new Error(`Failed to fetch EGC line of ${recordId}`);
+      }
+      return response.json();
+    }).then(data => {
+      const line = escapeHtml(data.line).replaceAll("\t",
+        "<span class='tab'>&#8594;</span>");
+      return `<div class="egcline">${line}</div>`;
+    }).catch(error => {
+      console.error(error);
+      // allow a new attempt at the next hover
+      egcLines.delete(recordId);
+      return "<p>Error: Failed to fetch EGC data</p>";
+    }));
+  }
+  return egcLines.get(recordId);
+}
+
 export async function initEgcTooltips() {
-  $(".egc-tooltip").each(async function () {
-    await initTooltip($(this), "EGC data", $(this).data("content"));
+  $(".egc-tooltip").each(function () {
+    if (this._tippy) {
+      return;
+    }
+    const recordId = String($(this).data("record-id"));
+    initLazyTooltip($(this), "EGC data", () => fetchEgcLine(recordId));
   });
 }
 
-export async function initRelatedTooltips(infoclass, collection) {
-  $(infoclass).each(async function() {
-    const recordId = $(this).prev().data('related-id');
-    try {
-      const response = await fetch(`/api/${collection}/${recordId}`);
-      if (!response.ok) {
-        console.error(`Failed to fetch record information for ID ${recordId}`);
-        return "<p>Error: Failed to fetch record information</p>";
+const recordFetchError = "<p>Error: Failed to fetch record information</p>";
+
+// Tooltip tables of the records, shared by all tables of the page;
+// the values are promises, so that each record is fetched only once
+const recordTables = new Map();
+
+// maximum number of records fetched by a single request
+const maxBatchSize = 100;
+
+// Remove the cached EGC lines and tooltip tables of the given records,
+// after they were changed in the page, so that they are fetched again
+export function invalidateRecordTooltips(recordIds) {
+  for (const recordId of recordIds) {
+    egcLines.delete(String(recordId));
+    recordTables.delete(String(recordId));
+  }
+}
+
+// Fetch in a single request the tooltip tables of the given records
+// which are not in the cache yet (at most maxBatchSize, in the given order)
+function fetchRecordTables(collection, recordIds) {
+  const missing = [...new Set(recordIds)].filter(id => !recordTables.has(id))
+                                         .slice(0, maxBatchSize);
+  if (missing.length == 0) {
+    return;
+  }
+  if (isStaticExport()) {
+    // the tooltip table of each record is an exported file
+    for (const recordId of missing) {
+      const url = `/api/${collection}/${encodeURIComponent(recordId)}`;
+      recordTables.set(recordId, fetch(url).then(response => {
+        if (!response.ok) {
+          throw new Error(`Failed to fetch record information: ${recordId}`);
+        }
+        return response.text();
+      }).then(table => `<div class="tooltip-table">${table}</div>`,
+              error => {
+        console.error(error);
+        recordTables.delete(recordId);
+        return recordFetchError;
+      }));
+    }
+    return;
+  }
+  const request = fetch(`/api/${collection}/batch`, {
+    method: 'POST',
+    headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify({ids: missing}),
+  }).then(response => {
+    if (!response.ok) {
+      throw new Error(`Failed to fetch records information: ${missing}`);
+    }
+    return response.json();
+  });
+  for (const recordId of missing) {
+    recordTables.set(recordId, request.then(tables => {
+      if (!(recordId in tables)) {
+        return recordFetchError;
       }
-      const table = await response.text();
-      const html = `<div class="tooltip-table">${table}</div>`
-      initTooltip($(this), "Record", html);
-    } catch (error) {
-      console.error(`Failed to fetch record information for ID ${recordId}:`, error);
-      return "<p>Error: Failed to fetch record information</p>";
+      return `<div class="tooltip-table">${tables[recordId]}</div>`;
+    }, error => recordFetchError));
+  }
+  request.catch(error => {
+    console.error(error);
+    // allow a new attempt at the next hover
+    missing.forEach(recordId => recordTables.delete(recordId));
+  });
+}
+
+function relatedId(infoIcon) {
+  return String($(infoIcon).prev().data('related-id'));
+}
+
+export async function initRelatedTooltips(infoclass, collection) {
+  $(infoclass).each(function() {
+    if (this._tippy) {
+      return;
     }
+    const recordId = relatedId(this);
+    const infoIcon = this;
+    initLazyTooltip($(this), "Record", async function() {
+      // fetch together with the record those of the collection which are
+      // closest to it in the page, i.e. most likely to be hovered next
+      const pageIcons = $(infoclass).get();
+      const position = pageIcons.indexOf(infoIcon);
+      const pageIds = pageIcons
+        .map((icon, i) => [Math.abs(i - position), relatedId(icon)])
+        .sort((a, b) => a[0] - b[0])
+        .map(([distance, id]) => id);
+      fetchRecordTables(collection, [recordId, ...pageIds]);
+      return await recordTables.get(recordId);
+    });
   });
 }
@@ -0,0 +1,87 @@
+#
+# Streaming transfer of EGC files between the browser and the server.
+#
+# The files are written to (and read from) the disk chunk by chunk,
+# optionally gzip-compressed, so that the memory used by the server
+# does not depend on the size of the file. The size of the received files,
+# after decompression, is limited, so that a small compressed request
+# cannot fill the disk.
+#
+
+import os
+import zlib
+
+CHUNK_SIZE = 1 << 16
+
+# wbits value for the gzip format in zlib
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+class FileTooLargeError(Exception):
+  pass
+
+def receive_file(stream, path, gzipped=False, chunk_size=CHUNK_SIZE,
+                 max_size=None):
+  """
+  Write the contents of a stream (e.g. a request body) to a file.
+
+  The file is written to a temporary file first and renamed when complete,
+  so that an interrupted transfer does not overwrite an existing file.
+
+  Raises:
+    FileTooLargeError, if the file (after decompression) is larger
+    than max_size bytes; the temporary file is then removed
+
+  Returns:
+    number of bytes written
+  """
+  decompressor = zlib.decompressobj(GZIP_WBITS) if gzipped else None
+  tmp_path = f"{path}.{os.getpid()}.part"
+  n_bytes = 0
+  try:
+    with open(tmp_path, "wb") as f:
+
+      def write(chunk):
+        nonlocal n_bytes
+        n_bytes += len(chunk)
+        if max_size is not None and n_bytes > max_size:
+          raise FileTooLargeError(f"The file is larger than {max_size} bytes")
+        f.write(chunk)
+
+      while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+          break
+        if decompressor:
+          # limit the size of the decompressed data kept in memory
+          write(decompressor.decompress(chunk, chunk_size))
+          while decompressor.unconsumed_tail:
+            write(decompressor.decompress(decompressor.unconsumed_tail,
+                                          chunk_size))
+        else:
+          write(chunk)
+      if decompressor:
+        write(decompressor.flush())
+        if not decompressor.eof:
+          raise ValueError("Incomplete gzip stream")
+    os.replace(tmp_path, path)
+  finally:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+  return n_bytes
+
+def file_chunks(path, gzipped=False, chunk_size=CHUNK_SIZE):
+  """
+  Generator of the (optionally gzip-compressed) chunks of a file.
+  """
+  compressor = zlib.compressobj(6, zlib.DEFLATED, GZIP_WBITS) \
+                 if gzipped else None
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+      if compressor:
+        chunk = compressor.compress(chunk)
+        if chunk:
+          yield chunk
+      else:
+        yield chunk
+  if compressor:
+    yield compressor.flush()
@@ -0,0 +1,76 @@
+#
+# Entry point for multi-process deployments.
+#
+# The EGC file is loaded once, in the master process, before the worker
+# processes are forked, so that the workers share the parsed records
+# (copy-on-write) instead of each parsing the file and keeping its own copy.
+# Changes done by a worker are applied by the other workers before
+# they handle the next request (see journal.py).
+#
+# Usage with any WSGI server supporting preloading, e.g.:
+#
+#   EGCWEBAPP_FILE=data.egc gunicorn --preload -w 4 egcwebapp.wsgi:app
+#
+# or using the command line interface (requires gunicorn):
+#
+#   python3 -m egcwebapp.wsgi data.egc --workers 4
+#
+
+import os
+import gc
+import argparse
+from egcwebapp.app import create_app
+
+def create_wsgi_app(egc_file=None):
+  """
+  Create the application, loading the EGC file given as argument
+  or by the EGCWEBAPP_FILE environment variable.
+  """
+  app = create_app(egc_file or os.environ.get('EGCWEBAPP_FILE'))
+  # move the loaded objects out of the reach of the garbage collector,
+  # which would otherwise touch (and thus copy) their memory pages
+  # in each worker process
+  gc.freeze()
+  return app
+
+def __getattr__(name):
+  # the app is created on first access, so that importing the module
+  # (e.g. for the command line interface) does not load the file
+  if name == "app":
+    global app
+    app = create_wsgi_app()
+    return app
+  raise AttributeError(name)
+
+def main():
+  parser = argparse.ArgumentParser(description=\
+      "Serve an EGC file using multiple worker processes")
+  parser.add_argument("egc_file", help="EGC file to serve")
+  parser.add_argument("--workers", "-w", type=int,
+      default=os.cpu_count() or 1, help="number of worker processes "+\
+          "(default: number of CPUs)")
+  parser.add_argument("--bind", "-b", default="127.0.0.1:8000",
+      help="address to listen on (default: 127.0.0.1:8000)")
+  parser.add_argument("--threads", type=int, default=1,
+      help="number of threads for each worker process (default: 1)")
+  args = parser.parse_args()
+  try:
+    from gunicorn.app.base import BaseApplication
+  except ImportError:
+    parser.error("gunicorn is required, install it using: "+\
+                 "pip install gunicorn")
+
+  class Server(BaseApplication):
+    def load_config(self):
+      self.cfg.set("bind", args.bind)
+      self.cfg.set("workers", args.workers)
+      self.cfg.set("threads", args.threads)
+      self.cfg.set("preload_app", True)
+
+    def load(self):
+      return create_wsgi_app(args.egc_file)
+
+  Server().run()
+
+if __name__ == "__main__":
+  main()
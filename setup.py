@@ -16,6 +16,9 @@ setup(name='egcwebapp',
       long_description_content_type="text/markdown",
       install_requires=[
       ],
+      extras_require={
+        'server': ['gunicorn'],
+      },
       url='https://github.com/ggonnella/egcwebapp',
       keywords="genomes, rules, expectations",
       author='Giorgio Gonnella',
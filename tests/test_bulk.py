@@ -0,0 +1,206 @@
+#
+# Tests of the validation and application of bulk changes (bulk.py),
+# with a fake EGCData; the records are not validated by the forms here
+# (see CheckedBulkChanges), only the effect of the order of the changes.
+#
+
+import io
+import json
+import pytest
+from wtforms import validators
+from egcwebapp.bulk import PendingEGCData, BulkChanges, BulkInputError, \
+                           apply_changes, parse_json_changes
+
+def group(record_id, definition="taxid:1", group_type="taxonomic"):
+  return {"record_type": "G", "id": record_id, "type": group_type,
+          "name": record_id, "definition": definition}
+
+class FakeEGCData:
+  """
+  Records with the methods of EGCData used by the bulk changes; the
+  references resolved by egctools are given explicitly (referrer ID ->
+  referenced IDs), so that they can differ from those of the webapp.
+  """
+
+  def __init__(self, records, references=None):
+    self.records = {record["id"]: record for record in records}
+    self.references = references or {}
+
+  def record_id(self, record):
+    return record["id"]
+
+  def find(self, record_id):
+    return self.records.get(record_id)
+
+  def find_all(self, record_type):
+    return [record for record in self.records.values() \
+              if record["record_type"] == record_type]
+
+  def id_exists(self, record_id):
+    return record_id in self.records
+
+  def ref_by(self, record_type, record_id, ref_by_rt):
+    return [record for record in self.find_all(ref_by_rt) \
+              if record_id in self.references.get(record["id"], [])]
+
+  def is_ref_by(self, record_id):
+    return any(record_id in references \
+                 for references in self.references.values())
+
+  def create(self, record):
+    self.records[record["id"]] = record
+
+  def delete(self, record_id):
+    del self.records[record_id]
+
+class CheckedBulkChanges(BulkChanges):
+  """
+  Bulk changes whose records are accepted as given, unless they have
+  the name "invalid".
+  """
+
+  def _validated_record(self, record, old_id=None):
+    if not isinstance(record, dict):
+      raise validators.ValidationError("A record must be a JSON object")
+    if record.get("name") == "invalid":
+      return None, {"name": ["Invalid name"]}
+    if record["id"] != old_id and self.pending.id_exists(record["id"]):
+      raise validators.ValidationError("Record ID already exists")
+    return record, None
+
+@pytest.fixture
+def egc_data():
+  # g2 refers to g1 according to both the webapp and egctools;
+  # g3 refers to g4 only according to egctools
+  return FakeEGCData([group("g1"), group("g2", "g1 + g5", "combined"),
+                      group("g3"), group("g4")],
+                     {"g2": ["g1", "g5"], "g3": ["g4"]})
+
+def test_pending_egc_data(egc_data):
+  pending = PendingEGCData(egc_data)
+  pending.create(group("g9"))
+  pending.delete("g1")
+  pending.update("g3", group("g3b"))
+  assert pending.id_exists("g9") and pending.find("g9")["id"] == "g9"
+  assert not pending.id_exists("g1") and pending.find("g1") is None
+  assert not pending.id_exists("g3") and pending.id_exists("g3b")
+  assert pending.find("g2") is egc_data.find("g2")
+  # other methods are those of the EGCData
+  assert pending.record_id(group("g7")) == "g7"
+  # deleted and created again
+  pending.create(group("g1", "taxid:2"))
+  assert pending.find("g1")["definition"] == "taxid:2"
+  # the EGCData is not changed
+  assert sorted(egc_data.records) == ["g1", "g2", "g3", "g4"]
+
+def test_valid_changes(egc_data):
+  changes = [{"op": "create", "record": group("g9")},
+             {"op": "update", "id": "g9", "record": group("g10")},
+             {"op": "delete", "id": "g10"},
+             {"op": "update", "id": "g4", "record": group("g4", "taxid:4")}]
+  validated, errors = CheckedBulkChanges(egc_data).validate_all(changes)
+  assert errors == []
+  assert validated == changes
+
+def test_all_errors_are_reported(egc_data):
+  changes = [{"op": "create", "record": group("g9")},
+             {"op": "rename", "id": "g1"},
+             {"op": "delete", "id": "g99"},
+             {"op": "create", "record": group("g1")},
+             {"op": "create", "record": dict(group("g8"), name="invalid")},
+             {"op": "delete", "id": "g9"}]
+  validated, errors = CheckedBulkChanges(egc_data).validate_all(changes)
+  assert [error["index"] for error in errors] == [1, 2, 3, 4]
+  assert [error["id"] for error in errors] == ["g1", "g99", "g1", "g8"]
+  assert "op" in errors[0]["errors"]
+  assert errors[3]["errors"] == {"name": ["Invalid name"]}
+  assert len(validated) == 2
+
+def test_changes_are_validated_in_order(egc_data):
+  bulk = CheckedBulkChanges(egc_data)
+  # deleted before being created
+  validated, errors = bulk.validate_all([
+    {"op": "delete", "id": "g9"}, {"op": "create", "record": group("g9")}])
+  assert [error["index"] for error in errors] == [0]
+  # an ID can be reused after deleting its record
+  validated, errors = CheckedBulkChanges(egc_data).validate_all([
+    {"op": "delete", "id": "g3"}, {"op": "delete", "id": "g4"},
+    {"op": "create", "record": group("g4")}])
+  assert errors == []
+  # g4 is referenced by g3 when it is deleted, thus it is not deleted
+  # and cannot be created again
+  validated, errors = CheckedBulkChanges(egc_data).validate_all([
+    {"op": "delete", "id": "g4"}, {"op": "delete", "id": "g3"},
+    {"op": "create", "record": group("g4")}])
+  assert [error["index"] for error in errors] == [0, 2]
+
+def test_referenced_records_are_not_deleted(egc_data):
+  for record_id in ["g1", "g4"]:
+    validated, errors = CheckedBulkChanges(egc_data).validate_all(
+        [{"op": "delete", "id": record_id}])
+    assert errors[0]["errors"] == \
+        {"id": ["Record is referenced by other records"]}
+
+def test_referrer_deleted_before(egc_data):
+  # the reference of g3 to g4 is known only by egctools
+  for referrer, target in [("g2", "g1"), ("g3", "g4")]:
+    validated, errors = CheckedBulkChanges(egc_data).validate_all([
+      {"op": "delete", "id": referrer}, {"op": "delete", "id": target}])
+    assert errors == []
+
+def test_references_of_changed_records(egc_data):
+  # the reference is removed by an update of the referrer
+  validated, errors = CheckedBulkChanges(egc_data).validate_all([
+    {"op": "update", "id": "g2", "record": group("g2")},
+    {"op": "delete", "id": "g1"}])
+  assert errors == []
+  # the reference is added by a record created before
+  validated, errors = CheckedBulkChanges(egc_data).validate_all([
+    {"op": "create", "record": group("g9", "g3 + g4", "combined")},
+    {"op": "delete", "id": "g3"}])
+  assert [error["index"] for error in errors] == [1]
+
+def test_apply_changes(egc_data):
+  applied = []
+  apply_changes([1, 2, 3], applied.append, rollback=None)
+  assert applied == [1, 2, 3]
+
+def test_apply_changes_rollback(egc_data):
+  rollbacks = []
+
+  def apply_change(change):
+    if change["op"] == "fail":
+      raise RuntimeError("failed")
+    egc_data.delete(change["id"])
+
+  def rollback():
+    rollbacks.append(True)
+    egc_data.records = {record["id"]: record \
+                          for record in [group("g1"), group("g3")]}
+
+  with pytest.raises(RuntimeError):
+    apply_changes([{"op": "delete", "id": "g1"}, {"op": "fail"},
+                   {"op": "delete", "id": "g3"}], apply_change, rollback)
+  assert rollbacks == [True]
+  assert sorted(egc_data.records) == ["g1", "g3"]
+
+def test_parse_json_lines():
+  stream = io.BytesIO(b'{"op": "delete", "id": "g1"}\n\n' + \
+                      json.dumps(group("g9")).encode() + b"\n")
+  changes = list(parse_json_changes(stream, lines=True))
+  assert changes == [{"op": "delete", "id": "g1"},
+                     {"op": "create", "record": group("g9")}]
+  changes = parse_json_changes(io.BytesIO(b'{"op": "delete"}\n{bad\n'),
+                               lines=True)
+  assert next(changes) == {"op": "delete"}
+  with pytest.raises(BulkInputError, match="line 2"):
+    next(changes)
+
+def test_parse_json():
+  stream = io.BytesIO(json.dumps({"changes": [group("g9")]}).encode())
+  assert parse_json_changes(stream) == \
+      [{"op": "create", "record": group("g9")}]
+  with pytest.raises(BulkInputError):
+    parse_json_changes(io.BytesIO(b'{"other": []}'))
+  with pytest.raises(BulkInputError):
+    parse_json_changes(io.BytesIO(b'['))
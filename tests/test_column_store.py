@@ -0,0 +1,74 @@
+#
+# Tests of the columnar store of the datatables (column_store.py).
+#
+
+from egcwebapp.column_store import KindTable, COMPACT_FRACTION
+from egcwebapp.datatables import server_side_page
+
+COLUMNS = [None, "id", "kind", "tags", None]
+
+def params(search="", order=None, start=0, length=10):
+  return {"draw": 1, "start": start, "length": length, "search": search,
+          "search_regex": False, "order": order or [], "column_search": {}}
+
+def build_table(n):
+  table = KindTable(COLUMNS)
+  for i in range(n):
+    table.append(f"r{i}", [f"r{i}", "even" if i % 2 == 0 else "odd", ""])
+  return table
+
+def test_live_rows():
+  table = build_table(6)
+  table.remove(table.find_row("r1"))
+  table.remove(table.find_row("r4"))
+  assert list(table.live_rows()) == [0, 2, 3, 5]
+  assert len(table) == 4
+  assert table.find_row("r1") is None
+
+def test_live_rows_copy():
+  table = build_table(3)
+  rows = table.live_rows()
+  table.remove(0)
+  table.append("r3", ["r3", "odd", ""])
+  assert list(rows) == [0, 1, 2]
+
+def test_set():
+  table = build_table(3)
+  table.set(1, "x1", ["x1", "odd", "tag"])
+  assert table.find_row("r1") is None
+  assert table.find_row("x1") == 1
+  assert table.row_text(1) == "x1 odd tag"
+  assert list(table.live_rows()) == [0, 1, 2]
+
+def test_duplicated_ids():
+  table = KindTable(COLUMNS)
+  for kind in ["first", "second", "third"]:
+    table.append("r", ["r", kind, ""])
+  assert table.find_row("r") == 0
+  table.remove(0)
+  assert table.find_row("r") == 1
+  table.remove(2)
+  assert table.find_row("r") == 1
+  table.remove(1)
+  assert table.find_row("r") is None
+  assert len(table) == 0
+
+def test_needs_compaction():
+  n = 10
+  table = build_table(n)
+  for i in range(int(n * COMPACT_FRACTION)):
+    table.remove(table.find_row(f"r{i}"))
+    assert not table.needs_compaction()
+  table.remove(table.find_row(f"r{n - 1}"))
+  assert table.needs_compaction()
+
+def test_server_side_page():
+  table = build_table(10)
+  table.remove(table.find_row("r0"))
+  page_ids, n_filtered = server_side_page(table,
+      params(search="even", order=[(1, True)], length=2))
+  assert page_ids == ["r8", "r6"]
+  assert n_filtered == 4
+  page_ids, n_filtered = server_side_page(table, params(start=7))
+  assert page_ids == ["r8", "r9"]
+  assert n_filtered == 9
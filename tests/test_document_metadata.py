@@ -0,0 +1,165 @@
+#
+# Tests of the fetching and caching of the document metadata
+# (document_metadata.py), with a stub fetcher and a local HTTP server.
+#
+
+import json
+import time
+import threading
+import http.server
+import pytest
+from egcwebapp import document_metadata
+from egcwebapp.document_metadata import DocumentMetadata, MetadataCache, \
+                                        HttpFetcher, MetadataFetchError
+
+CSL = {"DOI": "10.1000/xyz", "title": "A title", "author": [],
+       "container-title": "A journal", "publisher": "not stored"}
+
+class StubFetcher:
+  """
+  Fetcher returning CSL, or failing if fail is set; if gate is set,
+  each fetch waits for it.
+  """
+
+  def __init__(self):
+    self.n_fetches = 0
+    self.fail = False
+    self.gate = None
+    self.started = threading.Event()
+    self.lock = threading.Lock()
+
+  def fetch(self, pmid, url):
+    with self.lock:
+      self.n_fetches += 1
+    self.started.set()
+    if self.gate is not None:
+      self.gate.wait(10)
+    if self.fail:
+      raise MetadataFetchError("unavailable")
+    return CSL
+
+class Clock:
+  def __init__(self):
+    self.now = 1000000.0
+
+  def time(self):
+    return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(document_metadata.time, "time", clock.time)
+  return clock
+
+@pytest.fixture
+def db_path(tmp_path):
+  return str(tmp_path / "metadata.sqlite")
+
+def test_fields_and_cache(db_path, clock):
+  fetcher = StubFetcher()
+  metadata = DocumentMetadata(MetadataCache(db_path), fetcher)
+  data, error = metadata.get("123", None)
+  assert error is None
+  assert data == {field: CSL[field] \
+                    for field in ["DOI", "title", "author", "container-title"]}
+  assert metadata.get("123", None) == (data, None)
+  assert fetcher.n_fetches == 1
+
+def test_ttl_expiry(db_path, clock):
+  fetcher = StubFetcher()
+  metadata = DocumentMetadata(MetadataCache(db_path), fetcher, ttl=100)
+  metadata.get("123", None)
+  clock.now += 100
+  metadata.get("123", None)
+  assert fetcher.n_fetches == 1
+  clock.now += 1
+  metadata.get("123", None)
+  assert fetcher.n_fetches == 2
+
+def test_error_ttl(db_path, clock):
+  fetcher = StubFetcher()
+  fetcher.fail = True
+  metadata = DocumentMetadata(MetadataCache(db_path), fetcher,
+                              ttl=1000, error_ttl=10)
+  data, error = metadata.get("123", None)
+  assert data is None and error == "unavailable"
+  assert metadata.get("123", None) == (None, "unavailable")
+  assert fetcher.n_fetches == 1
+  fetcher.fail = False
+  clock.now += 11
+  data, error = metadata.get("123", None)
+  assert error is None and data["title"] == CSL["title"]
+  assert fetcher.n_fetches == 2
+
+def test_concurrent_lookups_are_coalesced(db_path):
+  fetcher = StubFetcher()
+  fetcher.gate = threading.Event()
+  metadata = DocumentMetadata(MetadataCache(db_path), fetcher)
+  n_waiters = 8
+  results = []
+  threads = [threading.Thread(
+                 target=lambda: results.append(metadata.get("123", None))) \
+               for i in range(n_waiters)]
+  for thread in threads:
+    thread.start()
+  # the other lookups wait for the fetch started by the first one
+  assert fetcher.started.wait(10)
+  time.sleep(0.2)
+  fetcher.gate.set()
+  for thread in threads:
+    thread.join(10)
+  assert fetcher.n_fetches == 1
+  assert len(results) == n_waiters
+  assert all(result == results[0] for result in results)
+  assert not metadata.in_flight
+
+def test_persistence_across_instances(db_path, clock):
+  fetcher = StubFetcher()
+  DocumentMetadata(MetadataCache(db_path), fetcher).get("123", "u")
+  other_fetcher = StubFetcher()
+  other = DocumentMetadata(MetadataCache(db_path), other_fetcher)
+  data, error = other.get("123", "u")
+  assert data["DOI"] == CSL["DOI"]
+  assert other_fetcher.n_fetches == 0
+  # the key includes the link
+  other.get("123", None)
+  assert other_fetcher.n_fetches == 1
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+  def do_GET(self):
+    if self.path.startswith("/idconv/"):
+      body = {"records": [{"pmid": "123", "doi": "10.1000/xyz"}]}
+    elif self.path == "/doi/10.1000/xyz":
+      body = CSL
+    else:
+      self.send_error(404)
+      return
+    data = json.dumps(body).encode()
+    self.send_response(200)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def log_message(self, *args):
+    pass
+
+@pytest.fixture
+def server_url():
+  server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  yield f"http://127.0.0.1:{server.server_address[1]}"
+  server.shutdown()
+  server.server_close()
+
+def test_http_fetcher(server_url, db_path):
+  fetcher = HttpFetcher(f"{server_url}/idconv/", f"{server_url}/doi/")
+  assert fetcher.fetch("123", None)["title"] == CSL["title"]
+  assert fetcher.fetch("999", "https://doi.org/10.1000/xyz")["DOI"] == \
+      CSL["DOI"]
+  metadata = DocumentMetadata(MetadataCache(db_path), fetcher)
+  assert metadata.prefetch([("123", None), ("456", "https://x/doi/10.9/no")]) \
+      == 1
+  data, error = metadata.get("456", "https://x/doi/10.9/no")
+  assert data is None and "Failed fetching" in error
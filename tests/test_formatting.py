@@ -0,0 +1,91 @@
+#
+# Tests of the breaking of long definitions into lines (formatting.py),
+# comparing the results with those of the previous, recursive,
+# implementation of break_string.
+#
+
+import random
+import pytest
+from egcwebapp.formatting import break_string, iter_break_string
+
+def legacy_break_string(string, goal_length, min_length=None,
+                        breaking_chars=" ,"):
+  """
+  The previous, recursive, implementation of break_string, as reference.
+  """
+  if len(string) <= goal_length:
+    return [string]
+  if min_length is None:
+    min_length = int(goal_length * 0.9)
+  if string[goal_length] in breaking_chars:
+    return [string[:goal_length+1]] + legacy_break_string(
+        string[goal_length+1:], goal_length, min_length, breaking_chars)
+  last_break = -1
+  for i in range(min_length, goal_length):
+    if i >= 0 and string[i] in breaking_chars:
+      last_break = i
+  first_break = -1
+  for i in range(goal_length+1, len(string)):
+    if string[i] in breaking_chars:
+      first_break = i
+      break
+  if last_break >= 0:
+    return [string[:last_break+1]] + legacy_break_string(
+        string[last_break+1:], goal_length, min_length, breaking_chars)
+  elif first_break > 0:
+    return [string[:first_break+1]] + legacy_break_string(
+        string[first_break+1:], goal_length, min_length, breaking_chars)
+  else:
+    return [string]
+
+def random_case(rng):
+  alphabet = rng.choice(["ab ,", "abcdefgh ,", "abcdefghijklmnop_0123 ",
+                         "a,", "ab-"])
+  string = "".join(rng.choice(alphabet) \
+                     for i in range(rng.randint(0, 300)))
+  goal_length = rng.randint(0, 40)
+  min_length = rng.choice([None, rng.randint(-5, 45)])
+  breaking_chars = rng.choice([" ,", ",", " ", "-", "", ", -"])
+  return string, goal_length, min_length, breaking_chars
+
+def check_case(args):
+  result = break_string(*args)
+  assert result == legacy_break_string(*args)
+  assert list(iter_break_string(*args)) == result
+  assert "".join(result) == args[0]
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_cases(seed):
+  rng = random.Random(seed)
+  for i in range(500):
+    check_case(random_case(rng))
+
+@pytest.mark.parametrize("args", [
+  ("", 10, None, " ,"),
+  ("", 0, None, " ,"),
+  ("abcdefghij", 10, None, " ,"),
+  ("abcde fghi", 10, None, " ,"),
+  ("abcdefghij ", 10, None, " ,"),
+  ("abcdefghijk", 10, None, " ,"),
+  ("abcdefghijklmnopqrstuvwxyz", 5, None, " ,"),
+  ("abcdefghijklmnopqrstuvwxyz", 5, None, ""),
+  ("a b c d e f g h i j k l", 5, None, "-"),
+  ("abc,def,ghi,jkl,mno", 4, 2, ","),
+  (",,,,,,,,,,", 3, None, ","),
+  ("          ", 0, None, " "),
+])
+def test_edge_cases(args):
+  check_case(args)
+
+def test_exactly_goal_length_is_not_broken():
+  assert break_string("abcdefghij", 10) == ["abcdefghij"]
+
+def test_no_breaking_characters():
+  assert break_string("abcdefghijklmnopqrstuvwxyz", 10) == \
+      ["abcdefghijklmnopqrstuvwxyz"]
+
+def test_long_definition_does_not_recurse():
+  definition = ",".join(f"U{i}" for i in range(50000))
+  pieces = break_string(definition, 15)
+  assert "".join(pieces) == definition
+  assert len(pieces) > 10000
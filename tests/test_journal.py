@@ -0,0 +1,211 @@
+#
+# Tests of the write-behind journal (journal.py): replay after a crash,
+# compaction, synchronization of multiple processes serving the same file
+# (simulated by multiple journals in the same process), pointer file
+# and read-only mode.
+#
+
+import os
+import json
+import time
+import pytest
+from egcwebapp.journal import Journal
+
+class FakeEGCData:
+  """
+  Records of a JSON file (list of records with an id), with the
+  methods of EGCData used by the journal.
+  """
+
+  def __init__(self, file_path):
+    self.file_path = file_path
+    with open(file_path) as f:
+      self.records = {record["id"]: record for record in json.load(f)}
+
+  def create(self, record):
+    self.records[record["id"]] = record
+
+  def update(self, record_id, record):
+    del self.records[record_id]
+    self.records[record["id"]] = record
+
+  def delete(self, record_id):
+    del self.records[record_id]
+
+  def save(self):
+    with open(self.file_path, "w") as f:
+      json.dump(list(self.records.values()), f)
+
+class Process:
+  """
+  The parts of the application using the journal, for one process.
+  """
+
+  def __init__(self, file_path, pointer_path=None, read_only=False,
+               compact_delay=3600):
+    self.journal = Journal(compact_delay, apply_change=self.apply_change,
+                           reload=self.reload, load=self.load,
+                           pointer_path=pointer_path, read_only=read_only)
+    self.load(file_path, compact=not read_only, publish=True)
+
+  def load(self, file_path, compact=False, publish=False):
+    self.egc_data = FakeEGCData(file_path)
+    self.journal.open(self.egc_data, replay=True, compact=compact,
+                      publish=publish)
+
+  def reload(self):
+    self.load(self.egc_data.file_path)
+
+  def apply_change(self, change):
+    if change["op"] == "create":
+      self.egc_data.create(change["record"])
+    elif change["op"] == "update":
+      self.egc_data.update(change["id"], change["record"])
+    elif change["op"] == "delete":
+      self.egc_data.delete(change["id"])
+
+  def change(self, change):
+    with self.journal.changing():
+      self.apply_change(change)
+      self.journal.log_changes([change])
+
+  def ids(self):
+    self.journal.sync()
+    return sorted(self.egc_data.records)
+
+  def stop(self):
+    # stop without compacting, as after a crash
+    self.journal._cancel_compaction()
+
+def create(record_id, value=0):
+  return {"op": "create", "record": {"id": record_id, "value": value}}
+
+def file_ids(file_path):
+  with open(file_path) as f:
+    return sorted(record["id"] for record in json.load(f))
+
+@pytest.fixture
+def egc_file(tmp_path):
+  path = tmp_path / "records.json"
+  path.write_text(json.dumps([{"id": "a", "value": 0},
+                              {"id": "b", "value": 0}]))
+  return str(path)
+
+def test_changes_are_journaled(egc_file):
+  process = Process(egc_file)
+  process.change(create("c"))
+  process.change({"op": "update", "id": "a",
+                  "record": {"id": "a2", "value": 1}})
+  process.change({"op": "delete", "id": "b"})
+  assert process.ids() == ["a2", "c"]
+  assert file_ids(egc_file) == ["a", "b"]
+  with open(egc_file + ".journal") as f:
+    assert [json.loads(line)["op"] for line in f] == \
+        ["create", "update", "delete"]
+  process.stop()
+
+def test_replay_after_crash(egc_file):
+  process = Process(egc_file)
+  process.change(create("c"))
+  process.change({"op": "delete", "id": "a"})
+  process.stop()
+  restarted = Process(egc_file)
+  assert restarted.ids() == ["b", "c"]
+  # the replayed changes are compacted at startup
+  assert file_ids(egc_file) == ["b", "c"]
+  assert not os.path.exists(egc_file + ".journal")
+
+def test_incomplete_last_line_is_skipped(egc_file):
+  process = Process(egc_file)
+  process.change(create("c"))
+  process.stop()
+  with open(egc_file + ".journal", "a") as f:
+    f.write('{"op": "create", "rec')
+  restarted = Process(egc_file)
+  assert restarted.ids() == ["a", "b", "c"]
+
+def test_compaction(egc_file):
+  process = Process(egc_file)
+  version = process.journal.version()
+  process.change(create("c"))
+  assert process.journal.version() != version
+  process.journal.compact()
+  assert file_ids(egc_file) == ["a", "b", "c"]
+  assert not os.path.exists(egc_file + ".journal")
+  process.change(create("d"))
+  process.journal.compact()
+  assert file_ids(egc_file) == ["a", "b", "c", "d"]
+
+def test_compaction_in_background(egc_file):
+  process = Process(egc_file, compact_delay=0.05)
+  process.change(create("c"))
+  deadline = time.time() + 10
+  while os.path.exists(egc_file + ".journal") and time.time() < deadline:
+    time.sleep(0.01)
+  assert file_ids(egc_file) == ["a", "b", "c"]
+
+def test_processes_share_the_journal(egc_file):
+  first = Process(egc_file)
+  second = Process(egc_file)
+  first.change(create("c"))
+  assert second.ids() == ["a", "b", "c"]
+  second.change({"op": "delete", "id": "a"})
+  assert first.ids() == ["b", "c"]
+  # compacted by one process, then changed again: the other reloads
+  first.journal.compact()
+  first.change(create("d"))
+  assert second.ids() == ["b", "c", "d"]
+  # a change is applied after those written by the other process
+  second.change({"op": "delete", "id": "d"})
+  first.journal.compact()
+  assert file_ids(egc_file) == ["b", "c"]
+  second.stop()
+
+def test_pointer_file(egc_file, tmp_path):
+  pointer_path = str(tmp_path / "current")
+  other_file = tmp_path / "other.json"
+  other_file.write_text(json.dumps([{"id": "x", "value": 0}]))
+  first = Process(egc_file, pointer_path)
+  second = Process(egc_file, pointer_path)
+  first.load(str(other_file), publish=True)
+  assert second.ids() == ["x"]
+  assert second.egc_data.file_path == str(other_file)
+  # the changes are then shared through the journal of the new file
+  second.change(create("y"))
+  assert first.ids() == ["x", "y"]
+  with open(pointer_path) as f:
+    assert json.load(f)["path"] == os.path.abspath(other_file)
+  first.stop()
+  second.stop()
+
+def test_pointer_change_inside_changing(egc_file, tmp_path):
+  pointer_path = str(tmp_path / "current")
+  other_file = tmp_path / "other.json"
+  other_file.write_text(json.dumps([{"id": "x", "value": 0}]))
+  first = Process(egc_file, pointer_path)
+  second = Process(egc_file, pointer_path)
+  first.load(str(other_file), publish=True)
+  # the change is applied to the file loaded by the other process
+  second.change(create("y"))
+  assert second.egc_data.file_path == str(other_file)
+  assert first.ids() == ["x", "y"]
+  first.stop()
+  second.stop()
+
+def test_read_only(egc_file):
+  writer = Process(egc_file)
+  writer.change(create("c"))
+  writer.stop()
+  reader = Process(egc_file, read_only=True)
+  # the journal is replayed, but neither compacted nor removed
+  assert reader.ids() == ["a", "b", "c"]
+  assert file_ids(egc_file) == ["a", "b"]
+  assert os.path.exists(egc_file + ".journal")
+  reader.journal.compact()
+  assert file_ids(egc_file) == ["a", "b"]
+  reader.journal.open(reader.egc_data, replay=False)
+  assert os.path.exists(egc_file + ".journal")
+  # the changes written by a writer are followed
+  writer.change(create("d"))
+  assert reader.ids() == ["a", "b", "c", "d"]
+  writer.stop()
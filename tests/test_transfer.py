@@ -0,0 +1,39 @@
+#
+# Tests of the streaming transfer of files (transfer.py).
+#
+
+import io
+import gzip
+import pytest
+from egcwebapp.transfer import receive_file, file_chunks, FileTooLargeError
+
+DATA = b"".join(f"line {i}\n".encode() for i in range(100000))
+
+@pytest.mark.parametrize("gzipped", [False, True])
+def test_round_trip(tmp_path, gzipped):
+  source = tmp_path / "source.egc"
+  source.write_bytes(DATA)
+  body = b"".join(file_chunks(source, gzipped=gzipped))
+  target = tmp_path / "target.egc"
+  assert receive_file(io.BytesIO(body), target, gzipped=gzipped) == len(DATA)
+  assert target.read_bytes() == DATA
+
+@pytest.mark.parametrize("gzipped", [False, True])
+def test_max_size(tmp_path, gzipped):
+  body = gzip.compress(DATA) if gzipped else DATA
+  target = tmp_path / "target.egc"
+  target.write_bytes(b"previous")
+  with pytest.raises(FileTooLargeError):
+    receive_file(io.BytesIO(body), target, gzipped=gzipped,
+                 max_size=len(DATA) - 1)
+  # the existing file is kept and the partial file removed
+  assert target.read_bytes() == b"previous"
+  assert [path.name for path in tmp_path.iterdir()] == ["target.egc"]
+  assert receive_file(io.BytesIO(body), target, gzipped=gzipped,
+                      max_size=len(DATA)) == len(DATA)
+
+def test_incomplete_gzip(tmp_path):
+  with pytest.raises(ValueError):
+    receive_file(io.BytesIO(gzip.compress(DATA)[:1000]),
+                 tmp_path / "target.egc", gzipped=True)
+  assert list(tmp_path.iterdir()) == []